@@ -0,0 +1,44 @@
+"""
+Series agregadas de las gráficas del chat.
+
+Las gráficas de actividad son agregados pequeños (mensajes por persona, por
+día, por tipo, por hora y por día de la semana). Se calculan con
+``rollup.Rollup.series`` y se envían al navegador como JSON compacto para que
+las dibuje él; dibujarlas con matplotlib en el servidor queda solo como
+alternativa. Aquí quedan las partes comunes: los nombres de las series, el
+top de miembros y la conversión a JSON.
+"""
+
+# Gráficas que se pueden dibujar a partir de las series agregadas
+SERIES_NAMES = ['messages_per_person', 'daily_activity', 'message_types', 'hourly_activity', 'weekly_activity']
+
+
+def top_senders(sender_counts, n=20):
+    """Miembros con más mensajes; los empates conservan el orden de ``sender_counts``"""
+    return sender_counts.sort_values(ascending=False, kind='stable').head(n)
+
+
+def series_to_json(series):
+    """
+    Convierte las series a un diccionario serializable en JSON.
+
+    Las series por categoría se envían como dos arrays (``labels`` y
+    ``values``). La serie diaria, que puede tener miles de puntos, se envía
+    en forma columnar sin fechas: el primer día (``start``) y un array de
+    valores, uno por día consecutivo.
+    """
+    result = {}
+    for name, values in series.items():
+        if name == 'daily_activity':
+            result[name] = {
+                'start': values.index[0].strftime('%Y-%m-%d') if len(values) else None,
+                'freq': 'D',
+                'values': values.tolist()
+            }
+        else:
+            result[name] = {
+                'labels': [str(label) for label in values.index],
+                'values': values.tolist()
+            }
+    return result
+
@@ -0,0 +1,158 @@
+"""
+Análisis de un chat: parseo, clasificación de mensajes y estadísticas por miembro.
+
+Es la parte del análisis que no depende del servidor web; la usan la
+aplicación Flask y el análisis por lotes de ``batch_analyze.py``.
+"""
+from chat_model import compact_chat, memory_report
+from chat_parser import DEVICE_TYPES, StreamingChatParser
+from chat_storage import is_binary_chat, load_chat
+from instrumentation import StageRecorder, debug
+from message_classifier import classify_messages
+from token_index import TokenIndex
+
+def compute_members_info(df, token_index, top_n=3):
+    """
+    Calcula las estadísticas de todos los miembros en una sola pasada agrupada.
+    
+    Args:
+        df: DataFrame del chat con la columna sender
+        token_index: TokenIndex del chat, usado para las palabras más frecuentes
+        top_n: Número de palabras más frecuentes por miembro
+        
+    Returns:
+        Lista de diccionarios con name, messages, percentage y top_words,
+        en el orden de aparición de los miembros
+    """
+    message_counts = df['sender'].value_counts()
+    counts = {member: int(message_counts[member]) for member in df['sender'].unique().tolist()}
+    return members_from_counts(counts, token_index, top_n)
+
+def merge_members_info(members_info, new_df, token_index, top_n=3):
+    """
+    Suma a las estadísticas de los miembros las de los mensajes nuevos.
+    
+    Solo se recorren los mensajes nuevos; los miembros que no aparecían
+    antes se añaden al final, en orden de aparición.
+    """
+    counts = {member['name']: member['messages'] for member in members_info}
+    new_counts = new_df['sender'].value_counts()
+    for member in new_df['sender'].unique().tolist():
+        counts[member] = counts.get(member, 0) + int(new_counts[member])
+    return members_from_counts(counts, token_index, top_n)
+
+def members_from_counts(counts, token_index, top_n=3):
+    """Lista de estadísticas de los miembros a partir de sus mensajes totales"""
+    total_messages = sum(counts.values())
+    
+    members_info = []
+    for member, member_count in counts.items():
+        members_info.append({
+            'name': member,
+            'messages': member_count,
+            'percentage': round(member_count / total_messages * 100, 1),
+            'top_words': token_index.top_words(member, top_n)
+        })
+    return members_info
+
+def process_chat_file(file_content, device_type='auto', on_stage=None, recorder=None):
+    """
+    Procesa el contenido del archivo de chat.
+
+    Args:
+        file_content: Texto del chat o un objeto tipo archivo (se lee por bloques).
+            Si el archivo es un chat exportado en formato binario (Arrow) se carga
+            directamente sin parsear
+        device_type: 'auto' para detectar el formato, o 'android'/'iphone'
+            para restringir la detección a ese dispositivo
+        on_stage: Función opcional llamada con el nombre de cada etapa al empezarla
+        recorder: StageRecorder opcional en el que se miden las etapas
+    
+    Returns:
+        Tupla (df, members_info, token_index, error)
+    """
+    debug(f"Procesando archivo con tipo de dispositivo: {device_type}")
+    recorder = recorder or StageRecorder()
+    
+    if device_type != 'auto' and device_type not in DEVICE_TYPES:
+        debug(f"Error: Tipo de dispositivo no válido - {device_type}")
+        return None, None, None, "Tipo de dispositivo no válido"
+    
+    try:
+        if is_binary_chat(file_content):
+            # Chat ya parseado en formato binario: se carga sin volver a parsear
+            with recorder.stage('load_binary') as record:
+                df = load_chat(file_content)
+                record['messages'] = len(df)
+            stats = df.attrs.setdefault('parse_stats', {})
+            debug(f"✅ Chat binario cargado: {len(df)} mensajes")
+        else:
+            parser = StreamingChatParser(device_type)
+            
+            # Detectar el formato con una muestra y parsear el archivo en una sola pasada
+            with recorder.stage('parse') as record:
+                df = parser.parse(file_content)
+                record['messages'] = parser.messages_parsed
+            
+            # Imprimir las primeras líneas del archivo para depuración
+            debug("Primeras 3 líneas del archivo:")
+            for line in parser.head_lines:
+                debug(f"LÍNEA: {line}")
+            
+            if df is None:
+                debug(f"No se encontraron coincidencias para ningún patrón de {device_type}")
+                if device_type == 'auto':
+                    return None, None, None, "No se reconoció el formato del chat"
+                return None, None, None, f"No se encontró un patrón válido para el formato de {device_type}"
+            
+            stats = parser.stats()
+            record_parse_stages(recorder, stats)
+            debug(f"✅ Formato detectado: {stats['format']} ({stats['date_format']})")
+            debug(f"Mensajes encontrados: {stats['messages']} - {stats['mb_per_s']} MB/s")
+            if stats['unparsed_rows']:
+                debug(f"⚠️ Mensajes con fecha no válida descartados: {stats['unparsed_rows']} "
+                      f"(p. ej. {stats['unparsed_samples']})")
+        
+        # Los chats binarios guardados antes de existir la columna kind se vuelven a clasificar
+        if 'kind' not in df.columns:
+            with recorder.stage('message_types', messages=len(df)):
+                add_message_types(df)
+        
+        # Representación compacta: sender/type categóricas, hora y día de la semana bajo demanda
+        with recorder.stage('compact', messages=len(df)):
+            df = compact_chat(df)
+        df.attrs['parse_stats']['memory'] = memory_report(df)
+        debug(f"Memoria por mensaje: {df.attrs['parse_stats']['memory']}")
+        
+        if on_stage:
+            on_stage('stats')
+        
+        # Tokenizar una sola vez: el índice sirve palabras frecuentes y nubes de palabras
+        with recorder.stage('token_index', messages=len(df)):
+            token_index = TokenIndex.from_dataframe(df)
+        
+        # Estadísticas de todos los miembros en una pasada agrupada
+        with recorder.stage('member_stats', messages=len(df)):
+            members_info = compute_members_info(df, token_index)
+        
+        return df, members_info, token_index, None
+        
+    except Exception as e:
+        debug(f"Error procesando fechas: {str(e)}")
+        return None, None, None, f"Error procesando el archivo: {str(e)}"
+
+def record_parse_stages(recorder, stats):
+    """Registra las partes del parseo que mide el propio parser"""
+    recorder.add('parse.detect_format', stats['detect_seconds'])
+    recorder.add('parse.timestamps', stats['timestamp_seconds'], stats['messages'] + stats['unparsed_rows'])
+
+def add_message_types(df):
+    """
+    Clasifica los mensajes en una pasada vectorizada (ver ``message_classifier``).
+
+    Añade las columnas kind (texto, tipo de multimedia, eliminado, sistema...),
+    type ('media' o 'text'), links y emojis.
+    """
+    classified = classify_messages(df['message'])
+    for column in classified.columns:
+        df[column] = classified[column]
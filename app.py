@@ -1,384 +1,699 @@
-from flask import Flask, render_template, request, jsonify
+import time
+_started = time.perf_counter()  # Para medir el tiempo de arranque, importaciones incluidas
+
+from flask import Flask, render_template, request, jsonify, session, send_file, redirect, Response
+from werkzeug.exceptions import RequestEntityTooLarge
+import hashlib
+import json
 import os
-import re
-import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # Configurar backend no interactivo antes de importar pyplot
-import matplotlib.pyplot as plt
-import seaborn as sns
-from wordcloud import WordCloud
-from collections import Counter
-import base64
+import shutil
+import tempfile
+import threading
+from datetime import date
+from concurrent.futures import Future, ThreadPoolExecutor
 from io import BytesIO
-from datetime import datetime
-import nltk
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
-from nltk.corpus import stopwords
-
-# Configuración adicional de matplotlib
-plt.ioff()  # Desactivar modo interactivo
-
-# Definir conjunto global de palabras a excluir
-EXCLUDED_WORDS = {
-    'todo', 'porque', 'tiene', 'multimedia', 'omitido', 
-    '<multimedia', 'omitido>', 'imagen', 'video', 'audio', 
-    'sticker', 'gif', 'documento', 'eliminado', 'omitted',
-    'image', 'para', 'pero', 'este', 'esta', 'esto', 'como',
-    'cuando', 'donde', 'media', '<image', 'media', 'omitted',
-    'ahora', 'algo', 'aquí', 'así', 'aunque', 'bien', 'cada',
-    'casi', 'como', 'cual', 'debe', 'desde', 'después',
-    'dice', 'dijo', 'donde', 'entonces', 'entre', 'está',
-    'están', 'había', 'hace', 'hasta', 'hola', 'luego',
-    'mejor', 'menos', 'mismo', 'mucho', 'nada', 'otro',
-    'pues', 'quién', 'sabe', 'sido', 'sine', 'sino',
-    'sobre', 'solo', 'también', 'tanto', 'tengo', 'todas',
-    'todos', 'vamos', 'vaya', 'verdad', 'puede', 'pudo',
-    'quiere', 'sería', 'hacer', 'hecho', 'siendo', 'tenía',
-    'través', 'primera', 'según', 'ningún', 'manera', 'misma',
-    'image>', 'omitted>', 'attached:', 'image', 'attached','porq','bueno','gente','creo','cosa','siempre','claro','año','cierto','cómo','gran','toda','años','decir','dicho','tiempo','parece'
-}
-
-def filter_words(messages):
+# matplotlib y wordcloud se cargan al dibujar la primera gráfica; las stopwords, de un archivo local
+from aggregates import SERIES_NAMES, series_to_json
+from analysis import add_message_types, merge_members_info, process_chat_file, record_parse_stages
+from charts import IMAGE_FORMATS, RENDERERS as CHART_NAMES, render_charts, render_image, wordcloud_params
+from chat_model import compact_chat
+from chat_parser import StreamingChatParser, get_format
+from chat_storage import BINARY_SUFFIX, chat_to_bytes
+from chat_store import ChatStore
+from image_store import ImageStore
+from incremental import PrefixIndex, merge_frames, scan_stream
+from instrumentation import STARTUP_SECONDS, StageRecorder, debug, render_metrics, stage
+from jobs import JobManager, ProgressReader
+from result_cache import ResultCache, make_key
+from rollup import Rollup
+from search_index import RowFilter, SearchIndex, rank
+from token_index import TokenIndex
+from uploads import ByteBudget, UploadTooLarge, extract_chat, is_zip
+
+app = Flask(__name__)
+app.secret_key = os.environ.get('SECRET_KEY') or os.urandom(24)
+
+# Tamaño máximo de una subida (y del chat dentro de un ZIP); Flask rechaza con 413 las mayores
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 512 * 1024 * 1024))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+# Bytes de todas las subidas que se están recibiendo o analizando a la vez
+UPLOAD_INFLIGHT_MAX_BYTES = int(os.environ.get('UPLOAD_INFLIGHT_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+upload_budget = ByteBudget(UPLOAD_INFLIGHT_MAX_BYTES)
+# Segundos que se indica al cliente que espere si no hay presupuesto
+UPLOAD_RETRY_AFTER = 10
+
+# Almacén de chats procesados por sesión, con expulsión LRU según el presupuesto de memoria
+CHAT_STORE_MAX_BYTES = int(os.environ.get('CHAT_STORE_MAX_BYTES', 512 * 1024 * 1024))
+chat_store = ChatStore(max_bytes=CHAT_STORE_MAX_BYTES)
+
+# Caché en disco de resultados (tabla parseada, miembros y gráficas) por contenido del archivo
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join('.cache', 'results'))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+result_cache = ResultCache(RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES)
+
+# Imágenes de las gráficas, servidas por URL según el hash de su contenido
+IMAGE_STORE_DIR = os.environ.get('IMAGE_STORE_DIR', os.path.join('.cache', 'images'))
+IMAGE_STORE_MAX_BYTES = int(os.environ.get('IMAGE_STORE_MAX_BYTES', 1024 * 1024 * 1024))
+image_store = ImageStore(IMAGE_STORE_DIR, max_bytes=IMAGE_STORE_MAX_BYTES)
+
+# Las imágenes nunca cambian para una misma URL: el navegador puede guardarlas un año
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+# Registro de archivos analizados para el análisis incremental de sus ampliaciones
+PREFIX_INDEX_DIR = os.environ.get('PREFIX_INDEX_DIR', os.path.join('.cache', 'prefixes'))
+prefix_index = PrefixIndex(PREFIX_INDEX_DIR)
+
+# Nubes de palabras por miembro ya dibujadas: (chat, miembro, parámetros) -> id de imagen
+WORDCLOUD_CACHE_DIR = os.environ.get('WORDCLOUD_CACHE_DIR', os.path.join('.cache', 'wordclouds'))
+WORDCLOUD_CACHE_MAX_BYTES = int(os.environ.get('WORDCLOUD_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+wordcloud_cache = ResultCache(WORDCLOUD_CACHE_DIR, max_bytes=WORDCLOUD_CACHE_MAX_BYTES)
+# Miembros más activos cuya nube se dibuja en segundo plano al terminar el análisis
+WORDCLOUD_PRECOMPUTE = int(os.environ.get('WORDCLOUD_PRECOMPUTE', 5))
+wordcloud_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='wordcloud')
+# Nubes que se están dibujando, para no dibujar dos veces la misma a la vez
+_wordclouds_pending = {}
+_wordclouds_lock = threading.Lock()
+
+# Resultados por página de /search (por defecto y máximo) y mensajes de contexto máximos a cada lado
+SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+SEARCH_MAX_PAGE_SIZE = int(os.environ.get('SEARCH_MAX_PAGE_SIZE', 100))
+SEARCH_MAX_CONTEXT = int(os.environ.get('SEARCH_MAX_CONTEXT', 10))
+
+# Trabajos de análisis en segundo plano
+jobs = JobManager()
+
+# Gráficas que se dibujan siempre en el servidor; las de series las dibuja el navegador
+SERVER_CHARTS = [name for name in CHART_NAMES if name not in SERIES_NAMES]
+
+# Versión del analizador: cambiarla invalida los resultados guardados en la caché
+ANALYZER_VERSION = '8'
+
+def merge_chat(base_chat, path, base_size, on_progress=None, recorder=None):
     """
-    Filtra las palabras de una lista de mensajes aplicando todos los criterios de exclusión.
+    Analiza solo el final nuevo de un archivo que empieza por un chat ya analizado.
+    
+    El final se parsea con el formato ya detectado en el chat guardado y se
+    suma a su tabla, sus miembros, su índice de palabras, su índice de
+    búsqueda y sus conteos por miembro, día y hora.
     
     Args:
-        messages: Lista de mensajes de texto
-        
+        base_chat: Chat guardado cuyo archivo es el principio de ``path``
+        path: Archivo completo subido
+        base_size: Bytes del archivo del chat guardado
+        on_progress: Función opcional llamada con la fracción del final leída
+        recorder: StageRecorder opcional en el que se miden las etapas
+    
     Returns:
-        Lista de palabras filtradas
+        Chat combinado (sin gráficas), o None si el final no se puede añadir
+        y hay que analizar el archivo completo
     """
-    # Obtener stopwords en español
-    stop_words = set(stopwords.words('spanish'))
-    stop_words.update(EXCLUDED_WORDS)
-    
-    # Procesar y filtrar palabras
-    words = []
-    for message in messages:
-        message_words = message.lower().split()
-        filtered_words = [word for word in message_words 
-                        if word not in stop_words
-                        and len(word) > 3 
-                        and not word.startswith('http')
-                        and not word.startswith('<')
-                        and not word.endswith('>')
-                        and not any(char.isdigit() for char in word)]
-        words.extend(filtered_words)
-    
-    return words
-
-app = Flask(__name__)
-
-# Variable global para almacenar los datos del chat
-chat_data = {
-    'df': None,
-    'members': None
-}
-
-def process_chat_file(file_content, device_type):
-    """Procesa el contenido del archivo de chat"""
-    print(f"Procesando archivo con tipo de dispositivo: {device_type}")
-    
-    # Patrones específicos para cada dispositivo
-    patterns = {
-        'android': [
-            # Formato Android: "dd/mm/yy, HH:MM - Nombre: Mensaje"
-            r'(\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2})\s-\s([^:]+):\s(.+)',
-            # Formato Android AM/PM: "dd/mm/yy, HH:MM AM/PM - Nombre: Mensaje"
-            r'(\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}\s[APMapm]{2})\s-\s([^:]+):\s(.+)'
-        ],
-        'iphone': [
-            # Formato iPhone con segundos: "[dd/m/yy, HH:MM:SS] Nombre: Mensaje"
-            r'\[(\d{1,2}/\d{1,2}/\d{2},\s\d{1,2}:\d{2}:\d{2})\]\s([^:]+):\s(.+)',
-            # Formato iPhone sin segundos: "[dd/m/yy, HH:MM] Nombre: Mensaje"
-            r'\[(\d{1,2}/\d{1,2}/\d{2},\s\d{1,2}:\d{2})\]\s([^:]+):\s(.+)'
-        ]
+    base_df = base_chat['df']
+    base_stats = base_df.attrs.get('parse_stats', {})
+    chat_format = get_format(base_stats.get('format'))
+    # El final de un archivo UTF-16 no se puede decodificar sin el BOM del principio
+    if chat_format is None or base_stats.get('encoding', 'utf-8') != 'utf-8':
+        return None
+    
+    recorder = recorder or StageRecorder()
+    parser = StreamingChatParser(chat_format.device_type, chat_format=chat_format,
+                                 date_format=base_stats['date_format'])
+    with open(path, 'rb') as f, recorder.stage('parse') as record:
+        f.seek(base_size)
+        reader = ProgressReader(f, os.path.getsize(path) - base_size, on_progress or (lambda fraction: None))
+        new_df = parser.parse(reader)
+        record['messages'] = parser.messages_parsed
+    
+    # El final debe empezar en un mensaje nuevo y no ser anterior a la marca de tiempo guardada
+    if new_df is None or parser.orphan_lines or new_df['datetime'].iloc[0] < base_df['datetime'].iloc[-1]:
+        return None
+    
+    new_stats = parser.stats()
+    record_parse_stages(recorder, new_stats)
+    with recorder.stage('message_types', messages=len(new_df)):
+        add_message_types(new_df)
+    with recorder.stage('compact', messages=len(new_df)):
+        new_df = compact_chat(new_df)
+    with recorder.stage('token_index', messages=len(new_df)):
+        token_index = base_chat['token_index'].merged(TokenIndex.from_dataframe(new_df))
+    df = merge_frames(base_df, new_df)
+    with recorder.stage('member_stats', messages=len(new_df)):
+        members_info = merge_members_info(base_chat['members'], new_df, token_index)
+    
+    df.attrs['parse_stats'] = {
+        **{key: value for key, value in base_stats.items() if key != 'memory'},
+        'messages': len(df),
+        'bytes': base_size + new_stats['bytes'],
+        'seconds': new_stats['seconds'],
+        'mb_per_s': new_stats['mb_per_s'],
+        'incremental': {
+            'base_messages': len(base_df),
+            'new_messages': len(new_df),
+            'new_bytes': new_stats['bytes']
+        }
     }
+    debug(f"✅ Análisis incremental: {len(new_df)} mensajes nuevos sobre {len(base_df)}")
     
-    matches = []
-    used_pattern = None
-    date_format = None
-    
-    # Seleccionar patrones según el dispositivo
-    device_patterns = patterns.get(device_type, [])
-    if not device_patterns:
-        print(f"Error: Tipo de dispositivo no válido - {device_type}")
-        return None, None, "Tipo de dispositivo no válido"
-    
-    # Imprimir las primeras líneas del archivo para depuración
-    print("Primeras 3 líneas del archivo:")
-    for line in file_content.split('\n')[:3]:
-        print(f"LÍNEA: {line}")
-    
-    for pattern in device_patterns:
-        print(f"Probando patrón: {pattern}")
-        matches = re.findall(pattern, file_content, re.MULTILINE)
-        if matches:
-            used_pattern = pattern
-            print(f"✅ Patrón encontrado: {pattern}")
-            print(f"Mensajes encontrados: {len(matches)}")
-            print(f"Ejemplo de coincidencia: {matches[0]}")
-            
-            # Determinar el formato de fecha basado en el patrón encontrado
-            sample_date = matches[0][0]
-            print(f"Fecha de ejemplo: {sample_date}")
-            
-            if device_type == 'iphone':
-                if ':' in sample_date.split()[1] and len(sample_date.split()[1].split(':')) == 3:  # Si tiene segundos
-                    date_format = '%d/%m/%y, %H:%M:%S'
-                else:
-                    date_format = '%d/%m/%y, %H:%M'
-            else:  # Android
-                if 'AM' in sample_date or 'PM' in sample_date:
-                    date_format = '%d/%m/%y, %I:%M %p'
-                else:
-                    date_format = '%d/%m/%y, %H:%M'
-            print(f"Formato de fecha detectado: {date_format}")
-            break
-    
-    if not matches:
-        print(f"No se encontraron coincidencias para ningún patrón de {device_type}")
-        return None, None, f"No se encontró un patrón válido para el formato de {device_type}"
-    
-    # Crear DataFrame
-    df = pd.DataFrame(matches, columns=['datetime', 'sender', 'message'])
+    with recorder.stage('rollup', messages=len(new_df)):
+        rollup = base_chat['rollup'].merged(Rollup.from_dataframe(new_df))
+    with recorder.stage('series'):
+        series = rollup.series()
+    with recorder.stage('search_index', messages=len(new_df)):
+        search_index = base_chat['search_index'].merged(SearchIndex.from_dataframe(new_df))
+    return {
+        'df': df,
+        'members': members_info,
+        'token_index': token_index,
+        'rollup': rollup,
+        'search_index': search_index,
+        'series': series,
+        'plots': {},
+        'plot_timings': {}
+    }
+
+def generate_plots(chart_data, on_chart=None):
+    """
+    Dibuja con matplotlib las gráficas indicadas.
+    
+    El dibujo de cada gráfica se reparte en el pool de procesos de ``charts``.
+    Cada PNG se guarda en el almacén de imágenes junto con sus datos; si se
+    indica ``on_chart``, se llama con (nombre, id de imagen, segundos) en
+    cuanto cada gráfica está lista.
+    
+    Args:
+        chart_data: Diccionario nombre de gráfica -> datos agregados
     
+    Returns:
+        Tupla (plots, timings) con el id de imagen y los segundos de renderizado por gráfica
+    """
     try:
-        # Limpiar la fecha si es necesario
-        if device_type == 'iphone':
-            df['datetime'] = df['datetime'].str.replace('[', '').str.replace(']', '')
-            # Intentar primero con el formato que incluye coma
-            try:
-                df['datetime'] = pd.to_datetime(df['datetime'], format=date_format)
-            except ValueError:
-                # Si falla, intentar sin la coma
-                date_format = date_format.replace(', ', ' ')
-                df['datetime'] = pd.to_datetime(df['datetime'], format=date_format)
-        else:
-            df['datetime'] = pd.to_datetime(df['datetime'], format=date_format)
-        
-        # Extraer hora y día de la semana
-        df['hour'] = df['datetime'].dt.hour
-        df['day_of_week'] = df['datetime'].dt.day_name()
-        
-        # Identificar tipo de mensaje según el dispositivo
-        media_patterns = {
-            'android': '<Multimedia omitido>',
-            'iphone': 'Media omitted'
-        }
-        media_text = media_patterns.get(device_type, '<Multimedia omitido>')
-        df['type'] = df['message'].apply(lambda x: 'media' if media_text in x else 'text')
-        
-        # Obtener miembros y estadísticas
-        members = df['sender'].unique().tolist()
-        message_counts = df['sender'].value_counts()
-        
-        # Crear información de miembros
-        members_info = []
-        total_messages = len(df)
+        image_ids = {}
         
-        for member in members:
-            member_messages = df[df['sender'] == member]
-            member_count = len(member_messages)
-            
-            # Obtener palabras más frecuentes
-            text_messages = member_messages[member_messages['type'] == 'text']['message'].tolist()
-            
-            # Filtrar palabras usando la función auxiliar
-            words = filter_words(text_messages)
-            
-            # Obtener las palabras más frecuentes
-            word_freq = Counter(words)
-            top_words = word_freq.most_common(3)
-            
-            members_info.append({
-                'name': member,
-                'messages': member_count,
-                'percentage': round(member_count / total_messages * 100, 1),
-                'top_words': top_words
-            })
+        def store_chart(name, png, seconds):
+            image_ids[name] = image_store.put(png, source=(name, chart_data[name]))
+            if on_chart:
+                on_chart(name, image_ids[name], seconds)
         
-        return df, members_info, None
+        _, timings = render_charts(chart_data, on_chart=store_chart)
+        return image_ids, timings
+    except Exception as e:
+        debug(f"Error generando gráficas: {str(e)}")
+        return {}, {}
+
+def generate_member_wordcloud(token_index, member, params):
+    """Genera una nube de palabras para un miembro específico y devuelve su id de imagen"""
+    try:
+        with stage('member_wordcloud'):
+            # Las frecuencias ya están calculadas en el índice: no se re-tokenizan los mensajes
+            frequencies = dict(token_index.frequencies(member).most_common(params['max_words']))
+            data = (frequencies, params)
+            png = render_image('member_wordcloud', data)
+            return image_store.put(png, source=('member_wordcloud', data))
         
     except Exception as e:
-        print(f"Error procesando fechas: {str(e)}")
-        return None, None, f"Error procesando el archivo: {str(e)}"
+        debug(f"Error generando nube de palabras: {str(e)}")
+        return None
 
-def generate_plots(df):
-    """Genera todas las visualizaciones"""
-    plots = {}
+def member_wordcloud(chat_id, token_index, member, params):
+    """
+    Devuelve el id de imagen de la nube de un miembro, dibujándola solo si no está en caché.
+    
+    Cada combinación de chat, miembro y parámetros se guarda por separado. Si
+    la misma nube ya se está dibujando (por ejemplo, en el cálculo previo en
+    segundo plano), se espera a ese resultado en lugar de dibujarla otra vez.
+    """
+    key = hashlib.sha256(f'{chat_id}:{member}:{json.dumps(params, sort_keys=True)}'.encode('utf-8')).hexdigest()
+    image_id = wordcloud_cache.get(key)
+    if image_id is not None and image_store.contains(image_id):
+        return image_id
+    
+    with _wordclouds_lock:
+        pending = _wordclouds_pending.get(key)
+        if pending is None:
+            pending = _wordclouds_pending[key] = Future()
+            owner = True
+        else:
+            owner = False
+    if not owner:
+        return pending.result()
     
     try:
-        # 1. Mensajes por persona
-        fig, ax = plt.subplots(figsize=(12, 6))
-        messages_per_person = df['sender'].value_counts().head(20)
-        messages_per_person.plot(kind='bar', color='skyblue', ax=ax)
-        plt.title('Top 20: Mensajes por persona')
-        plt.xlabel('Miembro')
-        plt.ylabel('Número de mensajes')
-        plt.xticks(rotation=45)
-        plots['messages_per_person'] = get_plot_url()
-        plt.close(fig)
-        
-        # 2. Actividad a lo largo del tiempo
-        fig, ax = plt.subplots(figsize=(12, 6))
-        daily_activity = df.resample('D', on='datetime').size()
-        daily_activity.plot(kind='line', color='green', ax=ax)
-        plt.title('Actividad diaria del chat')
-        plt.xlabel('Fecha')
-        plt.ylabel('Número de mensajes')
-        plots['daily_activity'] = get_plot_url()
-        plt.close(fig)
+        image_id = generate_member_wordcloud(token_index, member, params)
+        if image_id is not None:
+            wordcloud_cache.put(key, image_id)
+    finally:
+        with _wordclouds_lock:
+            del _wordclouds_pending[key]
+        pending.set_result(image_id)
+    return image_id
+
+def precompute_wordclouds(chat_id, chat):
+    """Dibuja con los parámetros por defecto las nubes de los miembros más activos"""
+    params = wordcloud_params()
+    top_members = sorted(chat['members'], key=lambda member: member['messages'], reverse=True)
+    for member in top_members[:WORDCLOUD_PRECOMPUTE]:
+        # Los miembros sin palabras (solo multimedia o mensajes eliminados) no tienen nube
+        if chat['token_index'].frequencies(member['name']):
+            member_wordcloud(chat_id, chat['token_index'], member['name'], params)
+
+def image_url(image_id):
+    """URL de una imagen del almacén"""
+    return f'/images/{image_id}'
+
+def chart_names(chat):
+    """Gráficas del servidor que tiene un chat (los guardados antes de registrarlas las tienen todas)"""
+    return chat.get('chart_names', SERVER_CHARTS)
+
+def get_chat(chat_id):
+    """Busca un chat en memoria y, si no está, en la caché en disco"""
+    chat = chat_store.get(chat_id)
+    if chat is None:
+        chat = result_cache.get(chat_id)
+        if chat is not None:
+            chat_store.put(chat_id, chat)
+    return chat
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+def run_analysis(job, path, chat_id, device_type, upload):
+    """
+    Analiza un chat subido en segundo plano, publicando el progreso en el trabajo.
+    
+    Etapas: parse (0-50 %), stats (las series agregadas quedan disponibles
+    en ``/series/<chat_id>``) y charts (60-100 %, una parte por cada gráfica
+    que se dibuja en el servidor). Si el archivo empieza por otro ya analizado
+    (``upload['base']``), solo se parsea el final nuevo. El archivo temporal
+    se borra al terminar.
+    """
+    try:
+        # Buscar primero en memoria y luego en la caché en disco
+        chat = get_chat(chat_id)
         
-        # 3. Distribución de tipos de mensajes
-        fig, ax = plt.subplots(figsize=(8, 8))
-        type_counts = df['type'].value_counts()
-        type_counts.plot(kind='pie', autopct='%1.1f%%', colors=['lightcoral', 'lightblue'], ax=ax)
-        plt.title('Distribución de tipos de mensajes')
-        plots['message_types'] = get_plot_url()
-        plt.close(fig)
+        # Un chat sin gráficas es de un análisis todavía en curso o fallido, y si
+        # alguna imagen se borró del almacén hay que volver a dibujarla: se repite
+        if chat is not None and all(
+            name in chat['plots'] and image_store.contains(chat['plots'][name]) for name in chart_names(chat)
+        ):
+            for name in chart_names(chat):
+                job.add_chart(name, image_url(chat['plots'][name]), chat['plot_timings'].get(name))
+            job.update(chat_id=chat_id, cache_hit=True, members=chat['members'],
+                       parse_stats=chat['df'].attrs['parse_stats'], series_url=f'/series/{chat_id}')
+            wordcloud_executor.submit(precompute_wordclouds, chat_id, chat)
+            return
         
-        # 4. Actividad por hora
-        fig, ax = plt.subplots(figsize=(12, 6))
-        df['hour'].value_counts().sort_index().plot(kind='bar', ax=ax)
-        plt.title('Actividad por hora del día')
-        plt.xlabel('Hora')
-        plt.ylabel('Número de mensajes')
-        plots['hourly_activity'] = get_plot_url()
-        plt.close(fig)
+        job.update(stage='parse', chat_id=chat_id, cache_hit=False)
+        on_progress = lambda fraction: job.update(progress=0.5 * fraction)
+        # Tiempo, mensajes y memoria de cada etapa de este análisis
+        recorder = StageRecorder()
         
-        # 5. Actividad por día de la semana
-        fig, ax = plt.subplots(figsize=(12, 6))
-        day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        df['day_of_week'].value_counts().reindex(day_order).plot(kind='bar', ax=ax)
-        plt.title('Actividad por día de la semana')
-        plt.xlabel('Día')
-        plt.ylabel('Número de mensajes')
-        plots['weekly_activity'] = get_plot_url()
-        plt.close(fig)
+        # Exportación que amplía un chat ya analizado: solo se analiza el final nuevo
+        chat = None
+        base = upload['base']
+        if base is not None:
+            base_chat = get_chat(make_key(base['content_hash'], device_type, ANALYZER_VERSION))
+            if base_chat is not None:
+                chat = merge_chat(base_chat, path, base['size'], on_progress, recorder)
+                if chat is None:
+                    debug("El final del archivo no encaja con el chat guardado; se analiza completo")
         
-        # 6. Nube de palabras general del grupo
-        text_messages = df[df['type'] == 'text']['message']
-        words = filter_words(text_messages)
-        text = ' '.join(words)
+        if chat is None:
+            with open(path, 'rb') as f:
+                # El archivo se lee por bloques; el progreso del parseo es la fracción leída
+                reader = ProgressReader(f, os.path.getsize(path), on_progress)
+                df, members_info, token_index, error = process_chat_file(
+                    reader, device_type, on_stage=lambda stage: job.update(stage=stage, progress=0.5),
+                    recorder=recorder
+                )
+            
+            if error:
+                job.finish(error=error)
+                return
+            
+            # Conteos por miembro, día y hora: de ellos salen las series y las consultas de /stats
+            with recorder.stage('rollup', messages=len(df)):
+                rollup = Rollup.from_dataframe(df)
+            with recorder.stage('series'):
+                series = rollup.series()
+            # Índice invertido de los mensajes para /search
+            with recorder.stage('search_index', messages=len(df)):
+                search_index = SearchIndex.from_dataframe(df)
+            chat = {
+                'df': df,
+                'members': members_info,
+                'token_index': token_index,
+                'rollup': rollup,
+                'search_index': search_index,
+                'series': series,
+                'plots': {},
+                'plot_timings': {}
+            }
         
-        stop_words = set(stopwords.words('spanish'))
-        stop_words.update(EXCLUDED_WORDS)
+        # El chat queda disponible (miembros, series y nubes por miembro) antes de dibujar las gráficas
+        chat_store.put(chat_id, chat)
+        token_index = chat['token_index']
+        job.update(stage='charts', progress=0.6, members=chat['members'], parse_stats=chat['df'].attrs['parse_stats'],
+                   series_url=f'/series/{chat_id}', stages=recorder.snapshot())
         
-        wordcloud = WordCloud(
-            width=1200, 
-            height=600, 
-            background_color='white',
-            max_words=150,
-            collocations=False,
-            stopwords=stop_words
-        ).generate(text)
+        def on_chart(name, image_id, seconds):
+            # Las gráficas se dibujan en otros procesos: solo se conoce su tiempo
+            recorder.add(f'chart:{name}', seconds)
+            job.add_chart(name, image_url(image_id), seconds)
+            job.update(progress=0.6 + 0.4 * len(job.charts) / len(SERVER_CHARTS))
         
-        fig = plt.figure(figsize=(15, 7.5))
-        plt.imshow(wordcloud, interpolation='bilinear')
-        plt.axis('off')
-        plt.title('Palabras más usadas en el grupo')
-        plots['group_wordcloud'] = get_plot_url()
-        plt.close(fig)
+        chart_data = {}
+        # Nube de palabras general del grupo (solo entran en la nube las más frecuentes);
+        # un chat sin palabras, por ejemplo solo con multimedia, no la tiene
+        frequencies = dict(token_index.frequencies().most_common(150))
+        if frequencies:
+            chart_data['group_wordcloud'] = frequencies
+        chat['chart_names'] = list(chart_data)
+        plots, plot_timings = generate_plots(chart_data, on_chart=on_chart)
+        chat['plots'] = plots
+        chat['plot_timings'] = plot_timings
+        job.update(stages=recorder.snapshot())
         
-        return plots
-    except Exception as e:
-        print(f"Error generando gráficas: {str(e)}")
-        return {}
-
-def get_plot_url():
-    """Convierte el plot actual en una URL de imagen"""
-    img = BytesIO()
-    plt.savefig(img, format='png', bbox_inches='tight')
-    plt.close()
-    img.seek(0)
-    plot_url = base64.b64encode(img.getvalue()).decode()
-    return f'data:image/png;base64,{plot_url}'
-
-def generate_member_wordcloud(df, member):
-    """Genera una nube de palabras para un miembro específico"""
+        # Guardar en disco (si las gráficas fallaron no se persiste)
+        if len(plots) == len(chart_data):
+            result_cache.put(chat_id, chat)
+        # Registrar el archivo para analizar solo el final de sus próximas ampliaciones
+        prefix_index.add(upload['head_hash'], upload['content_hash'], upload['size'])
+        # Las nubes de los miembros más activos quedan listas antes de que se elijan
+        wordcloud_executor.submit(precompute_wordclouds, chat_id, chat)
+    finally:
+        os.remove(path)
+        upload_budget.release(upload['reserved'])
+
+def upload_too_large():
+    return jsonify({'error': f'El archivo supera el tamaño máximo de {MAX_UPLOAD_BYTES // (1024 * 1024)} MB'}), 413
+
+@app.errorhandler(413)
+def request_entity_too_large(e):
+    return upload_too_large()
+
+def upload_busy():
+    response = jsonify({'error': 'El servidor está procesando demasiados archivos; inténtalo de nuevo en unos segundos'})
+    response.headers['Retry-After'] = str(UPLOAD_RETRY_AFTER)
+    return response, 503
+
+@app.route('/upload', methods=['POST'])
+def upload():
+    # Reservar los bytes de la subida antes de leerla; si no caben, el cliente debe reintentar más tarde
+    reserved = request.content_length or MAX_UPLOAD_BYTES
+    if reserved > MAX_UPLOAD_BYTES:
+        return upload_too_large()
+    if not upload_budget.reserve(reserved):
+        return upload_busy()
+    path = None
+    submitted = False
     try:
-        # Obtener solo mensajes de texto del miembro
-        member_messages = df[(df['sender'] == member) & (df['type'] == 'text')]['message']
-        
-        # Filtrar palabras usando la función auxiliar
-        words = filter_words(member_messages)
+        if 'file' not in request.files:
+            return jsonify({'error': 'No se subió ningún archivo'})
         
-        # Unir palabras filtradas
-        text = ' '.join(words)
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No se seleccionó ningún archivo'})
         
-        # Configurar y generar la nube de palabras
-        stop_words = set(stopwords.words('spanish'))
-        stop_words.update(EXCLUDED_WORDS)
+        # Obtener el tipo de dispositivo del formulario (por defecto se detecta)
+        device_type = request.form.get('device_type') or 'auto'
         
-        wordcloud = WordCloud(
-            width=800, 
-            height=400, 
-            background_color='white',
-            max_words=100,
-            collocations=False,
-            stopwords=stop_words
-        ).generate(text)
+        # El archivo se copia a disco para analizarlo después de responder. De una
+        # exportación en ZIP solo se descomprime el chat, sin los archivos multimedia
+        fd, path = tempfile.mkstemp(suffix='.upload')
+        with os.fdopen(fd, 'wb') as f:
+            if is_zip(file.stream):
+                extract_chat(file.stream, f, MAX_UPLOAD_BYTES)
+            else:
+                shutil.copyfileobj(file.stream, f)
         
-        # Crear una nueva figura con el backend Agg
-        fig = plt.figure(figsize=(10, 5))
-        plt.imshow(wordcloud, interpolation='bilinear')
-        plt.axis('off')
+        # Clave por contenido: la misma exportación con el mismo formato reutiliza el resultado.
+        # En la misma lectura se busca un archivo ya analizado que sea su principio
+        with open(path, 'rb') as f:
+            content_hash, head_hash, size, base = scan_stream(f, prefix_index)
+        # El chat descomprimido de un ZIP puede ocupar más que la subida
+        if size > reserved:
+            if not upload_budget.reserve(size - reserved):
+                return upload_busy()
+            reserved = size
+        chat_id = make_key(content_hash, device_type, ANALYZER_VERSION)
+        upload = {'content_hash': content_hash, 'head_hash': head_hash, 'size': size, 'base': base,
+                  'reserved': reserved}
         
-        # Guardar la imagen en memoria
-        img = BytesIO()
-        fig.savefig(img, format='png', bbox_inches='tight', pad_inches=0)
-        plt.close(fig)  # Cerrar la figura explícitamente
+        job = jobs.submit(run_analysis, path, chat_id, device_type, upload)
+        submitted = True
         
-        # Preparar la imagen para enviar
-        img.seek(0)
-        return base64.b64encode(img.getvalue()).decode()
+        # Asociar el chat a la sesión del usuario
+        session['chat_id'] = chat_id
         
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'chat_id': chat_id
+        })
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return upload_too_large()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Error generando nube de palabras: {str(e)}")
-        return None
+        return jsonify({'error': f'Error procesando el archivo: {str(e)}'})
+    finally:
+        # Si el análisis no llegó a empezar, se libera aquí lo reservado (si no, al terminar)
+        if not submitted:
+            upload_budget.release(reserved)
+            if path is not None:
+                os.remove(path)
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Etapa, progreso y gráficas listas de un trabajo de análisis"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(job.to_dict())
 
-@app.route('/upload', methods=['POST'])
-def upload():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No se subió ningún archivo'})
+@app.route('/jobs/<job_id>/charts/<name>')
+def job_chart(job_id, name):
+    """Redirige a la imagen de una gráfica en cuanto está lista (202 mientras se dibuja)"""
+    job = jobs.get(job_id)
+    if job is None or name not in CHART_NAMES:
+        return jsonify({'error': 'Gráfica no encontrada'}), 404
+    if name in SERIES_NAMES and job.result.get('series_url'):
+        # Las gráficas de series no se dibujan durante el análisis
+        return redirect(f"/charts/{job.result['chat_id']}/{name}")
+    chart = job.get_chart(name)
+    if chart is None and job.done:
+        return jsonify({'error': 'Gráfica no disponible'}), 404
+    if chart is None:
+        return jsonify({'pending': True, 'stage': job.stage}), 202
+    return redirect(chart)
+
+@app.route('/series/<chat_id>')
+def chat_series(chat_id):
+    """
+    Series agregadas de las gráficas de actividad en JSON, para dibujarlas en el navegador.
     
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No se seleccionó ningún archivo'})
+    El ID del chat depende del contenido del archivo, así que la respuesta no
+    cambia y se puede guardar en la caché del navegador.
+    """
+    chat = get_chat(chat_id)
+    if chat is None:
+        return jsonify({'error': 'No hay datos de chat cargados'}), 404
+    response = jsonify(series_to_json(chat['series']))
+    response.set_etag(chat_id)
+    response.cache_control.private = True
+    response.cache_control.max_age = IMAGE_MAX_AGE
+    return response.make_conditional(request)
+
+def parse_day(value):
+    """Fecha ``aaaa-mm-dd`` de un parámetro de consulta (None si no se indica)"""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Fecha no válida: {value} (formato aaaa-mm-dd)")
+
+@app.route('/stats')
+def chat_stats():
+    """
+    Series de las gráficas de actividad para un rango de fechas y unos miembros.
     
-    # Obtener el tipo de dispositivo del formulario
-    device_type = request.form.get('device_type')
-    if not device_type:
-        return jsonify({'error': 'No se especificó el tipo de dispositivo'})
+    Parámetros: ``from`` y ``to`` (aaaa-mm-dd, incluidos; sin ellos, desde el
+    principio o hasta el final), ``members`` (repetido por cada miembro; sin
+    él, todos) y ``chat_id`` (por defecto, el de la sesión). Se responde desde
+    los conteos por miembro, día y hora, sin recorrer los mensajes.
+    """
+    chat_id = request.args.get('chat_id') or session.get('chat_id')
+    chat = get_chat(chat_id) if chat_id else None
+    if chat is None:
+        return jsonify({'error': 'No hay datos de chat cargados'}), 404
     
     try:
-        content = file.read().decode('utf-8')
-        df, members_info, error = process_chat_file(content, device_type)
-        
-        if error:
-            return jsonify({'error': error})
-        
-        # Guardar DataFrame en la variable global
-        chat_data['df'] = df
-        chat_data['members'] = members_info
-        
-        plots = generate_plots(df)
+        start = parse_day(request.args.get('from'))
+        end = parse_day(request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if start is not None and end is not None and start > end:
+        return jsonify({'error': 'La fecha inicial es posterior a la final'}), 400
+    members = request.args.getlist('members') or None
+    
+    with stage('stats_query'):
+        try:
+            series = chat['rollup'].series(start, end, members)
+        except KeyError as e:
+            return jsonify({'error': f'Miembro no encontrado: {e.args[0]}'}), 400
+    return jsonify({
+        'chat_id': chat_id,
+        'from': start.isoformat() if start else None,
+        'to': end.isoformat() if end else None,
+        'members': members,
+        'messages': int(series['message_types'].sum()),
+        'series': series_to_json(series)
+    })
+
+def parse_int(name, default, minimum, maximum):
+    """Entero de un parámetro de consulta entre ``minimum`` y ``maximum``"""
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"Parámetro no válido: {name}={value}")
+    if not minimum <= number <= maximum:
+        raise ValueError(f"El parámetro {name} debe estar entre {minimum} y {maximum}")
+    return number
+
+def message_to_json(df, row):
+    """Fecha, remitente, categoría y texto de una fila del chat"""
+    return {
+        'row': int(row),
+        'datetime': df['datetime'].iat[row].isoformat(),
+        'sender': df['sender'].iat[row],
+        'kind': df['kind'].iat[row],
+        'message': df['message'].iat[row]
+    }
+
+@app.route('/search')
+def search():
+    """
+    Busca mensajes del chat en el índice invertido.
+    
+    Parámetros: ``q`` (palabras, todas obligatorias; las frases entre
+    comillas), ``from``/``to`` y ``members`` como en /stats, ``sort``
+    (``relevance`` o ``date``), ``page`` (desde 1), ``per_page`` y ``context``
+    (mensajes anteriores y posteriores a cada resultado) y ``chat_id`` (por
+    defecto, el de la sesión).
+    """
+    chat_id = request.args.get('chat_id') or session.get('chat_id')
+    chat = get_chat(chat_id) if chat_id else None
+    if chat is None:
+        return jsonify({'error': 'No hay datos de chat cargados'}), 404
+    
+    query = request.args.get('q', '').strip()
+    sort = request.args.get('sort') or 'relevance'
+    if sort not in ('relevance', 'date'):
+        return jsonify({'error': f'Orden no válido: {sort} (relevance o date)'}), 400
+    try:
+        start = parse_day(request.args.get('from'))
+        end = parse_day(request.args.get('to'))
+        page = parse_int('page', 1, 1, 10 ** 6)
+        per_page = parse_int('per_page', SEARCH_PAGE_SIZE, 1, SEARCH_MAX_PAGE_SIZE)
+        context = parse_int('context', 2, 0, SEARCH_MAX_CONTEXT)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if start is not None and end is not None and start > end:
+        return jsonify({'error': 'La fecha inicial es posterior a la final'}), 400
+    members = request.args.getlist('members') or None
+    
+    df = chat['df']
+    with stage('search_query') as record:
+        try:
+            result = chat['search_index'].search(query, RowFilter(df, start, end, members))
+        except KeyError as e:
+            return jsonify({'error': f'Miembro no encontrado: {e.args[0]}'}), 400
+        if result is None:
+            return jsonify({'error': 'La búsqueda no tiene ninguna palabra'}), 400
+        rows, scores = result
+        record['messages'] = len(rows)
+        rows, scores = rank(rows, scores, page * per_page, by_date=sort == 'date')
         
-        return jsonify({
-            'success': True,
-            'members': members_info,
-            'plots': plots
-        })
-    except Exception as e:
-        return jsonify({'error': f'Error procesando el archivo: {str(e)}'})
+        results = []
+        for row, score in zip(rows[(page - 1) * per_page:].tolist(), scores[(page - 1) * per_page:].tolist()):
+            results.append({
+                **message_to_json(df, row),
+                'score': round(score, 4),
+                'before': [message_to_json(df, i) for i in range(max(row - context, 0), row)],
+                'after': [message_to_json(df, i) for i in range(row + 1, min(row + context + 1, len(df)))]
+            })
+    return jsonify({
+        'chat_id': chat_id,
+        'query': query,
+        'total': int(result[0].size),
+        'page': page,
+        'per_page': per_page,
+        'results': results
+    })
+
+@app.route('/charts/<chat_id>/<name>')
+def chart_fallback(chat_id, name):
+    """
+    Dibuja con matplotlib una gráfica de series y redirige a su imagen.
+    
+    Es la alternativa para los clientes que no pueden dibujar las series.
+    """
+    if name not in SERIES_NAMES:
+        return jsonify({'error': 'Gráfica no encontrada'}), 404
+    chat = get_chat(chat_id)
+    if chat is None:
+        return jsonify({'error': 'No hay datos de chat cargados'}), 404
+    
+    image_id = chat['plots'].get(name)
+    if image_id is None or not image_store.contains(image_id):
+        plots, _ = generate_plots({name: chat['series'][name]})
+        if name not in plots:
+            return jsonify({'error': 'Error generando la gráfica'}), 500
+        image_id = chat['plots'][name] = plots[name]
+    return redirect(image_url(image_id))
+
+@app.route('/images/<filename>')
+def image(filename):
+    """
+    Sirve una imagen del almacén por su id.
+    
+    El formato se elige con la extensión (``<id>.svg``) o, sin extensión,
+    según la cabecera Accept: PNG salvo que el cliente pida WebP o SVG
+    de forma explícita. La respuesta lleva ETag y
+    caché de larga duración, porque el id es el hash del contenido.
+    """
+    image_id, ext = os.path.splitext(filename)
+    if ext:
+        fmt = ext[1:]
+    else:
+        mimetype = request.accept_mimetypes.best_match(
+            [IMAGE_FORMATS['png'], IMAGE_FORMATS['webp'], IMAGE_FORMATS['svg']],
+            default=IMAGE_FORMATS['png']
+        )
+        fmt = next(f for f, m in IMAGE_FORMATS.items() if m == mimetype)
+    if fmt not in IMAGE_FORMATS:
+        return jsonify({'error': 'Formato de imagen no soportado'}), 404
+    
+    etag = f'{image_id}.{fmt}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        data = image_store.get(image_id, fmt)
+        if data is None:
+            return jsonify({'error': 'Imagen no encontrada'}), 404
+        response = Response(data, mimetype=IMAGE_FORMATS[fmt])
+    
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_MAX_AGE
+    response.cache_control.immutable = True
+    if not ext:
+        response.vary.add('Accept')
+    return response
 
 @app.route('/member_wordcloud', methods=['POST'])
 def get_member_wordcloud():
@@ -388,17 +703,64 @@ def get_member_wordcloud():
     if not member:
         return jsonify({'error': 'Falta el miembro'})
     
-    if chat_data['df'] is None:
+    # Buscar el chat por su ID o, si no se indica, por el de la sesión
+    chat_id = data.get('chat_id') or session.get('chat_id')
+    chat = get_chat(chat_id) if chat_id else None
+    if chat is None:
         return jsonify({'error': 'No hay datos de chat cargados'})
     
     try:
-        wordcloud = generate_member_wordcloud(chat_data['df'], member)
+        params = wordcloud_params(data.get('params'))
+    except ValueError as e:
+        return jsonify({'error': str(e)})
+    
+    # Sin palabras (solo multimedia o mensajes eliminados) no se puede dibujar la nube
+    if not chat['token_index'].frequencies(member):
+        return jsonify({'error': 'Este miembro no tiene mensajes de texto suficientes para la nube de palabras'})
+    
+    try:
+        image_id = member_wordcloud(chat_id, chat['token_index'], member, params)
+        if image_id is None:
+            return jsonify({'error': 'Error generando nube de palabras'})
         return jsonify({
             'success': True,
-            'wordcloud': wordcloud
+            'wordcloud_url': image_url(image_id),
+            'params': params
         })
     except Exception as e:
         return jsonify({'error': f'Error generando nube de palabras: {str(e)}'})
 
+@app.route('/export/<chat_id>')
+def export_chat(chat_id):
+    """Descarga el chat parseado en formato binario para recargarlo sin parsear"""
+    chat = get_chat(chat_id)
+    if chat is None:
+        return jsonify({'error': 'No hay datos de chat cargados'}), 404
+    return send_file(
+        BytesIO(chat_to_bytes(chat['df'])),
+        mimetype='application/vnd.apache.arrow.file',
+        as_attachment=True,
+        download_name=f'chat{BINARY_SUFFIX}'
+    )
+
+@app.route('/metrics')
+def metrics():
+    """Tiempos, mensajes y memoria de las etapas del análisis en formato Prometheus"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/store_stats')
+def store_stats():
+    return jsonify({
+        'chat_store': chat_store.stats(),
+        'result_cache': result_cache.stats(),
+        'image_store': image_store.stats(),
+        'wordcloud_cache': wordcloud_cache.stats(),
+        'uploads': upload_budget.stats()
+    })
+
+# Tiempo de carga de la aplicación, publicado en /metrics
+STARTUP_SECONDS.set(round(time.perf_counter() - _started, 4))
+debug(f"Aplicación cargada en {time.perf_counter() - _started:.2f}s")
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+Análisis por lotes de un directorio de exportaciones de WhatsApp.
+
+Uso:
+    python batch_analyze.py chats/ --output informes/ [--workers N] [--no-plots]
+
+Cada chat se analiza en un proceso del pool, con el mismo parseo y las mismas
+estadísticas que la aplicación web. Por cada chat se escribe ``<chat>.json``
+con su resumen y, salvo con ``--no-plots``, la carpeta ``<chat>/`` con las
+gráficas en PNG. Al terminar se escriben ``report.json`` y ``report.csv`` con
+el informe conjunto y se muestra el rendimiento (archivos/s y mensajes/s).
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from aggregates import series_to_json
+from analysis import process_chat_file
+from charts import render_image
+from chat_model import DAY_ORDER
+from chat_parser import DEVICE_TYPES
+from instrumentation import set_debug_output
+from rollup import Rollup
+
+# Palabras de cada chat que se suman en el informe conjunto
+REPORT_TOP_WORDS = 500
+
+
+def analyze_chat(path, output_dir, device_type='auto', plots=True, verbose=False):
+    """
+    Analiza un archivo de chat y escribe su resumen (y sus gráficas) en ``output_dir``.
+
+    Returns:
+        Tupla (resumen, agregados): el resumen es una fila del informe conjunto
+        (con ``error`` si el chat no se pudo analizar) y los agregados son las
+        series que se suman entre chats, o None si hubo error
+    """
+    start = time.perf_counter()
+    chat = os.path.splitext(os.path.basename(path))[0]
+    summary = {'chat': chat, 'file': path, 'bytes': os.path.getsize(path)}
+
+    # Los mensajes de depuración del análisis solo se muestran con --verbose
+    set_debug_output(verbose)
+    with open(path, 'rb') as f:
+        df, members_info, token_index, error = process_chat_file(f, device_type)
+    if error:
+        summary['error'] = error
+        return summary, None
+
+    series = Rollup.from_dataframe(df).series()
+    stats = df.attrs['parse_stats']
+    summary.update({
+        'messages': len(df),
+        'members': len(members_info),
+        'media_messages': int((df['type'] == 'media').sum()),
+        'first_message': df['datetime'].min().isoformat(),
+        'last_message': df['datetime'].max().isoformat(),
+        'active_days': int((series['daily_activity'] > 0).sum()),
+        'format': stats.get('format'),
+        'date_format': stats.get('date_format')
+    })
+
+    detail = {
+        **summary,
+        'parse_stats': stats,
+        'members_info': members_info,
+        'top_words': token_index.frequencies().most_common(50),
+        'series': series_to_json(series)
+    }
+    if plots:
+        chart_dir = os.path.join(output_dir, chat)
+        os.makedirs(chart_dir, exist_ok=True)
+        chart_data = dict(series)
+        # Un chat sin palabras (solo multimedia, por ejemplo) no tiene nube de palabras
+        frequencies = dict(token_index.frequencies().most_common(150))
+        if frequencies:
+            chart_data['group_wordcloud'] = frequencies
+        for name, data in chart_data.items():
+            with open(os.path.join(chart_dir, f'{name}.png'), 'wb') as f:
+                f.write(render_image(name, data))
+        detail['charts'] = [f'{chat}/{name}.png' for name in chart_data]
+    with open(os.path.join(output_dir, f'{chat}.json'), 'w', encoding='utf-8') as f:
+        json.dump(detail, f, ensure_ascii=False, indent=2)
+
+    summary['seconds'] = round(time.perf_counter() - start, 3)
+    aggregates = {
+        'hourly': {int(hour): int(count) for hour, count in series['hourly_activity'].items()},
+        'weekly': {day: int(count) for day, count in series['weekly_activity'].items()},
+        'words': token_index.frequencies().most_common(REPORT_TOP_WORDS)
+    }
+    return summary, aggregates
+
+
+def build_report(results, elapsed, workers):
+    """
+    Combina los resultados de todos los chats en el informe conjunto.
+
+    Las palabras más usadas se calculan sumando las ``REPORT_TOP_WORDS`` más
+    frecuentes de cada chat.
+    """
+    summaries = [summary for summary, _ in results]
+    analyzed = [summary for summary in summaries if 'error' not in summary]
+    hourly, weekly, words = Counter(), Counter(), Counter()
+    for _, aggregates in results:
+        if aggregates is not None:
+            hourly.update(aggregates['hourly'])
+            weekly.update(aggregates['weekly'])
+            words.update(dict(aggregates['words']))
+
+    total_messages = sum(summary['messages'] for summary in analyzed)
+    total_bytes = sum(summary['bytes'] for summary in summaries)
+    return {
+        'chats': len(summaries),
+        'analyzed': len(analyzed),
+        'failed': [{'chat': s['chat'], 'file': s['file'], 'error': s['error']}
+                   for s in summaries if 'error' in s],
+        'messages': total_messages,
+        'members': sum(summary['members'] for summary in analyzed),
+        'media_messages': sum(summary['media_messages'] for summary in analyzed),
+        'most_active_chats': [
+            {'chat': s['chat'], 'messages': s['messages']}
+            for s in sorted(analyzed, key=lambda s: s['messages'], reverse=True)[:10]
+        ],
+        'hourly_activity': {hour: hourly[hour] for hour in range(24)},
+        'weekly_activity': {day: weekly[day] for day in DAY_ORDER},
+        'top_words': words.most_common(50),
+        'throughput': {
+            'workers': workers,
+            'seconds': round(elapsed, 3),
+            'files_per_s': round(len(summaries) / elapsed, 2) if elapsed > 0 else None,
+            'messages_per_s': round(total_messages / elapsed) if elapsed > 0 else None,
+            'mb_per_s': round(total_bytes / 1e6 / elapsed, 2) if elapsed > 0 else None
+        }
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analiza en paralelo un directorio de exportaciones de WhatsApp')
+    parser.add_argument('input_dir', help='Directorio con las exportaciones')
+    parser.add_argument('-o', '--output', default='reports', help='Directorio de los informes (por defecto: reports)')
+    parser.add_argument('-p', '--pattern', default='*.txt', help='Patrón de los archivos a analizar (por defecto: *.txt)')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='Procesos en paralelo (por defecto: todos los núcleos)')
+    parser.add_argument('--device-type', choices=('auto',) + DEVICE_TYPES, default='auto',
+                        help='Formato de exportación (por defecto se detecta)')
+    parser.add_argument('--no-plots', action='store_true', help='Solo estadísticas, sin dibujar gráficas')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Mostrar los mensajes de depuración del análisis')
+    args = parser.parse_args(argv)
+
+    paths = sorted(glob.glob(os.path.join(args.input_dir, args.pattern)))
+    if not paths:
+        print(f"No se encontraron archivos {args.pattern} en {args.input_dir}")
+        return 1
+
+    os.makedirs(args.output, exist_ok=True)
+
+    workers = max(1, min(args.workers, len(paths)))
+    print(f"Analizando {len(paths)} chats con {workers} procesos...")
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(analyze_chat, path, args.output, args.device_type, not args.no_plots, args.verbose): path
+            for path in paths
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                summary, aggregates = future.result()
+            except Exception as e:
+                summary = {'chat': os.path.splitext(os.path.basename(path))[0], 'file': path,
+                           'bytes': os.path.getsize(path), 'error': str(e)}
+                aggregates = None
+            results.append((summary, aggregates))
+            status = summary.get('error') or f"{summary['messages']} mensajes en {summary['seconds']}s"
+            print(f"[{done}/{len(paths)}] {summary['chat']}: {status}")
+    elapsed = time.perf_counter() - start
+
+    report = build_report(results, elapsed, workers)
+    with open(os.path.join(args.output, 'report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    rows = sorted((summary for summary, _ in results), key=lambda s: s['chat'])
+    pd.DataFrame(rows).convert_dtypes().to_csv(os.path.join(args.output, 'report.csv'), index=False)
+
+    throughput = report['throughput']
+    print(f"\n✅ {report['analyzed']}/{report['chats']} chats analizados, {report['messages']} mensajes "
+          f"en {throughput['seconds']}s")
+    print(f"Rendimiento: {throughput['files_per_s']} archivos/s · {throughput['messages_per_s']} mensajes/s "
+          f"· {throughput['mb_per_s']} MB/s")
+    for failure in report['failed']:
+        print(f"❌ {failure['chat']}: {failure['error']}")
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Banco de pruebas del analizador con exportaciones sintéticas.
+
+Uso:
+    python benchmark.py [--sizes 10k,100k,1M] [--format android] [--output bench.json]
+                        [--baseline bench_anterior.json]
+
+Para cada tamaño se genera (una sola vez, en ``--data-dir``) una exportación
+con ``synthetic_chat.py`` y se analiza en un proceso nuevo, midiendo por
+separado cada etapa del análisis: el parseo (y, dentro de él, la conversión
+de fechas), la clasificación de mensajes, la tabla compacta, el índice de
+palabras, las estadísticas por miembro, los conteos por miembro, día y hora
+(``Rollup``) y las series que salen de ellos, el índice de búsqueda, cada
+gráfica y la nube de palabras de un miembro, igual que en la aplicación. Las
+etapas se miden con ``instrumentation.StageRecorder``: de cada una se guarda
+el tiempo y cuánto creció la memoria del proceso; con ``--trace-memory``, el
+pico de memoria reservada durante la etapa (más lento).
+
+Los resultados se escriben en JSON. Con ``--baseline`` se comparan con los
+de una ejecución anterior y se marcan las etapas que han empeorado más del
+umbral, de modo que las regresiones se vean como números.
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from chat_parser import FORMATS
+from instrumentation import StageRecorder, max_rss_bytes
+from synthetic_chat import LANGUAGES, generate_chat, parse_count
+
+# Tamaños por defecto (mensajes)
+DEFAULT_SIZES = '10k,100k,1M'
+
+
+def peak_rss_mb():
+    """Memoria residente máxima del proceso en MB (None si no se puede medir)"""
+    peak = max_rss_bytes()
+    return None if peak is None else round(peak / 2**20, 1)
+
+
+def total_seconds(stages):
+    """Segundos del análisis: las etapas con un punto en el nombre son parte de otra y no se suman"""
+    return round(sum(stage['seconds'] for name, stage in stages.items() if '.' not in name), 3)
+
+
+def run_pipeline(path, device_type='auto', charts=True, trace_memory=False):
+    """
+    Analiza un archivo etapa por etapa, como ``analysis.process_chat_file`` y la aplicación.
+
+    Returns:
+        Diccionario con los mensajes, los bytes, los tiempos y la memoria de cada etapa
+    """
+    # Importar aquí para que la memoria base del proceso incluya las bibliotecas
+    from analysis import add_message_types, compute_members_info, record_parse_stages
+    from charts import RENDERERS, render_image, wordcloud_params
+    from chat_model import compact_chat
+    from chat_parser import StreamingChatParser
+    from rollup import Rollup
+    from search_index import SearchIndex
+    from token_index import TokenIndex
+
+    baseline_rss = peak_rss_mb()
+    # Con tracemalloc activo, el pico de cada etapa es el de la memoria reservada (si no, lo que crece el RSS)
+    if trace_memory:
+        tracemalloc.start()
+    recorder = StageRecorder()
+    with open(path, 'rb') as f, recorder.stage('parse') as record:
+        parser = StreamingChatParser(device_type)
+        df = parser.parse(f)
+        record['messages'] = parser.messages_parsed
+    if df is None:
+        raise ValueError(f"No se reconoció el formato de {path}")
+    stats = parser.stats()
+    record_parse_stages(recorder, stats)
+
+    with recorder.stage('message_types', messages=len(df)):
+        add_message_types(df)
+    with recorder.stage('compact', messages=len(df)):
+        df = compact_chat(df)
+    with recorder.stage('token_index', messages=len(df)):
+        token_index = TokenIndex.from_dataframe(df)
+    with recorder.stage('member_stats', messages=len(df)):
+        members_info = compute_members_info(df, token_index)
+    # Las mismas etapas que la aplicación: las series salen de los conteos por miembro, día y hora
+    with recorder.stage('rollup', messages=len(df)):
+        rollup = Rollup.from_dataframe(df)
+    with recorder.stage('series'):
+        series = rollup.series()
+    with recorder.stage('search_index', messages=len(df)):
+        SearchIndex.from_dataframe(df)
+
+    if charts:
+        chart_data = {**series, 'group_wordcloud': dict(token_index.frequencies().most_common(150))}
+        for name in RENDERERS:
+            with recorder.stage(f'chart:{name}'):
+                render_image(name, chart_data[name])
+        top_member = max(members_info, key=lambda member: member['messages'])['name']
+        with recorder.stage('member_wordcloud'):
+            params = wordcloud_params()
+            frequencies = dict(token_index.frequencies(top_member).most_common(params['max_words']))
+            render_image('member_wordcloud', (frequencies, params))
+
+    stages = recorder.snapshot()
+    total = total_seconds(stages)
+    return {
+        'messages': len(df),
+        'bytes': stats['bytes'],
+        'unparsed_rows': stats['unparsed_rows'],
+        'seconds': total,
+        'messages_per_s': round(len(df) / total) if total > 0 else None,
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': stages
+    }
+
+
+def _run_quiet(path, device_type, charts, trace_memory):
+    """Ejecuta el análisis sin los mensajes de depuración"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return run_pipeline(path, device_type, charts, trace_memory)
+
+
+def dataset_path(data_dir, messages, options):
+    """
+    Ruta de la exportación sintética de un tamaño; se genera si no existe.
+
+    El nombre lleva un hash de todas las opciones del generador, así que
+    cambiar cualquiera de ellas genera otro archivo.
+    """
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    name = f"{options['chat_format']}-{options['language']}-{messages}-{digest}.txt"
+    path = os.path.join(data_dir, name)
+    if not os.path.exists(path):
+        print(f"Generando {messages} mensajes en {path}...")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            generate_chat(f, messages=messages, **options)
+        os.replace(tmp_path, path)
+    return path
+
+
+def run_size(path, repeat=1, device_type='auto', charts=True, trace_memory=False):
+    """
+    Analiza un archivo ``repeat`` veces, cada una en un proceso nuevo.
+
+    Cada proceso empieza de cero, así que la memoria máxima no arrastra la de
+    análisis anteriores. De cada etapa se queda la ejecución más rápida.
+    """
+    context = multiprocessing.get_context('spawn')
+    best = None
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(_run_quiet, path, device_type, charts, trace_memory).result()
+        if best is None:
+            best = result
+            continue
+        for name, stage in result['stages'].items():
+            if stage['seconds'] < best['stages'][name]['seconds']:
+                best['stages'][name] = stage
+        best['seconds'] = min(best['seconds'], result['seconds'])
+        best['messages_per_s'] = max(best['messages_per_s'], result['messages_per_s'])
+    return best
+
+
+def compare(results, baseline, threshold):
+    """
+    Compara los tiempos con los de una ejecución anterior.
+
+    Returns:
+        Lista de (tamaño, etapa, segundos antes, segundos ahora, cociente)
+        de las etapas que han empeorado más de ``threshold``
+    """
+    regressions = []
+    for size, result in results.items():
+        previous = baseline.get('results', {}).get(size)
+        if previous is None:
+            continue
+        for name, stage in result['stages'].items():
+            before = previous['stages'].get(name, {}).get('seconds')
+            # Las etapas de pocos milisegundos son solo ruido
+            if not before or max(before, stage['seconds']) < 0.01:
+                continue
+            ratio = stage['seconds'] / before
+            if ratio > threshold:
+                regressions.append((size, name, before, stage['seconds'], round(ratio, 2)))
+    return regressions
+
+
+def print_table(results):
+    """Muestra una tabla con los segundos de cada etapa por tamaño"""
+    sizes = list(results)
+    stages = list(dict.fromkeys(name for result in results.values() for name in result['stages']))
+    width = max(len(name) for name in stages + ['mensajes/s'])
+    print('\n' + 'etapa'.ljust(width) + ''.join(f'{size:>12}' for size in sizes))
+    for name in stages:
+        row = [results[size]['stages'].get(name, {}).get('seconds') for size in sizes]
+        print(name.ljust(width) + ''.join(f'{"-" if s is None else f"{s:.3f}":>12}' for s in row))
+    for label, key in (('total (s)', 'seconds'), ('mensajes/s', 'messages_per_s'), ('RSS máx. (MB)', 'peak_rss_mb')):
+        print(label.ljust(width) + ''.join(f'{str(results[size][key]):>12}' for size in sizes))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mide el analizador con exportaciones sintéticas')
+    parser.add_argument('-s', '--sizes', default=DEFAULT_SIZES,
+                        help=f'Mensajes de cada prueba, separados por comas (por defecto: {DEFAULT_SIZES}; hasta 10M)')
+    parser.add_argument('-f', '--format', default='android', choices=[f.name for f in FORMATS],
+                        help='Formato de exportación (por defecto: android)')
+    parser.add_argument('-l', '--language', default='es', choices=list(LANGUAGES), help='Idioma (por defecto: es)')
+    parser.add_argument('-m', '--members', type=int, default=20, help='Miembros del grupo (por defecto: 20)')
+    parser.add_argument('--multiline', type=float, default=0.05, help='Proporción de mensajes de varias líneas')
+    parser.add_argument('--media', type=float, default=0.08, help='Proporción de mensajes multimedia')
+    parser.add_argument('--emoji', type=float, default=0.05, help='Probabilidad de emoji tras cada palabra')
+    parser.add_argument('--long-year', action='store_true', help='Escribir el año con 4 dígitos')
+    parser.add_argument('--seed', type=int, default=0, help='Semilla aleatoria (por defecto: 0)')
+    parser.add_argument('-d', '--data-dir', default=os.path.join('.cache', 'benchmark'),
+                        help='Directorio de las exportaciones generadas (por defecto: .cache/benchmark)')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='Ejecuciones por tamaño; se toma la más rápida')
+    parser.add_argument('--no-charts', action='store_true', help='No medir el dibujo de las gráficas')
+    parser.add_argument('--trace-memory', action='store_true', help='Medir el pico de memoria de cada etapa con tracemalloc')
+    parser.add_argument('-o', '--output', help='Archivo JSON donde guardar los resultados')
+    parser.add_argument('-b', '--baseline', help='Resultados anteriores con los que comparar')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Cociente de tiempo a partir del cual una etapa se considera regresión (por defecto: 1.2)')
+    args = parser.parse_args(argv)
+
+    sizes = [parse_count(size) for size in args.sizes.split(',') if size.strip()]
+    options = dict(members=args.members, chat_format=args.format, language=args.language,
+                   multiline_ratio=args.multiline, media_ratio=args.media,
+                   emoji_density=args.emoji, long_year=args.long_year, seed=args.seed)
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    results = {}
+    for messages in sizes:
+        path = dataset_path(args.data_dir, messages, options)
+        print(f"Analizando {messages} mensajes ({os.path.getsize(path) / 1e6:.1f} MB)...")
+        results[str(messages)] = result = run_size(path, args.repeat, charts=not args.no_charts,
+                                                   trace_memory=args.trace_memory)
+        print(f"  {result['seconds']}s · {result['messages_per_s']} mensajes/s · RSS máx. {result['peak_rss_mb']} MB")
+    print_table(results)
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'options': {**options, 'repeat': args.repeat, 'charts': not args.no_charts,
+                    'trace_memory': args.trace_memory},
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('options', {}).get('trace_memory', False) != args.trace_memory:
+            print("\n⚠️ Una de las ejecuciones usa --trace-memory, que hace más lentas todas las etapas")
+        regressions = compare(results, baseline, args.threshold)
+        if not regressions:
+            print(f"\n✅ Ninguna etapa más de {args.threshold}x más lenta que en {args.baseline}")
+            return 0
+        print(f"\n⚠️ Etapas más lentas que en {args.baseline}:")
+        for size, name, before, now, ratio in regressions:
+            print(f"  {size} mensajes · {name}: {before:.3f}s → {now:.3f}s ({ratio}x)")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
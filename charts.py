@@ -0,0 +1,315 @@
+"""
+Renderizado de las gráficas del chat.
+
+Cada gráfica se dibuja con la API orientada a objetos de matplotlib (``Figure``),
+sin el estado global de pyplot, a partir de datos ya agregados (series pequeñas
+y frecuencias de palabras). Por eso pueden dibujarse en paralelo en un pool de
+procesos y llamarse desde varios hilos del servidor WSGI a la vez.
+
+matplotlib y wordcloud se importan al dibujar la primera gráfica, no al
+importar el módulo, para que la aplicación arranque sin cargarlos.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from instrumentation import debug, lazy_import
+
+# Procesos para dibujar las gráficas (1 = dibujar en el propio proceso)
+PLOT_WORKERS = int(os.environ.get('PLOT_WORKERS', min(6, os.cpu_count() or 1)))
+
+# Fuentes disponibles para las nubes de palabras, de las que trae matplotlib (None = la de wordcloud)
+WORDCLOUD_FONTS = {
+    'default': None,
+    'sans': 'DejaVuSans.ttf',
+    'sans-bold': 'DejaVuSans-Bold.ttf',
+    'serif': 'DejaVuSerif.ttf'
+}
+
+# Parámetros por defecto de la nube de palabras de un miembro y sus límites
+WORDCLOUD_DEFAULTS = {'max_words': 100, 'width': 800, 'height': 400, 'font': 'default'}
+WORDCLOUD_LIMITS = {'max_words': (10, 300), 'width': (200, 2000), 'height': (100, 1200)}
+
+_executor = None
+_executor_lock = threading.Lock()
+_matplotlib_ready = False
+
+
+# Formatos de imagen que se pueden servir y su tipo MIME
+IMAGE_FORMATS = {
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'svg': 'image/svg+xml'
+}
+
+
+def figure_to_bytes(fig, fmt='png', **kwargs):
+    """Codifica una figura en el formato indicado ('png' o 'svg')"""
+    img = BytesIO()
+    fig.savefig(img, format=fmt, bbox_inches='tight', **kwargs)
+    return img.getvalue()
+
+
+def _figure(**kwargs):
+    """Crea una figura, importando matplotlib la primera vez"""
+    global _matplotlib_ready
+    if not _matplotlib_ready:
+        # pandas dibuja a través de pyplot: backend sin ventana antes de usarlo
+        lazy_import('matplotlib').use('Agg')
+        _matplotlib_ready = True
+    return lazy_import('matplotlib.figure').Figure(**kwargs)
+
+
+def _font_path(font):
+    """Ruta de una fuente de ``WORDCLOUD_FONTS``"""
+    if WORDCLOUD_FONTS[font] is None:
+        return None
+    return os.path.join(lazy_import('matplotlib').get_data_path(), 'fonts', 'ttf', WORDCLOUD_FONTS[font])
+
+
+def render_messages_per_person(messages_per_person):
+    """Top 20 de mensajes por persona"""
+    fig = _figure(figsize=(12, 6))
+    ax = fig.subplots()
+    messages_per_person.plot(kind='bar', color='skyblue', ax=ax)
+    ax.set_title('Top 20: Mensajes por persona')
+    ax.set_xlabel('Miembro')
+    ax.set_ylabel('Número de mensajes')
+    ax.tick_params(axis='x', labelrotation=45)
+    return fig
+
+
+def render_daily_activity(daily_activity):
+    """Actividad a lo largo del tiempo"""
+    fig = _figure(figsize=(12, 6))
+    ax = fig.subplots()
+    daily_activity.plot(kind='line', color='green', ax=ax)
+    ax.set_title('Actividad diaria del chat')
+    ax.set_xlabel('Fecha')
+    ax.set_ylabel('Número de mensajes')
+    return fig
+
+
+def render_message_types(type_counts):
+    """Distribución de tipos de mensajes"""
+    fig = _figure(figsize=(8, 8))
+    ax = fig.subplots()
+    type_counts.plot(kind='pie', autopct='%1.1f%%', colors=['lightcoral', 'lightblue'], ax=ax)
+    ax.set_title('Distribución de tipos de mensajes')
+    return fig
+
+
+def render_hourly_activity(hourly_activity):
+    """Actividad por hora del día"""
+    fig = _figure(figsize=(12, 6))
+    ax = fig.subplots()
+    hourly_activity.plot(kind='bar', ax=ax)
+    ax.set_title('Actividad por hora del día')
+    ax.set_xlabel('Hora')
+    ax.set_ylabel('Número de mensajes')
+    return fig
+
+
+def render_weekly_activity(weekly_activity):
+    """Actividad por día de la semana"""
+    fig = _figure(figsize=(12, 6))
+    ax = fig.subplots()
+    weekly_activity.plot(kind='bar', ax=ax)
+    ax.set_title('Actividad por día de la semana')
+    ax.set_xlabel('Día')
+    ax.set_ylabel('Número de mensajes')
+    return fig
+
+
+def render_wordcloud(frequencies, width=1200, height=600, max_words=150, figsize=(15, 7.5), title=None,
+                     font_path=None):
+    """Nube de palabras a partir de frecuencias ya calculadas"""
+    wordcloud = lazy_import('wordcloud').WordCloud(
+        width=width,
+        height=height,
+        background_color='white',
+        max_words=max_words,
+        collocations=False,
+        font_path=font_path
+    ).generate_from_frequencies(frequencies)
+
+    fig = _figure(figsize=figsize)
+    ax = fig.subplots()
+    ax.imshow(wordcloud, interpolation='bilinear')
+    ax.axis('off')
+    if title:
+        ax.set_title(title)
+    return fig
+
+
+def render_group_wordcloud(frequencies):
+    """Nube de palabras general del grupo"""
+    return render_wordcloud(frequencies, title='Palabras más usadas en el grupo')
+
+
+def wordcloud_params(values=None):
+    """
+    Valida los parámetros de la nube de palabras de un miembro.
+
+    Args:
+        values: Diccionario con max_words, width, height y font (los que falten
+            toman el valor por defecto)
+
+    Returns:
+        Diccionario completo de parámetros
+
+    Raises:
+        ValueError: Si algún parámetro no es válido
+    """
+    params = dict(WORDCLOUD_DEFAULTS)
+    for key, value in (values or {}).items():
+        if key not in params or value is None:
+            continue
+        if key == 'font':
+            if value not in WORDCLOUD_FONTS:
+                raise ValueError(f"Fuente no válida: {value}")
+            params[key] = value
+            continue
+        low, high = WORDCLOUD_LIMITS[key]
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Valor no válido para {key}: {value}")
+        if not low <= value <= high:
+            raise ValueError(f"{key} debe estar entre {low} y {high}")
+        params[key] = value
+    return params
+
+
+def render_member_wordcloud(data):
+    """Nube de palabras de un miembro a partir de (frecuencias, parámetros de ``wordcloud_params``)"""
+    frequencies, params = data
+    return render_wordcloud(
+        frequencies,
+        width=params['width'],
+        height=params['height'],
+        max_words=params['max_words'],
+        # Misma escala que la nube original de 800x400 en 10x5 pulgadas
+        figsize=(params['width'] / 80, params['height'] / 80),
+        font_path=_font_path(params['font'])
+    )
+
+
+RENDERERS = {
+    'messages_per_person': render_messages_per_person,
+    'daily_activity': render_daily_activity,
+    'message_types': render_message_types,
+    'hourly_activity': render_hourly_activity,
+    'weekly_activity': render_weekly_activity,
+    'group_wordcloud': render_group_wordcloud
+}
+
+# Imágenes que no forman parte del análisis general y se dibujan bajo demanda
+IMAGE_RENDERERS = {
+    **RENDERERS,
+    'member_wordcloud': render_member_wordcloud
+}
+
+# Opciones de guardado propias de algunas imágenes
+SAVE_OPTIONS = {
+    'member_wordcloud': {'pad_inches': 0}
+}
+
+
+def render_image(name, data, fmt='png'):
+    """Dibuja una imagen y la devuelve codificada en el formato indicado"""
+    return figure_to_bytes(IMAGE_RENDERERS[name](data), fmt, **SAVE_OPTIONS.get(name, {}))
+
+
+def render_chart(name, data):
+    """
+    Dibuja una gráfica como PNG.
+
+    Returns:
+        Tupla (nombre, PNG, segundos de renderizado)
+    """
+    start = time.perf_counter()
+    png = render_image(name, data)
+    return name, png, time.perf_counter() - start
+
+
+def _get_executor():
+    """Crea bajo demanda el pool de procesos compartido (seguro entre hilos)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # 'spawn' evita heredar el estado de los hilos del servidor al hacer fork
+            _executor = ProcessPoolExecutor(
+                max_workers=PLOT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def _reset_executor():
+    """Descarta el pool si uno de sus procesos murió"""
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def _render_sequential(chart_data, on_chart=None, skip=()):
+    """Dibuja las gráficas una tras otra en el proceso actual"""
+    results = []
+    for name, data in chart_data.items():
+        if name in skip:
+            continue
+        try:
+            result = render_chart(name, data)
+        except Exception as e:
+            debug(f"Error generando la gráfica {name}: {str(e)}")
+            continue
+        results.append(result)
+        if on_chart:
+            on_chart(*result)
+    return results
+
+
+def render_charts(chart_data, on_chart=None):
+    """
+    Dibuja varias gráficas en paralelo.
+
+    Args:
+        chart_data: Diccionario nombre de gráfica -> datos agregados
+        on_chart: Función opcional ``on_chart(nombre, png, segundos)`` llamada
+            en cuanto cada gráfica está lista
+
+    Returns:
+        Tupla (plots, timings): PNG y segundos de renderizado por gráfica
+    """
+    if PLOT_WORKERS <= 1:
+        results = _render_sequential(chart_data, on_chart)
+    else:
+        results = []
+        try:
+            executor = _get_executor()
+            futures = {executor.submit(render_chart, name, data): name for name, data in chart_data.items()}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    debug(f"Error generando la gráfica {futures[future]}: {str(e)}")
+                    continue
+                results.append(result)
+                if on_chart:
+                    on_chart(*result)
+        except BrokenProcessPool:
+            debug("El pool de gráficas se interrumpió; se dibuja en el proceso actual")
+            _reset_executor()
+            done = {name for name, _, _ in results}
+            results += _render_sequential(chart_data, on_chart, skip=done)
+
+    plots = {name: png for name, png, _ in results}
+    timings = {name: round(seconds, 4) for name, _, seconds in results}
+    return plots, timings
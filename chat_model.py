@@ -0,0 +1,97 @@
+"""
+Representación compacta en memoria de un chat.
+
+El DataFrame del chat solo guarda las columnas base:
+
+- ``datetime``: datetime64[ns] (un int64 por mensaje)
+- ``sender`` y ``type``: categóricas (un código por mensaje + el diccionario de valores)
+- ``message``: texto del mensaje
+
+Los campos de calendario (hora, día de la semana) no se guardan; se calculan
+bajo demanda desde ``datetime`` con el accessor ``df.chat``.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+DAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+MESSAGE_TYPES = ['media', 'text']
+
+
+@pd.api.extensions.register_dataframe_accessor('chat')
+class ChatAccessor:
+    """Campos derivados de ``datetime``, calculados al pedirlos"""
+
+    def __init__(self, df):
+        self._df = df
+
+    @property
+    def hour(self):
+        """Hora del día de cada mensaje (0-23)"""
+        return self._df['datetime'].dt.hour
+
+    @property
+    def weekday(self):
+        """Día de la semana de cada mensaje (0 = lunes)"""
+        return self._df['datetime'].dt.dayofweek
+
+    @property
+    def day_of_week(self):
+        """Nombre en inglés del día de la semana de cada mensaje"""
+        return self._df['datetime'].dt.day_name()
+
+
+def compact_chat(df):
+    """
+    Convierte un DataFrame de chat a la representación compacta.
+
+    Codifica ``sender`` y ``type`` como categóricas y elimina las columnas
+    derivadas ``hour`` y ``day_of_week`` si existen.
+    """
+    df = df.drop(columns=[c for c in ('hour', 'day_of_week') if c in df.columns])
+    if df['sender'].dtype != 'category':
+        df['sender'] = df['sender'].astype('category')
+    if 'type' in df.columns and df['type'].dtype != 'category':
+        df['type'] = pd.Categorical(df['type'], categories=MESSAGE_TYPES)
+    return df
+
+
+def _object_column_bytes(codes, values, n):
+    """Bytes que ocuparía como columna de objetos Python una columna codificada"""
+    sizes = np.array([sys.getsizeof(v) for v in values], dtype=np.int64)
+    counts = np.bincount(codes[codes >= 0], minlength=len(values))
+    return 8 * n + int(counts @ sizes)
+
+
+def memory_report(df):
+    """
+    Compara la memoria por mensaje de la representación compacta con la anterior.
+
+    La representación anterior (sender/type/day_of_week como cadenas por fila y
+    hour materializada) se estima sin construirla, con el mismo criterio que
+    ``memory_usage(deep=True)``.
+
+    Returns:
+        Diccionario con los bytes por mensaje de cada representación
+    """
+    n = len(df)
+    if n == 0:
+        return {'legacy_bytes_per_message': 0, 'compact_bytes_per_message': 0}
+
+    compact = int(df.memory_usage(deep=True).sum())
+    legacy = compact
+    for column in ('sender', 'type'):
+        if column in df.columns and df[column].dtype == 'category':
+            codes = df[column].cat.codes.to_numpy()
+            legacy += _object_column_bytes(codes, df[column].cat.categories, n)
+            legacy -= int(df[column].memory_usage(deep=True, index=False))
+    # Columnas derivadas que antes se materializaban
+    legacy += 4 * n  # hour (int32)
+    legacy += _object_column_bytes(df.chat.weekday.to_numpy(), DAY_ORDER, n)
+
+    return {
+        'legacy_bytes_per_message': round(legacy / n, 1),
+        'compact_bytes_per_message': round(compact / n, 1)
+    }
@@ -0,0 +1,456 @@
+"""
+Parser incremental de exportaciones de chat de WhatsApp.
+
+Lee el archivo por bloques, reconstruye los mensajes que ocupan varias líneas
+y entrega lotes columnares (DataFrames), de modo que la memoria máxima del
+parseo depende del tamaño del lote y no del tamaño del archivo.
+
+El formato se detecta con una muestra de los primeros KB del archivo, que
+determina la gramática de línea (iPhone/Android, con o sin segundos, 24h o
+AM/PM) y el formato de fecha (dd/mm o mm/dd, año de 2 o 4 dígitos). El
+archivo se recorre después una sola vez con un único patrón precompilado.
+"""
+import codecs
+import io
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from timestamps import decode_timestamps
+
+# Tamaño de cada lectura del archivo (bytes o caracteres)
+CHUNK_SIZE = 1 << 20
+# Número de mensajes por lote columnar
+BATCH_SIZE = 50_000
+# Caracteres del inicio del archivo usados para detectar el formato
+SNIFF_SIZE = 64 * 1024
+
+# Línea que empieza con fecha pero no tiene remitente (mensajes del sistema)
+SYSTEM_LINE = re.compile(r'\[?\d{1,2}/\d{1,2}/\d{2,4},?\s\d{1,2}:\d{2}')
+
+# Caracteres invisibles que WhatsApp antepone a algunas líneas
+LINE_PREFIX_CHARS = '\ufeff\u200e\u200f'
+
+# Ejemplos de fechas no válidas que se guardan en las estadísticas del parseo
+MAX_UNPARSED_SAMPLES = 5
+
+# Codificación con la que se leen los bytes que no son UTF-8 válido (exportaciones antiguas de Windows)
+FALLBACK_ENCODING = 'cp1252'
+
+# Decodificador que está trabajando en cada hilo, para contar los bytes de reserva
+_decoding = threading.local()
+
+
+def _decode_fallback(error):
+    """Lee como ``FALLBACK_ENCODING`` los bytes que no son UTF-8 válido en lugar de fallar"""
+    invalid = error.object[error.start:error.end]
+    decoder = getattr(_decoding, 'decoder', None)
+    if decoder is not None:
+        decoder.fallback_bytes += len(invalid)
+    return invalid.decode(FALLBACK_ENCODING, errors='replace'), error.end
+
+
+codecs.register_error('chat_fallback', _decode_fallback)
+
+
+class ChatFormat:
+    """
+    Gramática de línea de una exportación de WhatsApp.
+
+    Cada patrón captura cuatro grupos: fecha, hora, remitente y mensaje.
+    """
+
+    def __init__(self, name, device_type, seconds, ampm):
+        self.name = name
+        self.device_type = device_type
+        self.seconds = seconds
+        self.ampm = ampm
+
+        time_pattern = r'\d{1,2}:\d{2}'
+        time_format = '%I:%M' if ampm else '%H:%M'
+        if seconds:
+            time_pattern += r':\d{2}'
+            time_format += ':%S'
+        if ampm:
+            time_pattern += r'\s?[APap]\.?\s?[Mm]\.?'
+            time_format += ' %p'
+        self.time_format = time_format
+
+        date_pattern = r'(\d{1,2}/\d{1,2}/\d{2,4}),?\s'
+        if device_type == 'iphone':
+            # Formato iPhone: "[dd/mm/yy, HH:MM:SS] Nombre: Mensaje"
+            regex = r'\[' + date_pattern + '(' + time_pattern + r')\]\s([^:]+):\s(.+)'
+        else:
+            # Formato Android: "dd/mm/yy, HH:MM - Nombre: Mensaje"
+            regex = date_pattern + '(' + time_pattern + r')\s-\s([^:]+):\s(.+)'
+        self.pattern = re.compile(regex)
+
+    def __repr__(self):
+        return f'ChatFormat({self.name!r})'
+
+
+# Formatos conocidos, en orden de preferencia en caso de empate
+FORMATS = [
+    ChatFormat('iphone_seconds', 'iphone', seconds=True, ampm=False),
+    ChatFormat('iphone', 'iphone', seconds=False, ampm=False),
+    ChatFormat('iphone_seconds_ampm', 'iphone', seconds=True, ampm=True),
+    ChatFormat('iphone_ampm', 'iphone', seconds=False, ampm=True),
+    ChatFormat('android', 'android', seconds=False, ampm=False),
+    ChatFormat('android_ampm', 'android', seconds=False, ampm=True),
+]
+
+DEVICE_TYPES = ('android', 'iphone')
+
+
+def get_format(name):
+    """Devuelve el formato conocido con ese nombre, o None"""
+    return next((chat_format for chat_format in FORMATS if chat_format.name == name), None)
+
+
+class ChunkDecoder:
+    """
+    Decodificador incremental de los bloques binarios de un archivo de chat.
+
+    La codificación se elige con el primer bloque: UTF-16 si empieza por su
+    BOM y, si no, UTF-8 (quitando el BOM si lo hay). Los bytes que no son
+    UTF-8 válido no hacen fallar la lectura: se leen como ``FALLBACK_ENCODING``
+    y se cuentan en ``fallback_bytes``. Las secuencias partidas entre dos
+    bloques se completan con el bloque siguiente.
+    """
+
+    def __init__(self, encoding='utf-8'):
+        self.default_encoding = encoding
+        self.encoding = None
+        self.fallback_bytes = 0
+        self._decoder = None
+
+    def decode(self, chunk, final=False):
+        if self._decoder is None:
+            if chunk.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+                self.encoding = codec = 'utf-16'
+                errors = 'replace'
+            elif codecs.lookup(self.default_encoding).name == 'utf-8':
+                self.encoding, codec = 'utf-8', 'utf-8-sig'
+                errors = 'chat_fallback'
+            else:
+                self.encoding = codec = self.default_encoding
+                errors = 'replace'
+            self._decoder = codecs.getincrementaldecoder(codec)(errors=errors)
+        _decoding.decoder = self
+        try:
+            return self._decoder.decode(chunk, final)
+        finally:
+            _decoding.decoder = None
+
+
+def iter_lines(source, chunk_size=CHUNK_SIZE, encoding='utf-8', decoder=None):
+    """
+    Genera las líneas de un archivo leyéndolo por bloques.
+
+    Args:
+        source: Texto completo, o un objeto tipo archivo en modo binario o texto
+        chunk_size: Tamaño de cada lectura
+        encoding: Codificación usada para los bloques binarios (sin BOM de UTF-16)
+        decoder: ChunkDecoder opcional, para consultar después la codificación usada
+
+    Returns:
+        Generador de líneas sin el salto de línea final
+    """
+    if isinstance(source, str):
+        source = io.StringIO(source)
+
+    decoder = decoder or ChunkDecoder(encoding)
+    binary = False
+    pending = ''
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            binary = True
+            chunk = decoder.decode(chunk)
+        pending += chunk
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+
+    if binary:
+        pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending.rstrip('\r')
+
+
+def detect_date_format(dates):
+    """
+    Determina el orden de día y mes y los dígitos del año.
+
+    Args:
+        dates: Fechas de ejemplo en texto ("dd/mm/yy")
+
+    Returns:
+        Formato de fecha para ``strptime`` (por defecto día primero)
+    """
+    day_first = True
+    long_year = False
+    for date in dates:
+        first, second, year = date.split('/')
+        long_year = long_year or len(year) == 4
+        if int(first) > 12:
+            day_first = True
+            break
+        if int(second) > 12:
+            day_first = False
+            break
+    year_format = '%Y' if long_year else '%y'
+    return f'%d/%m/{year_format}' if day_first else f'%m/%d/{year_format}'
+
+
+def detect_format(lines, device_type='auto'):
+    """
+    Detecta el formato del chat a partir de las primeras líneas.
+
+    Args:
+        lines: Líneas de muestra del inicio del archivo
+        device_type: 'auto' o el tipo de dispositivo para restringir los candidatos
+
+    Returns:
+        Tupla (ChatFormat, formato de fecha) o (None, None) si nada coincide
+    """
+    candidates = [f for f in FORMATS if device_type == 'auto' or f.device_type == device_type]
+    best, best_dates = None, []
+    for chat_format in candidates:
+        dates = []
+        for line in lines:
+            match = chat_format.pattern.match(line)
+            if match:
+                dates.append(match.group(1))
+        if len(dates) > len(best_dates):
+            best, best_dates = chat_format, dates
+
+    if best is None:
+        return None, None
+    return best, detect_date_format(best_dates)
+
+
+class _CountingReader:
+    """Envuelve un objeto tipo archivo y cuenta lo leído"""
+
+    def __init__(self, source):
+        self.source = source
+        self.count = 0
+
+    def read(self, size=-1):
+        chunk = self.source.read(size)
+        self.count += len(chunk)
+        return chunk
+
+
+class _ColumnBuffer:
+    """
+    Columna que crece por lotes sobre un solo array de numpy.
+
+    La capacidad se duplica al llenarse y al terminar se recorta en el sitio,
+    así que nunca se guardan los lotes por separado.
+    """
+
+    def __init__(self, dtype, capacity):
+        self.values = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        end = self.size + len(values)
+        if end > len(self.values):
+            self.values.resize(max(end, 2 * len(self.values)), refcheck=False)
+        self.values[self.size:end] = values
+        self.size = end
+
+    def finish(self):
+        """Array con los valores añadidos (el buffer deja de usarse)"""
+        self.values.resize(self.size, refcheck=False)
+        return self.values
+
+
+class StreamingChatParser:
+    """
+    Parser de chats de WhatsApp que procesa el archivo línea a línea.
+
+    El formato se detecta con las líneas de los primeros ``SNIFF_SIZE``
+    caracteres, salvo que se indique ya conocido (``chat_format`` y
+    ``date_format``). Las líneas que no empiezan un mensaje nuevo se añaden
+    como continuación del mensaje anterior.
+    """
+
+    def __init__(self, device_type='auto', batch_size=BATCH_SIZE, chunk_size=CHUNK_SIZE,
+                 sniff_size=SNIFF_SIZE, chat_format=None, date_format=None):
+        if device_type != 'auto' and device_type not in DEVICE_TYPES:
+            raise ValueError("Tipo de dispositivo no válido")
+        self.device_type = device_type
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.sniff_size = sniff_size
+        self.chat_format = chat_format
+        self.date_format = date_format
+        self.head_lines = []
+        self.decoder = ChunkDecoder()
+        # Líneas no vacías antes del primer mensaje que no son del sistema
+        self.orphan_lines = 0
+        # Mensajes descartados por tener una fecha u hora imposible
+        self.unparsed_rows = 0
+        self.unparsed_samples = []
+        self.messages_parsed = 0
+        self.bytes_read = 0
+        self.elapsed = 0.0
+        # Partes del tiempo de parseo dedicadas a detectar el formato y a convertir fechas y horas
+        self.detect_seconds = 0.0
+        self.timestamp_seconds = 0.0
+
+    def _sniff(self, lines):
+        """Lee líneas hasta reunir la muestra y detecta el formato"""
+        sample, size = [], 0
+        for line in lines:
+            if len(self.head_lines) < 3:
+                self.head_lines.append(line)
+            sample.append(line.lstrip(LINE_PREFIX_CHARS))
+            size += len(line) + 1
+            if size >= self.sniff_size:
+                break
+        if self.chat_format is None:
+            start = time.perf_counter()
+            self.chat_format, self.date_format = detect_format(sample, self.device_type)
+            self.detect_seconds = time.perf_counter() - start
+        return sample
+
+    def _iter_stripped(self, sample, lines):
+        """Genera las líneas de la muestra y luego el resto del archivo"""
+        yield from sample
+        for line in lines:
+            yield line.lstrip(LINE_PREFIX_CHARS)
+
+    def iter_messages(self, source):
+        """Genera tuplas (fecha, hora, remitente, mensaje) con los mensajes completos"""
+        lines = iter_lines(source, self.chunk_size, decoder=self.decoder)
+        sample = self._sniff(lines)
+        if self.chat_format is None:
+            return
+
+        pattern = self.chat_format.pattern
+        current = None
+        for line in self._iter_stripped(sample, lines):
+            match = pattern.match(line)
+            if match:
+                if current is not None:
+                    yield current[0], current[1], current[2], '\n'.join(current[3])
+                current = (match.group(1), match.group(2), match.group(3), [match.group(4)])
+            elif SYSTEM_LINE.match(line):
+                # Mensaje del sistema: cierra el mensaje actual y se descarta
+                if current is not None:
+                    yield current[0], current[1], current[2], '\n'.join(current[3])
+                current = None
+            elif current is not None:
+                current[3].append(line)
+            elif line.strip():
+                self.orphan_lines += 1
+        if current is not None:
+            yield current[0], current[1], current[2], '\n'.join(current[3])
+
+    def _build_batch(self, dates, times, senders, messages):
+        """
+        Crea un lote columnar con las fechas ya convertidas.
+
+        Los mensajes con una fecha u hora imposible se descartan y se cuentan
+        en ``unparsed_rows``, con algunos ejemplos en ``unparsed_samples``.
+        """
+        start = time.perf_counter()
+        timestamps, valid = decode_timestamps(dates, times, day_first=self.date_format.startswith('%d'),
+                                              ampm=self.chat_format.ampm)
+        self.timestamp_seconds += time.perf_counter() - start
+        if not valid.all():
+            invalid = np.flatnonzero(~valid)
+            self.unparsed_rows += len(invalid)
+            for i in invalid[:MAX_UNPARSED_SAMPLES - len(self.unparsed_samples)]:
+                self.unparsed_samples.append(f'{dates[i]} {times[i]} - {senders[i]}')
+            keep = np.flatnonzero(valid)
+            timestamps = timestamps[keep]
+            senders = [senders[i] for i in keep]
+            messages = [messages[i] for i in keep]
+
+        self.messages_parsed += len(timestamps)
+        return pd.DataFrame({
+            'datetime': timestamps.view('datetime64[ns]'),
+            'sender': pd.Categorical(senders),
+            'message': messages
+        })
+
+    def iter_batches(self, source):
+        """Genera DataFrames de como máximo ``batch_size`` mensajes"""
+        dates, times, senders, messages = [], [], [], []
+        for date, time_, sender, message in self.iter_messages(source):
+            dates.append(date)
+            times.append(time_)
+            senders.append(sender)
+            messages.append(message)
+            if len(dates) >= self.batch_size:
+                yield self._build_batch(dates, times, senders, messages)
+                dates, times, senders, messages = [], [], [], []
+        if dates:
+            yield self._build_batch(dates, times, senders, messages)
+
+    def parse(self, source):
+        """
+        Parsea el chat completo.
+
+        Returns:
+            DataFrame con las columnas datetime, sender (categórica) y message, o None si
+            no se reconoce el formato o ningún mensaje tiene una fecha válida. Las
+            estadísticas del parseo quedan en ``df.attrs['parse_stats']``.
+        """
+        start = time.perf_counter()
+        reader = source if isinstance(source, str) else _CountingReader(source)
+        # Cada lote se copia a las columnas finales en cuanto llega y se descarta:
+        # nunca están a la vez en memoria todos los lotes y la tabla completa
+        timestamps = _ColumnBuffer('int64', self.batch_size)
+        messages = _ColumnBuffer(object, self.batch_size)
+        sender_codes = _ColumnBuffer('int32', self.batch_size)
+        sender_index = {}
+        for batch in self.iter_batches(reader):
+            timestamps.extend(batch['datetime'].to_numpy().view('int64'))
+            messages.extend(batch['message'].to_numpy())
+            # Los códigos del lote se traducen a los de todos los remitentes vistos
+            categories = batch['sender'].cat
+            mapping = np.array([sender_index.setdefault(name, len(sender_index)) for name in categories.categories],
+                               dtype='int32')
+            sender_codes.extend(mapping[categories.codes.to_numpy()])
+        self.bytes_read = len(source.encode('utf-8')) if isinstance(source, str) else reader.count
+        self.elapsed = time.perf_counter() - start
+        if self.messages_parsed == 0:
+            return None
+        df = pd.DataFrame({
+            'datetime': timestamps.finish().view('datetime64[ns]'),
+            'sender': pd.Categorical.from_codes(sender_codes.finish(), categories=list(sender_index)),
+            'message': messages.finish()
+        }, copy=False)
+        df.attrs['parse_stats'] = self.stats()
+        return df
+
+    def stats(self):
+        """Devuelve el formato detectado y el rendimiento del parseo"""
+        seconds = self.elapsed
+        return {
+            'format': self.chat_format.name if self.chat_format else None,
+            'device_type': self.chat_format.device_type if self.chat_format else None,
+            'date_format': self.date_format,
+            'encoding': self.decoder.encoding,
+            'fallback_bytes': self.decoder.fallback_bytes,
+            'messages': self.messages_parsed,
+            'unparsed_rows': self.unparsed_rows,
+            'unparsed_samples': self.unparsed_samples,
+            'bytes': self.bytes_read,
+            'seconds': round(seconds, 4),
+            'detect_seconds': round(self.detect_seconds, 4),
+            'timestamp_seconds': round(self.timestamp_seconds, 4),
+            'mb_per_s': round(self.bytes_read / 1e6 / seconds, 2) if seconds > 0 else None
+        }
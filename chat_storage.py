@@ -0,0 +1,113 @@
+"""
+Formato binario columnar para chats ya parseados.
+
+Un chat parseado se guarda como archivo Arrow IPC (Feather v2) sin compresión,
+de modo que al volver a abrirlo se mapea en memoria: no hay que parsear el
+texto ni convertir fechas, y solo se leen del disco las columnas pedidas.
+Por convención el archivo binario vive junto a la exportación de texto
+(``chats/grupo.txt`` -> ``chats/grupo.arrow``).
+"""
+import json
+import os
+
+import pyarrow as pa
+
+from chat_model import compact_chat
+from chat_parser import StreamingChatParser
+
+BINARY_SUFFIX = '.arrow'
+# Firma con la que empiezan los archivos Arrow IPC
+ARROW_MAGIC = b'ARROW1'
+# Clave de los metadatos propios en el esquema Arrow
+METADATA_KEY = b'whatsapp_analyzer'
+FORMAT_VERSION = 1
+
+
+def binary_path(txt_path):
+    """Ruta del archivo binario correspondiente a una exportación de texto"""
+    return os.path.splitext(txt_path)[0] + BINARY_SUFFIX
+
+
+def is_binary_chat(source):
+    """Indica si un objeto tipo archivo binario contiene un chat en formato Arrow"""
+    if isinstance(source, str) or not hasattr(source, 'seek'):
+        return False
+    head = source.read(len(ARROW_MAGIC))
+    source.seek(0)
+    return head == ARROW_MAGIC
+
+
+def write_chat(df, sink):
+    """Escribe un chat en formato Arrow IPC en un destino de pyarrow o archivo"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[METADATA_KEY] = json.dumps({
+        'version': FORMAT_VERSION,
+        'parse_stats': df.attrs.get('parse_stats')
+    }).encode('utf-8')
+    table = table.replace_schema_metadata(metadata)
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def save_chat(df, path):
+    """Guarda un chat en disco de forma atómica"""
+    tmp_path = path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        write_chat(df, sink)
+    os.replace(tmp_path, path)
+
+
+def chat_to_bytes(df):
+    """Serializa un chat en formato Arrow IPC y devuelve los bytes"""
+    sink = pa.BufferOutputStream()
+    write_chat(df, sink)
+    return sink.getvalue().to_pybytes()
+
+
+def load_chat(source, columns=None):
+    """
+    Carga un chat guardado en formato Arrow.
+
+    Args:
+        source: Ruta del archivo (se mapea en memoria) u objeto tipo archivo
+        columns: Columnas a cargar; por defecto todas
+
+    Returns:
+        DataFrame del chat con las estadísticas del parseo en ``df.attrs``
+    """
+    if isinstance(source, (str, os.PathLike)):
+        # Las columnas no pedidas nunca se leen: solo se tocan sus páginas al convertirlas
+        source = pa.memory_map(os.fspath(source), 'r')
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select([c for c in columns if c in table.column_names])
+
+    df = table.to_pandas()
+    metadata = json.loads((table.schema.metadata or {}).get(METADATA_KEY, b'{}'))
+    if metadata.get('parse_stats'):
+        df.attrs['parse_stats'] = metadata['parse_stats']
+    return df
+
+
+def load_or_parse(txt_path, device_type='auto', columns=None):
+    """
+    Carga un chat prefiriendo su versión binaria si existe junto al ``.txt``.
+
+    Si no existe, o es más antigua que el texto, el ``.txt`` se parsea y el
+    resultado se guarda en formato binario para la próxima vez.
+
+    Returns:
+        DataFrame del chat, o None si no se reconoce el formato
+    """
+    arrow_path = binary_path(txt_path)
+    if os.path.exists(arrow_path) and os.path.getmtime(arrow_path) >= os.path.getmtime(txt_path):
+        return load_chat(arrow_path, columns)
+
+    with open(txt_path, 'rb') as f:
+        df = StreamingChatParser(device_type).parse(f)
+    if df is None:
+        return None
+    df = compact_chat(df)
+    save_chat(df, arrow_path)
+    return df[columns] if columns is not None else df
@@ -0,0 +1,111 @@
+"""
+Almacén en memoria de chats procesados, compartido entre peticiones.
+
+Cada chat se guarda bajo su propio identificador, de modo que varias
+sesiones pueden trabajar a la vez sin pisarse. Cuando el tamaño total
+supera el presupuesto de bytes se expulsan los chats usados hace más tiempo
+(LRU).
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def estimate_size(df):
+    """Tamaño en bytes de un DataFrame, incluyendo el contenido de las cadenas"""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _value_size(value):
+    """
+    Tamaño aproximado en bytes de un valor de una entrada.
+
+    Los índices (conteos, palabras, búsqueda) indican el suyo en ``nbytes``;
+    las listas y diccionarios (miembros, series, ids de gráficas) se recorren.
+    """
+    if isinstance(value, pd.DataFrame):
+        return estimate_size(value)
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    nbytes = getattr(value, 'nbytes', None)
+    if nbytes is not None:
+        return nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_value_size(k) + _value_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_value_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def _entry_size(entry):
+    """Tamaño aproximado en bytes de un chat: la tabla de mensajes más sus índices y resultados"""
+    return sum(_value_size(value) for value in entry.values())
+
+
+class ChatStore:
+    """
+    Caché LRU de chats con presupuesto de memoria.
+
+    Cada entrada es un diccionario con al menos la clave ``df``; el resto de
+    claves (miembros, índice de palabras, ...) se guardan tal cual.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def put(self, chat_id, entry):
+        """Guarda un chat y expulsa los menos usados si se supera el presupuesto"""
+        size = _entry_size(entry)
+        with self._lock:
+            if chat_id in self._entries:
+                self.total_bytes -= self._sizes.pop(chat_id)
+                del self._entries[chat_id]
+            self._entries[chat_id] = entry
+            self._sizes[chat_id] = size
+            self.total_bytes += size
+            self._evict()
+
+    def get(self, chat_id):
+        """Devuelve el chat guardado o None, y lo marca como usado recientemente"""
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(chat_id)
+            self.hits += 1
+            return entry
+
+    def _evict(self):
+        """Expulsa entradas LRU hasta cumplir el presupuesto (se conserva siempre la más reciente)"""
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            chat_id, _ = self._entries.popitem(last=False)
+            self.total_bytes -= self._sizes.pop(chat_id)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, chat_id):
+        return chat_id in self._entries
+
+    def stats(self):
+        """Contadores del almacén"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,188 @@
+"""
+Almacén en disco de las imágenes de las gráficas, direccionado por contenido.
+
+Cada imagen se identifica por el SHA-256 de su PNG, así que su URL no cambia
+mientras no cambie la imagen y el navegador puede guardarla en caché sin
+límite de tiempo. El PNG se guarda al dibujar la gráfica; los demás formatos
+se generan la primera vez que se piden: WebP convirtiendo el PNG y SVG
+volviendo a dibujar la gráfica a partir de sus datos agregados, que se guardan
+junto a la imagen.
+"""
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+import threading
+from io import BytesIO
+
+from PIL import Image
+
+from charts import IMAGE_FORMATS, render_image
+
+# Identificador válido de imagen (SHA-256 en hexadecimal)
+IMAGE_ID = re.compile(r'^[0-9a-f]{64}$')
+
+# Sufijo del archivo con los datos para volver a dibujar una imagen
+SOURCE_SUFFIX = '.src'
+# Al superar el tamaño máximo se borra hasta esta fracción, para no recorrer el directorio en cada imagen
+EVICT_TARGET = 0.9
+
+
+class ImageStore:
+    """
+    Imágenes guardadas como un archivo por formato (``<id>.png``, ``<id>.webp``...).
+
+    Cuando el directorio supera el tamaño máximo se borran todas las versiones
+    de las imágenes usadas hace más tiempo, según la fecha de modificación del
+    PNG, que se actualiza en cada acierto. El tamaño se lleva en
+    ``total_bytes``, que se suma en cada escritura: el directorio solo se
+    recorre al arrancar y al superar el máximo (lo que corrige además lo que
+    hayan escrito o borrado otros procesos).
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conversions = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(size for size, _, _ in self._entries().values())
+
+    def _path(self, image_id, suffix):
+        return os.path.join(self.directory, image_id + suffix)
+
+    def put(self, png, source=None):
+        """
+        Guarda un PNG y devuelve su identificador.
+
+        Args:
+            png: Bytes de la imagen en PNG
+            source: Tupla opcional (nombre de gráfica, datos) para poder
+                volver a dibujarla en formatos vectoriales
+        """
+        image_id = hashlib.sha256(png).hexdigest()
+        path = self._path(image_id, '.png')
+        if os.path.exists(path):
+            # Misma imagen ya guardada: solo se marca como usada
+            os.utime(path)
+            return image_id
+
+        if source is not None:
+            self._write(self._path(image_id, SOURCE_SUFFIX), pickle.dumps(source, protocol=pickle.HIGHEST_PROTOCOL))
+        self._write(path, png)
+        with self._lock:
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+        return image_id
+
+    def contains(self, image_id):
+        return os.path.exists(self._path(image_id, '.png'))
+
+    def get(self, image_id, fmt='png'):
+        """Devuelve los bytes de una imagen en el formato pedido, o None"""
+        if fmt not in IMAGE_FORMATS or not IMAGE_ID.match(image_id):
+            return None
+        png_path = self._path(image_id, '.png')
+        try:
+            with open(self._path(image_id, f'.{fmt}'), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = self._convert(image_id, fmt)
+            if data is None:
+                self.misses += 1
+                return None
+        try:
+            os.utime(png_path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return data
+
+    def _convert(self, image_id, fmt):
+        """Genera y guarda otro formato de una imagen ya guardada"""
+        try:
+            if fmt == 'webp':
+                with Image.open(self._path(image_id, '.png')) as img:
+                    out = BytesIO()
+                    img.save(out, format='WEBP', lossless=True)
+                    data = out.getvalue()
+            elif fmt == 'svg':
+                with open(self._path(image_id, SOURCE_SUFFIX), 'rb') as f:
+                    name, chart_data = pickle.load(f)
+                data = render_image(name, chart_data, 'svg')
+            else:
+                return None
+        except FileNotFoundError:
+            return None
+        self._write(self._path(image_id, f'.{fmt}'), data)
+        self.conversions += 1
+        return data
+
+    def _write(self, path, data):
+        """Escribe un archivo de forma atómica"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        with self._lock:
+            self.total_bytes += len(data)
+
+    def _entries(self):
+        """Agrupa los archivos por imagen: {id: [tamaño total, mtime del PNG, rutas]}"""
+        entries = {}
+        for entry in os.scandir(self.directory):
+            image_id, suffix = os.path.splitext(entry.name)
+            if suffix == '.tmp':
+                continue
+            stat = entry.stat()
+            item = entries.setdefault(image_id, [0, 0.0, []])
+            item[0] += stat.st_size
+            item[2].append(entry.path)
+            if suffix == '.png':
+                item[1] = stat.st_mtime
+        return entries
+
+    def _evict(self):
+        """Borra las imágenes menos usadas hasta quedar en ``EVICT_TARGET`` del tamaño máximo"""
+        entries = sorted(self._entries().values(), key=lambda e: e[1])
+        total = sum(size for size, _, _ in entries)
+        if total <= self.max_bytes:
+            self.total_bytes = total
+            return
+        # Se conserva siempre la imagen más reciente
+        for size, _, paths in entries[:-1]:
+            if total <= self.max_bytes * EVICT_TARGET:
+                break
+            for path in paths:
+                self._remove(path)
+            total -= size
+            self.evictions += 1
+        self.total_bytes = total
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        """Contadores del almacén"""
+        entries = self._entries()
+        return {
+            'images': len(entries),
+            'bytes': sum(size for size, _, _ in entries.values()),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'conversions': self.conversions,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,113 @@
+"""
+Análisis incremental de exportaciones que amplían un chat ya analizado.
+
+Cuando se vuelve a exportar el mismo grupo, el archivo nuevo suele ser el
+anterior más los mensajes de los últimos días. Cada archivo analizado se
+registra con el hash de sus primeros ``HEAD_SIZE`` bytes, su tamaño y el hash
+de su contenido completo. Al subir un archivo se buscan los registrados con el
+mismo inicio y, en la misma pasada que calcula el hash del archivo, se
+comprueba si alguno coincide byte a byte con su principio. En ese caso solo se
+parsea el final nuevo y se suma al resultado guardado, siempre que el primer
+mensaje nuevo no sea anterior al último mensaje ya analizado (la marca de
+tiempo del chat guardado).
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from result_cache import HASH_CHUNK_SIZE
+
+# Bytes del inicio del archivo con los que se agrupan las exportaciones de un mismo chat
+HEAD_SIZE = 4096
+# Archivos recordados por cada inicio
+MAX_ENTRIES_PER_HEAD = 20
+
+
+class PrefixIndex:
+    """
+    Registro en disco de los archivos analizados, agrupados por el hash de su inicio.
+
+    Se guarda un archivo JSON por inicio con una lista de
+    ``{'content_hash', 'size'}``, del más reciente al más antiguo.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, head_hash):
+        return os.path.join(self.directory, f'{head_hash}.json')
+
+    def candidates(self, head_hash):
+        """Archivos registrados que empiezan igual"""
+        try:
+            with open(self._path(head_hash), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def add(self, head_hash, content_hash, size):
+        """Registra un archivo analizado"""
+        with self._lock:
+            entries = [e for e in self.candidates(head_hash) if e['content_hash'] != content_hash]
+            entries.insert(0, {'content_hash': content_hash, 'size': size})
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entries[:MAX_ENTRIES_PER_HEAD], f)
+            os.replace(tmp_path, self._path(head_hash))
+
+
+def scan_stream(stream, prefix_index, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Calcula el hash de un archivo subido y busca un archivo ya analizado que sea su principio.
+
+    Los hashes de los candidatos se comprueban en la misma lectura, copiando
+    el estado del hash al llegar al tamaño de cada uno. El archivo se
+    rebobina al terminar.
+
+    Returns:
+        Tupla (content_hash, head_hash, size, base), donde ``base`` es el
+        registro ``{'content_hash', 'size'}`` del archivo más largo que es
+        principio del subido, o None
+    """
+    head = stream.read(HEAD_SIZE)
+    head_hash = hashlib.sha256(head).hexdigest()
+    # Solo sirven los candidatos más cortos que el archivo y que ocupan más que el inicio
+    pending = sorted((e for e in prefix_index.candidates(head_hash) if e['size'] > len(head)),
+                     key=lambda e: e['size'])
+
+    digest = hashlib.sha256(head)
+    size = len(head)
+    matches = []
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        while pending and pending[0]['size'] <= size + len(chunk):
+            candidate = pending.pop(0)
+            partial = digest.copy()
+            partial.update(chunk[:candidate['size'] - size])
+            if partial.hexdigest() == candidate['content_hash']:
+                matches.append(candidate)
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+
+    # El tamaño total solo se conoce al final: un candidato del mismo tamaño es el propio archivo, no un principio
+    prefixes = [candidate for candidate in matches if candidate['size'] < size]
+    base = max(prefixes, key=lambda candidate: candidate['size']) if prefixes else None
+    return digest.hexdigest(), head_hash, size, base
+
+
+def merge_frames(base_df, new_df):
+    """Añade los mensajes nuevos a la tabla del chat, uniendo las categorías de remitentes"""
+    senders = union_categoricals([base_df['sender'], new_df['sender']])
+    df = pd.concat([base_df.drop(columns='sender'), new_df.drop(columns='sender')], ignore_index=True)
+    df.insert(1, 'sender', senders)
+    return df
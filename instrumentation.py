@@ -0,0 +1,330 @@
+"""
+Instrumentación del análisis: tiempo y memoria por etapa y métricas Prometheus.
+
+Cada etapa del análisis (detección del formato, parseo, conversión de fechas,
+estadísticas de miembros, cada gráfica, nubes de palabras...) se mide con
+``StageRecorder.stage``: tiempo real, mensajes procesados y pico de memoria.
+Las medidas quedan en el ``StageRecorder`` de la petición, para devolverlas
+con el estado del trabajo, y se acumulan en histogramas que ``/metrics``
+expone en el formato de texto de Prometheus (sin depender de
+``prometheus_client``).
+
+El pico de memoria de una etapa es, por defecto, lo que más crece la memoria
+residente actual del proceso durante la etapa respecto a la del principio: un
+hilo la lee cada ``RSS_SAMPLE_SECONDS`` mientras hay etapas en curso (en
+Linux, de ``/proc/self/statm``; en otros sistemas no se mide). Con
+``METRICS_TRACE_MEMORY=1`` se mide con tracemalloc el pico de memoria
+reservada por Python y numpy, más preciso pero bastante más lento. Con varios
+análisis a la vez, en los dos casos la memoria que reservan los demás cuenta
+también en la etapa.
+
+Los mensajes de la consola del análisis (depuración y errores) pasan por
+``debug``, que solo escribe con ``DEBUG_OUTPUT=1``: en producción no hay
+escritura en la consola por cada archivo subido.
+
+Las dependencias pesadas (matplotlib, wordcloud) se importan con
+``lazy_import`` la primera vez que se usan, y el tiempo de cada importación se
+publica en ``analyzer_import_seconds``, junto al tiempo de arranque de la
+aplicación (``analyzer_startup_seconds``).
+"""
+import contextlib
+import importlib
+import math
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Mensajes de depuración en la consola (solo si se activan con DEBUG_OUTPUT=1)
+DEBUG_OUTPUT = os.environ.get('DEBUG_OUTPUT', '0') == '1'
+# Medir el pico de memoria de cada etapa con tracemalloc
+METRICS_TRACE_MEMORY = os.environ.get('METRICS_TRACE_MEMORY', '0') == '1'
+# Cada cuántos segundos se lee la memoria residente mientras hay etapas en curso
+RSS_SAMPLE_SECONDS = 0.01
+
+# Límites de los histogramas: segundos y bytes
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = tuple(2 ** power for power in range(20, 33))  # 1 MB - 4 GB
+
+if METRICS_TRACE_MEMORY:
+    tracemalloc.start()
+
+
+def debug(*args, **kwargs):
+    """``print`` de los mensajes de depuración, que solo se muestran con DEBUG_OUTPUT=1"""
+    if DEBUG_OUTPUT:
+        print(*args, **kwargs)
+
+
+def set_debug_output(enabled):
+    """Activa o desactiva los mensajes de ``debug`` en este proceso"""
+    global DEBUG_OUTPUT
+    DEBUG_OUTPUT = enabled
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Histograma acumulado con etiquetas, como los de Prometheus"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def collect(self):
+        """Líneas del formato de texto de Prometheus"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series['buckets']):
+                    le = _labels(self.labelnames, labels, [('le', _number(bound))])
+                    lines.append(f'{self.name}_bucket{le} {count}')
+                lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(series["sum"])}')
+                lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {series["count"]}')
+        return lines
+
+
+class Counter:
+    """Contador acumulado con etiquetas"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Gauge:
+    """Valor que se sobrescribe, con etiquetas"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+STAGE_SECONDS = Histogram('analyzer_stage_seconds', 'Duración de cada etapa del análisis en segundos', ['stage'])
+STAGE_PEAK_BYTES = Histogram('analyzer_stage_peak_bytes', 'Pico de memoria de cada etapa del análisis en bytes',
+                             ['stage'], buckets=BYTES_BUCKETS)
+STAGE_MESSAGES = Counter('analyzer_stage_messages_total', 'Mensajes procesados por cada etapa del análisis', ['stage'])
+STARTUP_SECONDS = Gauge('analyzer_startup_seconds', 'Segundos que tardó en cargarse la aplicación')
+IMPORT_SECONDS = Gauge('analyzer_import_seconds', 'Segundos que tardó la primera importación de cada dependencia diferida',
+                       ['module'])
+METRICS = [STAGE_SECONDS, STAGE_PEAK_BYTES, STAGE_MESSAGES, STARTUP_SECONDS, IMPORT_SECONDS]
+
+
+def render_metrics():
+    """Todas las métricas en el formato de texto de Prometheus"""
+    return '\n'.join(line for metric in METRICS for line in metric.collect()) + '\n'
+
+
+def lazy_import(name):
+    """Importa un módulo la primera vez que se necesita y registra cuánto tardó"""
+    if name in sys.modules:
+        # import_module espera si otro hilo todavía lo está importando (sys.modules ya lo tiene a medias)
+        return importlib.import_module(name)
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_SECONDS.set(round(time.perf_counter() - start, 4), name)
+    return module
+
+
+def max_rss_bytes():
+    """Memoria residente máxima del proceso en bytes (None si no se puede medir)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux da KB y macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss_bytes():
+    """Memoria residente actual del proceso en bytes (None si no se puede medir)"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RssSampler:
+    """
+    Pico de la memoria residente actual de cada etapa en curso.
+
+    Un solo hilo lee la memoria cada ``interval`` segundos mientras queda
+    alguna etapa abierta y termina cuando se cierra la última.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self._peaks = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Abre una etapa; devuelve su marca, o None si no se puede medir"""
+        current = current_rss_bytes()
+        if current is None:
+            return None
+        mark = object()
+        with self._lock:
+            self._peaks[mark] = (current, current)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+                self._thread.start()
+        return mark
+
+    def stop(self, mark):
+        """Cierra la etapa y devuelve lo que más creció la memoria en bytes"""
+        if mark is None:
+            return None
+        current = current_rss_bytes() or 0
+        with self._lock:
+            base, peak = self._peaks.pop(mark)
+        return max(peak, current) - base
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            current = current_rss_bytes() or 0
+            with self._lock:
+                if not self._peaks:
+                    self._thread = None
+                    return
+                for mark, (base, peak) in self._peaks.items():
+                    if current > peak:
+                        self._peaks[mark] = (base, current)
+
+
+_rss_sampler = RssSampler()
+
+
+def _memory_mark():
+    """Punto de partida para medir el pico de memoria de una etapa"""
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+    return _rss_sampler.start()
+
+
+def _memory_peak(mark):
+    """Pico de memoria desde ``_memory_mark`` en bytes"""
+    if tracemalloc.is_tracing():
+        return max(tracemalloc.get_traced_memory()[1] - mark, 0)
+    return _rss_sampler.stop(mark)
+
+
+class StageRecorder:
+    """
+    Medidas de las etapas de una petición.
+
+    Las etapas con un punto en el nombre (``parse.timestamps``) son parte de
+    otra; si una etapa se repite, se suman sus tiempos y mensajes.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name, messages=None):
+        """
+        Mide el bloque como la etapa ``name``.
+
+        Devuelve un diccionario en el que se puede indicar ``messages`` si se
+        conoce al terminar. Si el bloque lanza una excepción no se registra.
+        """
+        record = {'messages': messages}
+        mark = _memory_mark()
+        start = time.perf_counter()
+        yield record
+        self.add(name, time.perf_counter() - start, record['messages'], _memory_peak(mark))
+
+    def add(self, name, seconds, messages=None, peak_bytes=None):
+        """Registra una etapa medida por otro lado (por ejemplo, en otro proceso)"""
+        STAGE_SECONDS.observe(seconds, name)
+        if messages is not None:
+            STAGE_MESSAGES.inc(messages, name)
+        if peak_bytes is not None:
+            STAGE_PEAK_BYTES.observe(peak_bytes, name)
+
+        with self._lock:
+            previous = self.stages.get(name)
+            if previous is not None:
+                seconds += previous['seconds']
+                if previous['messages'] is not None:
+                    messages = (messages or 0) + previous['messages']
+                if previous['peak_bytes'] is not None:
+                    peak_bytes = max(peak_bytes or 0, previous['peak_bytes'])
+            self.stages[name] = {'seconds': round(seconds, 4), 'messages': messages, 'peak_bytes': peak_bytes}
+
+    def snapshot(self):
+        """Copia de las medidas, para publicarla mientras siguen llegando otras"""
+        with self._lock:
+            return {name: dict(record) for name, record in self.stages.items()}
+
+
+def stage(name, messages=None):
+    """Mide una etapa que no pertenece a ninguna petición con medidas propias"""
+    return StageRecorder().stage(name, messages)
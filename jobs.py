@@ -0,0 +1,154 @@
+"""
+Trabajos de análisis en segundo plano.
+
+Subir un chat crea un trabajo que se ejecuta en un pool de hilos; la petición
+devuelve enseguida el ID del trabajo. El cliente consulta el estado (etapa
+actual y progreso) y descarga cada gráfica en cuanto está lista, sin esperar
+a que termine todo el análisis.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import debug
+
+# Hilos que ejecutan trabajos a la vez
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Segundos que se conserva un trabajo terminado
+JOB_TTL = int(os.environ.get('JOB_TTL', 3600))
+
+
+class Job:
+    """Estado de un trabajo de análisis, compartido entre hilos"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.stage = 'queued'
+        self.progress = 0.0
+        self.charts = {}
+        self.chart_timings = {}
+        self.result = {}
+        self.error = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def update(self, stage=None, progress=None, **result):
+        """Cambia la etapa o el progreso y añade campos al resultado"""
+        with self._lock:
+            if stage is not None:
+                self.stage = stage
+            if progress is not None:
+                self.progress = max(self.progress, min(progress, 1.0))
+            self.result.update(result)
+
+    def add_chart(self, name, chart, seconds=None):
+        """Publica una gráfica terminada (su URL de imagen)"""
+        with self._lock:
+            self.charts[name] = chart
+            if seconds is not None:
+                self.chart_timings[name] = seconds
+
+    def get_chart(self, name):
+        with self._lock:
+            return self.charts.get(name)
+
+    def finish(self, error=None):
+        """Marca el trabajo como terminado, con o sin error"""
+        with self._lock:
+            if error:
+                self.stage = 'error'
+                self.error = error
+            else:
+                self.stage = 'done'
+                self.progress = 1.0
+            self.finished_at = time.time()
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    def to_dict(self):
+        """Instantánea del estado del trabajo"""
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'stage': self.stage,
+                'progress': round(self.progress, 3),
+                'done': self.finished_at is not None,
+                'error': self.error,
+                'charts_ready': list(self.charts),
+                'charts': dict(self.charts),
+                'plot_timings': dict(self.chart_timings),
+                **self.result
+            }
+
+
+class JobManager:
+    """Registro de trabajos y pool de hilos que los ejecuta"""
+
+    def __init__(self, max_workers=JOB_WORKERS, ttl=JOB_TTL):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+
+    def submit(self, fn, *args):
+        """
+        Crea un trabajo y ejecuta ``fn(job, *args)`` en segundo plano.
+
+        Si ``fn`` lanza una excepción, el trabajo termina con ese error.
+        """
+        job = Job()
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+
+        def run():
+            try:
+                fn(job, *args)
+                if not job.done:
+                    job.finish()
+            except Exception as e:
+                debug(f"Error en el trabajo {job.id}: {str(e)}")
+                job.finish(error=f'Error procesando el archivo: {str(e)}')
+
+        self._executor.submit(run)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        """Olvida los trabajos terminados hace más de ``ttl`` segundos"""
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class ProgressReader:
+    """Envuelve un archivo e informa de la fracción leída en cada lectura"""
+
+    def __init__(self, source, total, callback):
+        self.source = source
+        self.total = max(total, 1)
+        self.callback = callback
+        self.position = 0
+
+    def read(self, size=-1):
+        chunk = self.source.read(size)
+        self.position += len(chunk)
+        self.callback(self.position / self.total)
+        return chunk
+
+    def seek(self, offset, whence=0):
+        self.position = self.source.seek(offset, whence)
+        return self.position
+
+    def __getattr__(self, name):
+        # El resto de la interfaz de archivo se delega en el archivo original
+        return getattr(self.source, name)
@@ -0,0 +1,360 @@
+"""
+Clasificación vectorizada de los mensajes del chat.
+
+Cada mensaje recibe una categoría (texto, cada tipo de multimedia, mensaje
+eliminado, aviso del sistema...) según los marcadores que escribe WhatsApp en
+las exportaciones en español y en inglés, y se cuentan sus enlaces y emojis.
+
+No se llama a Python por mensaje: los mensajes se copian una vez a un array de
+Arrow (los bytes UTF-8 de todos seguidos y el desplazamiento de cada uno) y
+todo lo demás son operaciones de numpy sobre esos bytes:
+
+- Los marcadores se agrupan por longitud en bytes. Para cada longitud solo se
+  comparan las filas que tienen bytes suficientes y un primer (o último) byte
+  posible, copiando esos bytes a una matriz de cadenas de ancho fijo que se
+  busca en la tabla ordenada de marcadores.
+- Los enlaces (``http://``, ``https://``) y los emojis se buscan en todos los
+  bytes a la vez y se asignan a su mensaje por el desplazamiento.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from chat_model import MESSAGE_TYPES
+
+# Categorías de los mensajes; las de multimedia son el tipo 'media' de las gráficas
+KINDS = ['text', 'media', 'image', 'video', 'audio', 'sticker', 'gif', 'document', 'contact',
+         'location', 'poll', 'deleted', 'system']
+MEDIA_KINDS = frozenset(['media', 'image', 'video', 'audio', 'sticker', 'gif', 'document', 'contact'])
+
+# Marcadores de cada idioma de exportación. iPhone antepone el carácter
+# invisible U+200E a los avisos y la multimedia; se ignora al comparar.
+LOCALE_MARKERS = {
+    'es': {
+        # Mensaje completo
+        'exact': {
+            '<Multimedia omitido>': 'media',
+            'imagen omitida': 'image',
+            'video omitido': 'video',
+            'vídeo omitido': 'video',
+            'audio omitido': 'audio',
+            'sticker omitido': 'sticker',
+            'GIF omitido': 'gif',
+            'tarjeta de contacto omitida': 'contact',
+            'Tarjeta de contacto omitida': 'contact',
+            'Se eliminó este mensaje.': 'deleted',
+            'Eliminaste este mensaje.': 'deleted',
+            'Este mensaje fue eliminado': 'deleted',
+            'Este mensaje fue eliminado.': 'deleted'
+        },
+        # Principio del mensaje
+        'prefix': {
+            '<adjunto: ': 'attachment',
+            'ubicación: ': 'location',
+            'Ubicación: ': 'location',
+            'ENCUESTA:': 'poll',
+            'Los mensajes y las llamadas están cifrados de extremo a extremo': 'system'
+        },
+        # Final de la primera línea (en Android el pie de foto va en las siguientes)
+        'suffix': {
+            ' (archivo adjunto)': 'attachment',
+            'documento omitido': 'document'
+        }
+    },
+    'en': {
+        'exact': {
+            '<Media omitted>': 'media',
+            'Media omitted': 'media',
+            'image omitted': 'image',
+            'video omitted': 'video',
+            'audio omitted': 'audio',
+            'sticker omitted': 'sticker',
+            'GIF omitted': 'gif',
+            'Contact card omitted': 'contact',
+            'This message was deleted': 'deleted',
+            'This message was deleted.': 'deleted',
+            'You deleted this message': 'deleted',
+            'You deleted this message.': 'deleted'
+        },
+        'prefix': {
+            '<attached: ': 'attachment',
+            'location: ': 'location',
+            'Location: ': 'location',
+            'POLL:': 'poll',
+            'Messages and calls are end-to-end encrypted': 'system'
+        },
+        'suffix': {
+            ' (file attached)': 'attachment',
+            'document omitted': 'document'
+        }
+    }
+}
+LOCALES = tuple(LOCALE_MARKERS)
+
+# Categoría de los archivos adjuntos según su extensión (el resto son documentos).
+# Los GIF se exportan como .mp4 y cuentan como vídeo
+EXTENSION_KINDS = {
+    '.jpg': 'image', '.jpeg': 'image', '.png': 'image', '.heic': 'image',
+    '.mp4': 'video', '.mov': 'video', '.3gp': 'video',
+    '.opus': 'audio', '.ogg': 'audio', '.m4a': 'audio', '.mp3': 'audio', '.aac': 'audio',
+    '.webp': 'sticker',
+    '.gif': 'gif',
+    '.vcf': 'contact'
+}
+
+# Adjunto cuya categoría sale de la extensión (no aparece en el resultado)
+ATTACHMENT = len(KINDS)
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+KIND_CODES['attachment'] = ATTACHMENT
+# Código de ``MESSAGE_TYPES`` de cada categoría
+TYPE_CODES = np.array([MESSAGE_TYPES.index('media' if kind in MEDIA_KINDS else 'text') for kind in KINDS],
+                      dtype=np.int8)
+
+# Máximo de los contadores de enlaces y emojis (uint16)
+MAX_COUNT = np.iinfo(np.uint16).max
+
+_LRM = '\u200e'.encode('utf-8')
+
+
+def _pair(key):
+    """Par de bytes como entero de 16 bits"""
+    return key[0] << 8 | key[1]
+
+
+def _lower(chars):
+    """Pasa a minúsculas las letras ASCII de un array de bytes"""
+    return np.where((chars >= ord('A')) & (chars <= ord('Z')), chars + 32, chars).astype(np.uint8)
+
+
+class MarkerTable:
+    """
+    Marcadores anclados en la misma posición (principio o final), agrupados por longitud en bytes.
+
+    Args:
+        markers: Diccionario texto del marcador -> categoría
+        from_end: Si los marcadores terminan en el ancla en lugar de empezar en ella
+        fold_case: Si se comparan sin distinguir mayúsculas (solo letras ASCII)
+    """
+
+    def __init__(self, markers, from_end=False, fold_case=False):
+        self.from_end = from_end
+        self.fold_case = fold_case
+        by_width = {}
+        for text, kind in markers.items():
+            key = (text.lower() if fold_case else text).encode('utf-8')
+            by_width.setdefault(len(key), {})[key] = KIND_CODES[kind]
+
+        self.groups = []
+        self.min_width, self.max_width = min(by_width), max(by_width)
+        # Pares de bytes posibles junto al ancla de cualquier marcador
+        self.edge = np.zeros(1 << 16, dtype=bool)
+        for width, table in sorted(by_width.items()):
+            keys = sorted(table)
+            # Pares de bytes posibles junto al ancla, para descartar filas sin copiar nada
+            edge = np.zeros(1 << 16, dtype=bool)
+            edge[[_pair(key[-2:] if from_end else key[:2]) for key in keys]] = True
+            self.edge |= edge
+            self.groups.append((width, np.array(keys, dtype=f'S{width}'),
+                                np.array([table[key] for key in keys], dtype=np.int8), edge))
+
+    def match(self, data, anchors, available, exact=False):
+        """
+        Busca los marcadores en cada fila.
+
+        Args:
+            data: Bytes UTF-8 de todos los mensajes (uint8)
+            anchors: Posición de cada fila donde empieza (o termina) el texto comparado
+            available: Bytes que hay en cada fila desde (o hasta) el ancla
+            exact: Si el marcador tiene que ocupar todos los bytes disponibles
+
+        Returns:
+            Array int8 con el código de la categoría de cada fila (-1 si no hay marcador)
+        """
+        codes = np.full(len(anchors), -1, dtype=np.int8)
+        # Filas con la longitud de algún marcador y un byte posible en el ancla
+        fits = available >= self.min_width
+        if exact:
+            fits &= available <= self.max_width
+        rows = np.flatnonzero(fits)
+        first = anchors[rows] - 2 if self.from_end else anchors[rows]
+        high, low = data[first], data[first + 1]
+        if self.fold_case:
+            high, low = _lower(high), _lower(low)
+        edge_bytes = high.astype(np.uint16) << 8 | low
+        keep = self.edge[edge_bytes]
+        rows, edge_bytes = rows[keep], edge_bytes[keep]
+        anchors, available = anchors[rows], available[rows]
+
+        for width, keys, kinds, edge in self.groups:
+            fits = available == width if exact else available >= width
+            group = np.flatnonzero(fits & edge[edge_bytes])
+            if len(group) == 0:
+                continue
+            starts = anchors[group] - width if self.from_end else anchors[group]
+            found = data[starts[:, None] + np.arange(width)]
+            if self.fold_case:
+                found = _lower(found)
+            found = np.ascontiguousarray(found).view(f'S{width}').ravel()
+            index = np.minimum(np.searchsorted(keys, found), len(keys) - 1)
+            hit = (keys[index] == found) & (codes[rows[group]] == -1)
+            codes[rows[group[hit]]] = kinds[index[hit]]
+        return codes
+
+
+class MessageClassifier:
+    """
+    Clasificador con las tablas de marcadores de unos idiomas.
+
+    Args:
+        locales: Idiomas de ``LOCALE_MARKERS`` cuyos marcadores se reconocen
+    """
+
+    def __init__(self, locales=LOCALES):
+        markers = {'exact': {}, 'prefix': {}, 'suffix': {}}
+        for locale in locales:
+            for position, table in LOCALE_MARKERS[locale].items():
+                markers[position].update(table)
+        self.exact = MarkerTable(markers['exact'])
+        self.prefix = MarkerTable(markers['prefix'])
+        self.suffix = MarkerTable(markers['suffix'], from_end=True)
+        self.extensions = MarkerTable(EXTENSION_KINDS, from_end=True, fold_case=True)
+        # Texto que cierra el nombre del archivo en cada marcador de adjunto
+        self.attachment_ends = [np.frombuffer(marker.encode('utf-8'), dtype=np.uint8)
+                                for marker, kind in markers['suffix'].items() if kind == 'attachment']
+
+    def classify(self, messages):
+        """
+        Clasifica los mensajes en una pasada.
+
+        Args:
+            messages: Serie, array o lista de mensajes de texto
+
+        Returns:
+            DataFrame con el mismo índice que ``messages`` (si es una Serie) y las
+            columnas kind (categórica, ``KINDS``), type ('media' o 'text', la
+            división de las gráficas), links y emojis (uint16)
+        """
+        array = pa.array(np.asarray(messages, dtype=object), type=pa.large_string(), from_pandas=True)
+        n = len(array)
+        offsets = np.frombuffer(array.buffers()[1], dtype=np.int64)[array.offset:array.offset + n + 1]
+        data_buffer = array.buffers()[2]
+        data = np.frombuffer(data_buffer, dtype=np.uint8) if data_buffer is not None else np.zeros(0, np.uint8)
+        starts, ends = offsets[:-1], offsets[1:]
+
+        # Avisos de iPhone: el U+200E inicial no cuenta al comparar
+        lrm = np.zeros(n, dtype=bool)
+        rows = np.flatnonzero(ends - starts >= len(_LRM))
+        if len(rows):
+            head = data[starts[rows, None] + np.arange(len(_LRM))]
+            lrm[rows] = (head == np.frombuffer(_LRM, dtype=np.uint8)).all(axis=1)
+        body = starts + lrm * len(_LRM)
+
+        # Final de la primera línea
+        newlines = np.flatnonzero(data == ord('\n'))
+        line_ends = ends
+        if len(newlines):
+            following = newlines[np.minimum(np.searchsorted(newlines, body), len(newlines) - 1)]
+            line_ends = np.where((following >= body) & (following < ends), following, ends)
+
+        # El primer marcador que coincide decide: mensaje completo, final de la primera línea, principio
+        codes = self.exact.match(data, body, ends - body, exact=True)
+        for found in (self.suffix.match(data, line_ends, line_ends - body),
+                      self.prefix.match(data, body, ends - body)):
+            unset = codes == -1
+            codes[unset] = found[unset]
+
+        self._classify_attachments(codes, data, body, line_ends)
+        # Otros avisos de iPhone (alguien se unió, cambió el asunto...)
+        codes[(codes == -1) & lrm] = KIND_CODES['system']
+        codes[codes == -1] = KIND_CODES['text']
+
+        result = pd.DataFrame({
+            'kind': pd.Categorical.from_codes(codes, categories=KINDS),
+            'type': pd.Categorical.from_codes(TYPE_CODES[codes], categories=MESSAGE_TYPES),
+            'links': _count_per_message(_find_links(data), offsets),
+            'emojis': _count_per_message(_find_emojis(data), offsets)
+        })
+        if isinstance(messages, pd.Series):
+            result.index = messages.index
+        return result
+
+    def _classify_attachments(self, codes, data, body, line_ends):
+        """Asigna a los adjuntos la categoría de la extensión del archivo"""
+        rows = np.flatnonzero(codes == ATTACHMENT)
+        if len(rows) == 0:
+            return
+        # El nombre termina antes del marcador final (" (archivo adjunto)") o del ">" de "<adjunto: ...>"
+        name_ends = line_ends[rows].copy()
+        name_ends[data[name_ends - 1] == ord('>')] -= 1
+        for marker in self.attachment_ends:
+            width = len(marker)
+            candidates = rows[line_ends[rows] - body[rows] >= width]
+            found = data[line_ends[candidates, None] - width + np.arange(width)]
+            ends_with_marker = np.isin(rows, candidates[(found == marker).all(axis=1)])
+            name_ends[ends_with_marker] = line_ends[rows[ends_with_marker]] - width
+        kinds = self.extensions.match(data, name_ends, name_ends - body[rows])
+        codes[rows] = np.where(kinds == -1, KIND_CODES['document'], kinds)
+
+
+def _find_pair(data, pair):
+    """
+    Posiciones donde empieza la secuencia de dos bytes ``pair``.
+
+    Los bytes se comparan de dos en dos (como uint16, con las dos alineaciones),
+    que es más rápido que buscar un byte frecuente y comprobar el siguiente.
+    """
+    value = np.frombuffer(pair, dtype=np.uint16)[0]
+    positions = []
+    for shift in (0, 1):
+        aligned = data[shift:]
+        words = aligned[:len(aligned) // 2 * 2].view(np.uint16)
+        positions.append(np.flatnonzero(words == value) * 2 + shift)
+    return np.concatenate(positions)
+
+
+def _find_links(data):
+    """Posición de cada enlace (``http://`` o ``https://``) en los bytes de los mensajes"""
+    colons = _find_pair(data, b'//') - 1
+    colons = colons[colons >= 4]
+    colons = colons[data[colons] == ord(':')]
+    # "http" termina antes de ":" o de "s:"
+    scheme_starts = colons - 4 - (data[colons - 1] == ord('s'))
+    found = scheme_starts >= 0
+    for i, char in enumerate(b'http'):
+        found &= data[scheme_starts + i] == char
+    return scheme_starts[found]
+
+
+def _find_emojis(data):
+    """
+    Posición de cada emoji en los bytes de los mensajes.
+
+    Cuenta los caracteres de U+1F000-U+1FFFF (salvo los modificadores de tono
+    de piel) y los símbolos de U+2600-U+27BF (☀, ❤, ✅...); los emojis
+    compuestos (banderas, familias) cuentan por partes.
+    """
+    leads = np.flatnonzero(data >= 0xE2)
+    second = data[np.minimum(leads + 1, len(data) - 1)]
+    third = data[np.minimum(leads + 2, len(data) - 1)]
+    fourth = data[np.minimum(leads + 3, len(data) - 1)]
+    four_bytes = (data[leads] == 0xF0) & (second == 0x9F) & ~((third == 0x8F) & (fourth >= 0xBB))
+    symbols = (data[leads] == 0xE2) & (second >= 0x98) & (second <= 0x9E)
+    return leads[four_bytes | symbols]
+
+
+def _count_per_message(positions, offsets):
+    """Número de posiciones que caen en cada mensaje (uint16, saturado)"""
+    n = len(offsets) - 1
+    counts = np.bincount(np.searchsorted(offsets, positions, side='right') - 1, minlength=n)
+    return np.minimum(counts, MAX_COUNT).astype(np.uint16)
+
+
+_default_classifier = None
+
+
+def classify_messages(messages):
+    """Clasifica los mensajes con los marcadores de todos los idiomas (ver ``MessageClassifier.classify``)"""
+    global _default_classifier
+    if _default_classifier is None:
+        _default_classifier = MessageClassifier()
+    return _default_classifier.classify(messages)
@@ -0,0 +1,133 @@
+"""
+Caché en disco de resultados de análisis, direccionada por contenido.
+
+La clave combina el hash del archivo subido, el formato de dispositivo elegido
+y la versión del analizador, así que volver a subir la misma exportación
+devuelve el resultado guardado sin volver a parsear ni a dibujar. Los
+resultados sobreviven a los reinicios del proceso y, cuando el directorio
+supera el tamaño máximo, se borran los usados hace más tiempo.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+from instrumentation import debug
+
+# Tamaño de cada lectura al calcular el hash del archivo
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def hash_stream(stream, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Calcula el SHA-256 de un objeto tipo archivo leyéndolo por bloques.
+
+    El archivo se rebobina al terminar para poder parsearlo después.
+    """
+    digest = hashlib.sha256()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def make_key(content_hash, device_type, version):
+    """Clave de caché para un archivo, formato de dispositivo y versión del analizador"""
+    return hashlib.sha256(f'{content_hash}:{device_type}:{version}'.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    Resultados guardados como un archivo pickle por clave.
+
+    El orden LRU se mantiene con la fecha de modificación de cada archivo,
+    que se actualiza en cada acierto.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.pkl')
+
+    def get(self, key):
+        """Devuelve el resultado guardado o None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            # Entrada corrupta o de una versión incompatible: se descarta
+            debug(f"Error leyendo la caché de resultados: {str(e)}")
+            self._remove(path)
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Guarda un resultado de forma atómica y aplica el límite de tamaño"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        with self._lock:
+            self._evict()
+
+    def _entries(self):
+        """Lista (ruta, tamaño, mtime) de los resultados guardados"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        """Borra los resultados menos usados hasta cumplir el tamaño máximo"""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        # Se conserva siempre el resultado más reciente
+        for path, size, _ in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            self.evictions += 1
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        """Contadores de la caché"""
+        entries = self._entries()
+        return {
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,171 @@
+"""
+Cubo de conteos del chat por miembro, día y hora.
+
+Se construye una vez al parsear: cada celda es una combinación de miembro,
+día y hora con mensajes, y guarda cuántos de ellos son multimedia y cuántos
+texto. Todas las series de las gráficas de actividad (``aggregates.SERIES_NAMES``)
+se calculan desde el cubo para cualquier rango de fechas y subconjunto de
+miembros, con un coste proporcional al número de celdas y no al de mensajes.
+
+Las celdas se guardan en arrays de numpy ordenados por miembro, día y hora;
+los miembros se numeran en orden de aparición en el chat, que es el que
+desempata el top de mensajes por persona.
+"""
+import numpy as np
+import pandas as pd
+
+from aggregates import top_senders
+from chat_model import DAY_ORDER
+
+NS_PER_HOUR = 3600 * 1_000_000_000
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+# El 1970-01-01 (día 0) fue jueves: (día + 3) % 7 da el día de la semana con 0 = lunes
+_EPOCH_WEEKDAY = 3
+
+
+def to_day(value):
+    """Días desde 1970 de una fecha (``date``, ``Timestamp`` o texto ``aaaa-mm-dd``)"""
+    return pd.Timestamp(value).value // NS_PER_DAY
+
+
+class Rollup:
+    """
+    Conteos de mensajes por (miembro, día, hora), separados en multimedia y texto.
+
+    Args:
+        members: Nombres de los miembros en orden de aparición
+        member: Índice en ``members`` de cada celda
+        day: Días desde 1970 de cada celda
+        hour: Hora del día (0-23) de cada celda
+        media: Mensajes multimedia de cada celda
+        text: Mensajes de texto de cada celda
+    """
+
+    def __init__(self, members, member, day, hour, media, text):
+        self.members = list(members)
+        self.member = np.asarray(member, dtype=np.int32)
+        self.day = np.asarray(day, dtype=np.int64)
+        self.hour = np.asarray(hour, dtype=np.int8)
+        self.media = np.asarray(media, dtype=np.int64)
+        self.text = np.asarray(text, dtype=np.int64)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Agrupa los mensajes del chat (columnas datetime, sender y type) en celdas"""
+        members = df['sender'].unique().tolist()
+        timestamps = df['datetime'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        cells = pd.DataFrame({
+            'member': pd.Categorical(df['sender'], categories=members).codes,
+            'day': timestamps // NS_PER_DAY,
+            'hour': timestamps % NS_PER_DAY // NS_PER_HOUR,
+            'media': (df['type'] == 'media').to_numpy()
+        }).groupby(['member', 'day', 'hour'], sort=True)['media'].agg(['sum', 'size'])
+        media = cells['sum'].to_numpy()
+        return cls(
+            members,
+            cells.index.get_level_values('member'),
+            cells.index.get_level_values('day'),
+            cells.index.get_level_values('hour'),
+            media,
+            cells['size'].to_numpy() - media
+        )
+
+    def __len__(self):
+        return len(self.member)
+
+    @property
+    def nbytes(self):
+        """Memoria que ocupan las celdas"""
+        return sum(a.nbytes for a in (self.member, self.day, self.hour, self.media, self.text))
+
+    def merged(self, other):
+        """
+        Devuelve un cubo nuevo con los conteos de ``self`` y ``other`` sumados.
+
+        Los miembros de ``other`` que no estaban en ``self`` se añaden al final.
+        """
+        positions = {name: i for i, name in enumerate(self.members)}
+        for name in other.members:
+            positions.setdefault(name, len(positions))
+        members = list(positions)
+        remap = np.array([positions[name] for name in other.members], dtype=np.int32)
+        cells = pd.DataFrame({
+            'member': np.concatenate([self.member, remap[other.member]]),
+            'day': np.concatenate([self.day, other.day]),
+            'hour': np.concatenate([self.hour, other.hour]),
+            'media': np.concatenate([self.media, other.media]),
+            'text': np.concatenate([self.text, other.text])
+        }).groupby(['member', 'day', 'hour'], sort=True).sum()
+        return Rollup(
+            members,
+            cells.index.get_level_values('member'),
+            cells.index.get_level_values('day'),
+            cells.index.get_level_values('hour'),
+            cells['media'].to_numpy(),
+            cells['text'].to_numpy()
+        )
+
+    def member_indices(self, names):
+        """
+        Índices de unos miembros por su nombre.
+
+        Raises:
+            KeyError: Con el primer nombre que no es miembro del chat
+        """
+        positions = {name: i for i, name in enumerate(self.members)}
+        return [positions[name] for name in names]
+
+    def _mask(self, start, end, members):
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self.day >= to_day(start)
+        if end is not None:
+            mask &= self.day <= to_day(end)
+        if members is not None:
+            mask &= np.isin(self.member, self.member_indices(members))
+        return mask
+
+    def series(self, start=None, end=None, members=None):
+        """
+        Series de las gráficas de actividad (``aggregates.SERIES_NAMES``).
+
+        Args:
+            start: Primer día incluido (None = desde el principio)
+            end: Último día incluido (None = hasta el final)
+            members: Nombres de los miembros incluidos (None = todos)
+
+        Returns:
+            Diccionario nombre de gráfica -> Series de pandas
+
+        Raises:
+            KeyError: Si algún miembro no pertenece al chat
+        """
+        mask = self._mask(start, end, members)
+        member, day, hour = self.member[mask], self.day[mask], self.hour[mask]
+        media, text = self.media[mask], self.text[mask]
+        total = media + text
+
+        sender_counts = np.bincount(member, weights=total, minlength=len(self.members)).astype(np.int64)
+        present = sender_counts > 0
+        # Mismo orden que value_counts reindexado por orden de aparición
+        messages_per_person = pd.Series(sender_counts[present], index=pd.Index(self.members, dtype=object)[present])
+
+        if len(day):
+            first = day.min()
+            daily = np.bincount(day - first, weights=total).astype(np.int64)
+            daily_index = pd.date_range(pd.Timestamp(first * NS_PER_DAY), periods=len(daily), freq='D')
+        else:
+            daily = np.zeros(0, dtype=np.int64)
+            daily_index = pd.DatetimeIndex([], freq='D')
+
+        hourly = np.bincount(hour, weights=total, minlength=24).astype(np.int64)
+        weekly = np.bincount((day + _EPOCH_WEEKDAY) % 7, weights=total, minlength=7).astype(np.int64)
+        return {
+            'messages_per_person': top_senders(messages_per_person),
+            'daily_activity': pd.Series(daily, index=daily_index),
+            'message_types': pd.Series([int(media.sum()), int(text.sum())], index=['media', 'text'])
+                               .sort_values(ascending=False, kind='stable'),
+            'hourly_activity': pd.Series(hourly[hourly > 0], index=np.flatnonzero(hourly > 0)),
+            'weekly_activity': pd.Series(weekly, index=DAY_ORDER)
+        }
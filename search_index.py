@@ -0,0 +1,349 @@
+"""
+Índice invertido de los mensajes de un chat para la búsqueda de ``/search``.
+
+Se construye una vez al subir el chat, con la misma normalización que el
+índice de palabras (``token_index.split_words``: minúsculas y separación por
+espacios). Además, de cada palabra se quitan los signos de puntuación de los
+extremos y las tildes y diéresis (no la virgulilla: "año" y "ano" son
+palabras distintas), y a la consulta se le aplica lo mismo.
+
+A diferencia del índice de palabras, aquí no se quitan las stopwords: hacen
+falta para buscar frases. Solo se indexan los mensajes de texto (no la
+multimedia, los eliminados ni los avisos del sistema).
+
+Cada aparición de una palabra es una entrada (palabra, fila del mensaje,
+posición dentro del mensaje). Las entradas se guardan en arrays de numpy
+ordenados por palabra, fila y posición, con el inicio de cada palabra en
+``offsets``: las entradas de una palabra son un trozo contiguo y ya ordenado,
+así que buscar palabras y frases son cruces de arrays ordenados, sin recorrer
+los mensajes. Los resultados se ordenan por relevancia con BM25.
+"""
+import string
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from token_index import split_words
+
+# Signos que se quitan de los extremos de cada palabra
+PUNCTUATION = string.punctuation + '¡¿«»“”‘’…–—'
+# Marcas que se quitan al normalizar: acento agudo y grave, circunflejo y diéresis
+FOLDED_MARKS = {'\u0301', '\u0300', '\u0302', '\u0308'}
+
+# Parámetros de BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Las claves fila-posición de las frases usan los 32 bits bajos para la posición
+_POSITION_BITS = 32
+# Las posiciones se guardan en 16 bits: WhatsApp no admite mensajes de más de 65536 caracteres
+MAX_POSITION = np.iinfo(np.uint16).max
+
+
+def normalize_word(word):
+    """Clave de búsqueda de una palabra ya en minúsculas ('' si solo tenía puntuación)"""
+    word = word.strip(PUNCTUATION)
+    if word.isascii():
+        return word
+    decomposed = unicodedata.normalize('NFD', word)
+    return unicodedata.normalize('NFC', ''.join(c for c in decomposed if c not in FOLDED_MARKS))
+
+
+def parse_query(query):
+    """
+    Separa una consulta en palabras sueltas y frases entre comillas.
+
+    Returns:
+        Lista de claves; cada una es una tupla de palabras normalizadas (de
+        una sola palabra si no es una frase), sin repetir
+    """
+    clauses = []
+    for i, part in enumerate(query.replace('“', '"').replace('”', '"').split('"')):
+        words = [normalize_word(word) for word in part.lower().split()]
+        words = [word for word in words if word]
+        # Las partes impares están entre comillas (una comilla sin cerrar llega hasta el final)
+        groups = [tuple(words)] if i % 2 and words else [(word,) for word in words]
+        for group in groups:
+            if group not in clauses:
+                clauses.append(group)
+    return clauses
+
+
+def _row_starts(rows):
+    """Índice de la primera entrada de la fila de cada entrada (``rows`` ordenado)"""
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = rows[1:] != rows[:-1]
+    starts = np.flatnonzero(first)
+    return np.repeat(starts, np.diff(np.append(starts, len(rows))))
+
+
+def _build_offsets(term_ids, n_terms):
+    offsets = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=n_terms), out=offsets[1:])
+    return offsets
+
+
+def _intersect(a, b):
+    """Valores comunes de dos arrays ordenados y sin repetidos"""
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return a
+    # Búsqueda binaria de los valores del más corto en el más largo (sin reordenar nada)
+    found = b[np.minimum(np.searchsorted(b, a), len(b) - 1)] == a
+    return a[found]
+
+
+def _count_rows(rows):
+    """Filas distintas de un array ordenado y las veces que aparece cada una"""
+    if not len(rows):
+        return rows, np.zeros(0, dtype=np.int64)
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = rows[1:] != rows[:-1]
+    starts = np.flatnonzero(first)
+    return rows[starts], np.diff(np.append(starts, len(rows)))
+
+
+class SearchIndex:
+    """
+    Índice invertido de los mensajes de un chat.
+
+    Args:
+        terms: Claves de búsqueda ordenadas (array de objetos)
+        offsets: Inicio de las entradas de cada clave (``len(terms) + 1`` valores)
+        rows: Fila del mensaje de cada entrada
+        positions: Posición de la palabra en el mensaje de cada entrada
+        lengths: Palabras indexadas de cada fila del chat (0 si no se indexó)
+    """
+
+    def __init__(self, terms, offsets, rows, positions, lengths):
+        self.terms = np.asarray(terms, dtype=object)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.positions = np.asarray(positions, dtype=np.uint16)
+        self.lengths = np.asarray(lengths, dtype=np.int32)
+        # Mensajes en los que aparece cada clave
+        first = np.ones(len(self.rows), dtype=bool)
+        first[1:] = self.rows[1:] != self.rows[:-1]
+        first[self.offsets[1:-1]] = True
+        self.document_frequency = np.diff(np.concatenate([[0], np.cumsum(first)])[self.offsets]).astype(np.int32)
+        self.indexed_messages = int(np.count_nonzero(self.lengths))
+        self.average_length = float(self.lengths.sum()) / max(self.indexed_messages, 1)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Indexa los mensajes de texto del chat (las filas son las posiciones en ``df``)"""
+        text_rows = np.flatnonzero((df['kind'] == 'text').to_numpy())
+        words = split_words(pd.Series(df['message'].to_numpy()[text_rows], index=text_rows))
+
+        # La normalización se hace sobre el vocabulario (palabras distintas), no sobre cada aparición
+        word_codes, vocabulary = pd.factorize(words.to_numpy())
+        keys = np.array([normalize_word(word) for word in vocabulary], dtype=object)
+        terms, key_ids = np.unique(keys, return_inverse=True)
+        term_ids = key_ids[word_codes]
+        rows = words.index.to_numpy(dtype=np.int32)
+
+        # Las palabras que solo eran puntuación no cuentan para las posiciones
+        if len(terms) and terms[0] == '':
+            keep = term_ids != 0
+            terms, term_ids, rows = terms[1:], term_ids[keep] - 1, rows[keep]
+        positions = np.minimum(np.arange(len(rows)) - _row_starts(rows), MAX_POSITION)
+        lengths = np.bincount(rows, minlength=len(df)).astype(np.int32)
+
+        # Filas y posiciones ya están en orden: basta un orden estable por clave
+        order = np.argsort(term_ids, kind='stable')
+        return cls(terms, _build_offsets(term_ids, len(terms)), rows[order], positions[order], lengths)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @property
+    def nbytes(self):
+        """Memoria que ocupan las entradas (sin contar el vocabulario)"""
+        arrays = (self.offsets, self.rows, self.positions, self.lengths, self.document_frequency)
+        return sum(a.nbytes for a in arrays)
+
+    def merged(self, other):
+        """
+        Devuelve un índice nuevo con los mensajes de ``other`` añadidos tras los de ``self``.
+
+        Las filas de ``other`` se desplazan en el número de filas de ``self``,
+        como al concatenar las tablas de los dos chats.
+        """
+        terms, remap = np.unique(np.concatenate([self.terms, other.terms]), return_inverse=True)
+        term_ids = np.concatenate([
+            np.repeat(remap[:len(self.terms)], np.diff(self.offsets)),
+            np.repeat(remap[len(self.terms):], np.diff(other.offsets))
+        ])
+        # Las entradas de ``self`` quedan delante de las de ``other`` en cada clave
+        order = np.argsort(term_ids, kind='stable')
+        rows = np.concatenate([self.rows, other.rows + len(self)])
+        positions = np.concatenate([self.positions, other.positions])
+        return SearchIndex(terms, _build_offsets(term_ids, len(terms)), rows[order], positions[order],
+                           np.concatenate([self.lengths, other.lengths]))
+
+    def _term(self, term):
+        """Posición de una clave en ``terms`` (None si no aparece)"""
+        i = np.searchsorted(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return None
+        return i
+
+    def postings(self, term, rows_range=None):
+        """
+        Filas y posiciones de las apariciones de una clave (vacías si no aparece).
+
+        Con ``rows_range`` (primera fila, fila final sin incluir) solo se
+        devuelven las de ese rango, que se busca por bisección.
+        """
+        i = self._term(term)
+        if i is None:
+            return self.rows[:0], self.positions[:0]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        if rows_range is not None:
+            start, end = start + np.searchsorted(self.rows[start:end], rows_range)
+        return self.rows[start:end], self.positions[start:end]
+
+    def idf(self, clause):
+        """IDF de BM25 de una palabra, o la suma de los de sus palabras si es una frase"""
+        idf = 0.0
+        for term in clause:
+            i = self._term(term)
+            frequency = self.document_frequency[i] if i is not None else 0
+            idf += np.log(1 + (self.indexed_messages - frequency + 0.5) / (frequency + 0.5))
+        return idf
+
+    def matches(self, clause, rows_range=None):
+        """
+        Mensajes en los que aparece una palabra o una frase.
+
+        Args:
+            clause: Tupla de claves consecutivas
+            rows_range: Rango de filas opcional (primera, final sin incluir)
+
+        Returns:
+            Tupla (filas ordenadas, apariciones en cada fila)
+        """
+        rows, positions = self.postings(clause[0], rows_range)
+        if len(clause) > 1:
+            # Clave fila-posición del inicio de la frase, que debe repetirse en cada palabra
+            starts = (rows.astype(np.int64) << _POSITION_BITS) | positions
+            for offset, term in enumerate(clause[1:], start=1):
+                if not len(starts):
+                    break
+                term_rows, term_positions = self.postings(term, rows_range)
+                keep = term_positions >= offset
+                term_starts = ((term_rows[keep].astype(np.int64) << _POSITION_BITS)
+                               | (term_positions[keep].astype(np.int64) - offset))
+                starts = _intersect(starts, term_starts)
+            rows = (starts >> _POSITION_BITS).astype(np.int32)
+        return _count_rows(rows)
+
+    def search(self, query, row_filter=None):
+        """
+        Busca los mensajes que contienen todas las palabras y frases de la consulta.
+
+        Args:
+            query: Consulta de texto; las frases van entre comillas
+            row_filter: ``RowFilter`` opcional con las fechas y miembros
+
+        Returns:
+            Tupla (filas, puntuaciones BM25) sin ordenar, o None si la consulta
+            no tiene ninguna palabra
+        """
+        clauses = parse_query(query)
+        if not clauses:
+            return None
+        rows_range = row_filter.rows_range if row_filter is not None else None
+
+        # Se cruzan primero las claves menos frecuentes, que dejan menos candidatos
+        matches = sorted(((clause, *self.matches(clause, rows_range)) for clause in clauses),
+                         key=lambda match: len(match[1]))
+        candidates = matches[0][1]
+        for _, rows, _ in matches[1:]:
+            candidates = _intersect(candidates, rows)
+        if row_filter is not None and len(candidates):
+            mask = row_filter.mask(candidates)
+            if mask is not None:
+                candidates = candidates[mask]
+
+        # Las puntuaciones no dependen de los filtros: el IDF es el del chat completo
+        scores = np.zeros(len(candidates))
+        lengths = self.lengths[candidates]
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / self.average_length)
+        for clause, rows, counts in matches:
+            tf = counts if len(rows) == len(candidates) else counts[np.searchsorted(rows, candidates)]
+            scores += self.idf(clause) * tf * (BM25_K1 + 1) / (tf + norm)
+        return candidates, scores
+
+
+class RowFilter:
+    """
+    Filtro de fechas y miembros para ``SearchIndex.search``.
+
+    En un chat en orden cronológico las fechas son un rango de filas
+    (``rows_range``), que se aplica directamente a las entradas del índice; los
+    miembros (y las fechas de un chat desordenado) se comprueban con ``mask``
+    sobre las filas candidatas.
+
+    Args:
+        df: Tabla del chat (sender categórica)
+        start: Primer día incluido (None = desde el principio)
+        end: Último día incluido (None = hasta el final)
+        members: Nombres de los miembros incluidos (None = todos)
+
+    Raises:
+        KeyError: Con el primer nombre que no es miembro del chat
+    """
+
+    def __init__(self, df, start=None, end=None, members=None):
+        self.low = np.datetime64(start, 'D') if start is not None else None
+        self.high = np.datetime64(end, 'D') + np.timedelta64(1, 'D') if end is not None else None
+        self.timestamps = df['datetime'].to_numpy()
+        self.rows_range = None
+        if df['datetime'].is_monotonic_increasing:
+            self.rows_range = (
+                0 if self.low is None else int(np.searchsorted(self.timestamps, self.low)),
+                len(df) if self.high is None else int(np.searchsorted(self.timestamps, self.high))
+            )
+        self.selected = None
+        if members is not None:
+            codes = df['sender'].cat.categories.get_indexer(members)
+            if (codes < 0).any():
+                raise KeyError(members[int(np.argmax(codes < 0))])
+            self.selected = np.zeros(len(df['sender'].cat.categories), dtype=bool)
+            self.selected[codes] = True
+            self.sender_codes = df['sender'].cat.codes.to_numpy()
+
+    def mask(self, rows):
+        """Máscara de las filas que pasan el filtro (None si ya lo pasan todas)"""
+        mask = None
+        if self.rows_range is None and (self.low is not None or self.high is not None):
+            mask = np.ones(len(rows), dtype=bool)
+            if self.low is not None:
+                mask &= self.timestamps[rows] >= self.low
+            if self.high is not None:
+                mask &= self.timestamps[rows] < self.high
+        if self.selected is not None:
+            member_mask = self.selected[self.sender_codes[rows]]
+            mask = member_mask if mask is None else mask & member_mask
+        return mask
+
+
+def rank(rows, scores, limit, by_date=False):
+    """
+    Ordena los resultados y devuelve los ``limit`` primeros.
+
+    Por relevancia, a igual puntuación va primero el mensaje más reciente; con
+    ``by_date``, solo por fecha (las filas del chat están en orden cronológico).
+    """
+    if by_date:
+        return rows[::-1][:limit], scores[::-1][:limit]
+    if limit < len(rows):
+        # Solo se ordenan los que pueden entrar (incluidos los empates en el límite)
+        threshold = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+        keep = scores >= threshold
+        rows, scores = rows[keep], scores[keep]
+    order = np.lexsort((-rows.astype(np.int64), -scores))[:limit]
+    return rows[order], scores[order]
@@ -1,15 +1,24 @@
+import os
+import time
+
+_run_started = time.perf_counter()
+
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from wordcloud import WordCloud
-import re
-from io import BytesIO
-import base64
-from datetime import datetime
-import matplotlib
-matplotlib.use('Agg')
-plt.style.use('seaborn')
+from analysis import process_chat_file
+from charts import RENDERERS as CHART_NAMES, render_image, wordcloud_params
+from chat_storage import binary_path, chat_to_bytes
+from result_cache import hash_stream
+from rollup import Rollup
+
+# Chats analizados que se conservan en memoria y durante cuántos segundos
+PIPELINE_CACHE_MAX_CHATS = int(os.environ.get('PIPELINE_CACHE_MAX_CHATS', 4))
+PIPELINE_CACHE_TTL = int(os.environ.get('PIPELINE_CACHE_TTL', 3600))
+# Nubes de palabras de miembros que se conservan (entre todos los chats)
+PIPELINE_CACHE_MAX_WORDCLOUDS = int(os.environ.get('PIPELINE_CACHE_MAX_WORDCLOUDS', 64))
+
+# Gráficas de la vista general: las de actividad, sin la nube del grupo
+CHARTS = [name for name in CHART_NAMES if name != 'group_wordcloud']
+DAY_NAMES_ES = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
 
 # Configuración de la página
 st.set_page_config(
@@ -24,202 +33,133 @@ st.markdown("""
 Esta aplicación analiza chats de WhatsApp y genera visualizaciones estadísticas.
 """)
 
-def process_chat_file(content):
-    """Procesa el contenido del archivo de chat"""
-    patterns = [
-        r'(\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2})\s-\s([^:]+):\s(.+)',
-        r'(\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}\s[APMapm]{2})\s-\s([^:]+):\s(.+)',
-        r'\[(\d{1,2}/\d{1,2}/\d{2,4}\s\d{1,2}:\d{2}:\d{2})\]\s([^:]+):\s(.+)'
-    ]
-    
-    matches = []
-    used_pattern = None
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, content, re.MULTILINE)
-        if matches:
-            used_pattern = pattern
-            st.success(f"✅ Se encontraron {len(matches)} mensajes")
-            break
-    
-    if not matches:
-        st.error("No se encontró un patrón válido en el archivo")
-        return None, None, "No se encontró un patrón válido en el archivo"
-    
-    # Crear DataFrame
-    df = pd.DataFrame(matches, columns=['datetime', 'sender', 'message'])
-    
-    # Convertir fechas a datetime
-    df['datetime'] = pd.to_datetime(df['datetime'], format='%d/%m/%y, %H:%M')
-    
-    # Extraer hora y día de la semana
-    df['hour'] = df['datetime'].dt.hour
-    df['day_of_week'] = df['datetime'].dt.day_name()
-    
-    # Identificar tipo de mensaje
-    df['type'] = df['message'].apply(lambda x: 'media' if '<Multimedia omitido>' in x else 'text')
-    
-    # Obtener miembros y estadísticas
-    members = df['sender'].unique().tolist()
-    message_counts = df['sender'].value_counts()
-    
-    # Crear información de miembros
-    members_info = []
-    total_messages = len(df)
-    
-    for member in members:
-        member_messages = df[df['sender'] == member]
-        member_count = len(member_messages)
-        
-        # Obtener palabras más frecuentes
-        text_messages = member_messages[member_messages['type'] == 'text']['message'].tolist()
-        words = ' '.join(text_messages).lower().split()
-        word_freq = {}
-        for word in words:
-            if len(word) > 3:
-                word_freq[word] = word_freq.get(word, 0) + 1
-        top_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:3]
-        
-        members_info.append({
-            'name': member,
-            'messages': member_count,
-            'percentage': round(member_count / total_messages * 100, 1),
-            'top_words': top_words
-        })
-    
-    return df, members_info, None
+# Streamlit vuelve a ejecutar el script entero con cada interacción. Cada etapa
+# del análisis se memoriza con la clave del hash del archivo subido (los
+# argumentos con "_" no forman parte de la clave), así que al cambiar de
+# miembro solo se dibuja su nube de palabras. El chat analizado se guarda como
+# recurso (sin copiarlo en cada ejecución) y las imágenes como PNG.
+
+def upload_hash(uploaded_file):
+    """Hash del contenido del archivo subido, calculado una vez por archivo"""
+    hashes = st.session_state.setdefault('upload_hashes', {})
+    upload_id = getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size)
+    if upload_id not in hashes:
+        hashes[upload_id] = hash_stream(uploaded_file)
+    return hashes[upload_id]
+
+@st.cache_resource(max_entries=PIPELINE_CACHE_MAX_CHATS, ttl=PIPELINE_CACHE_TTL, show_spinner="Analizando el chat...")
+def analyze_chat(content_hash, _uploaded_file):
+    """
+    Parsea el archivo (o carga el chat binario) y calcula las estadísticas de los miembros.
+    
+    El resultado se comparte entre ejecuciones y sesiones: no se modifica.
+    
+    Returns:
+        Tupla (df, members_info, token_index, error)
+    """
+    _uploaded_file.seek(0)
+    return process_chat_file(_uploaded_file)
 
-def generate_plots(df):
-    """Genera todas las visualizaciones"""
+@st.cache_data(max_entries=PIPELINE_CACHE_MAX_CHATS, ttl=PIPELINE_CACHE_TTL, show_spinner="Dibujando las gráficas...")
+def render_plots(content_hash, _df):
+    """Dibuja las gráficas de actividad del chat como PNG"""
+    series = Rollup.from_dataframe(_df).series()
+    weekly_activity = series['weekly_activity'].copy()
+    weekly_activity.index = DAY_NAMES_ES
+    series['weekly_activity'] = weekly_activity
+    return {name: render_image(name, series[name]) for name in CHARTS}
+
+@st.cache_data(max_entries=PIPELINE_CACHE_MAX_CHATS, ttl=PIPELINE_CACHE_TTL, show_spinner=False)
+def binary_chat(content_hash, _df):
+    """Chat parseado en formato binario (Arrow) para el botón de descarga"""
+    return chat_to_bytes(_df)
+
+@st.cache_data(max_entries=PIPELINE_CACHE_MAX_WORDCLOUDS, ttl=PIPELINE_CACHE_TTL, show_spinner=False)
+def render_member_wordcloud(content_hash, member, _token_index):
+    """Nube de palabras de un miembro como PNG (None si no tiene palabras)"""
+    params = wordcloud_params()
+    frequencies = dict(_token_index.frequencies(member).most_common(params['max_words']))
+    if not frequencies:
+        return None
+    return render_image('member_wordcloud', (frequencies, params))
+
+def show_parse_stats(df):
+    """Muestra el resultado del parseo"""
+    stats = df.attrs.get('parse_stats', {})
+    if 'format' not in stats:
+        st.success(f"✅ Chat binario cargado: {len(df)} mensajes")
+        return
+    st.success(f"✅ Se encontraron {len(df)} mensajes ({stats['format']}, {stats['mb_per_s']} MB/s)")
+    if stats['unparsed_rows']:
+        st.warning(f"Se descartaron {stats['unparsed_rows']} mensajes con fecha u hora no válida: "
+                   + ', '.join(stats['unparsed_samples']))
+
+def show_plots(images):
+    """Muestra las gráficas de actividad"""
     col1, col2 = st.columns(2)
     
     with col1:
         # 1. Mensajes por persona
         st.subheader("📊 Mensajes por Persona")
-        fig, ax = plt.subplots(figsize=(10, 6))
-        messages_per_person = df['sender'].value_counts().head(20)
-        messages_per_person.plot(kind='bar', color='skyblue', ax=ax)
-        plt.title('Top 20: Mensajes por persona')
-        plt.xlabel('Miembro')
-        plt.ylabel('Número de mensajes')
-        plt.xticks(rotation=45, ha='right')
-        st.pyplot(fig)
-        plt.close()
+        st.image(images['messages_per_person'], use_column_width=True)
         
         # 2. Distribución de tipos de mensajes
         st.subheader("📱 Tipos de Mensajes")
-        fig, ax = plt.subplots(figsize=(8, 8))
-        type_counts = df['type'].value_counts()
-        type_counts.plot(kind='pie', autopct='%1.1f%%', colors=['lightcoral', 'lightblue'], ax=ax)
-        plt.title('Distribución de tipos de mensajes')
-        st.pyplot(fig)
-        plt.close()
+        st.image(images['message_types'], use_column_width=True)
     
     with col2:
         # 3. Actividad diaria
         st.subheader("📈 Actividad Diaria")
-        fig, ax = plt.subplots(figsize=(10, 6))
-        daily_activity = df.resample('D', on='datetime').size()
-        daily_activity.plot(kind='line', color='green', ax=ax)
-        plt.title('Actividad diaria del chat')
-        plt.xlabel('Fecha')
-        plt.ylabel('Número de mensajes')
-        st.pyplot(fig)
-        plt.close()
+        st.image(images['daily_activity'], use_column_width=True)
         
         # 4. Actividad por hora
         st.subheader("🕒 Actividad por Hora")
-        fig, ax = plt.subplots(figsize=(10, 6))
-        df['hour'].value_counts().sort_index().plot(kind='bar', ax=ax)
-        plt.title('Actividad por hora del día')
-        plt.xlabel('Hora')
-        plt.ylabel('Número de mensajes')
-        st.pyplot(fig)
-        plt.close()
+        st.image(images['hourly_activity'], use_column_width=True)
     
     # 5. Actividad por día de la semana
     st.subheader("📅 Actividad Semanal")
-    fig, ax = plt.subplots(figsize=(10, 6))
-    day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    day_names_es = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-    activity = df['day_of_week'].value_counts().reindex(day_order)
-    activity.index = day_names_es
-    activity.plot(kind='bar', ax=ax)
-    plt.title('Actividad por día de la semana')
-    plt.xlabel('Día')
-    plt.ylabel('Número de mensajes')
-    st.pyplot(fig)
-    plt.close()
+    st.image(images['weekly_activity'], use_column_width=True)
 
-def generate_member_wordcloud(df, member):
-    """Genera una nube de palabras para un miembro específico"""
+def show_member_wordcloud(content_hash, token_index, member):
+    """Muestra la nube de palabras de un miembro"""
     try:
-        # Lista de stopwords en español
-        stopwords = {
-            'a', 'al', 'ante', 'bajo', 'cabe', 'con', 'contra', 'de', 'desde', 'durante',
-            'en', 'entre', 'hacia', 'hasta', 'mediante', 'para', 'por', 'según', 'sin',
-            'sobre', 'tras', 'y', 'e', 'ni', 'que', 'si', 'no', 'el', 'la', 'los', 'las',
-            'un', 'una', 'unos', 'unas', 'lo', 'este', 'esta', 'estos', 'estas', 'ese',
-            'esa', 'esos', 'esas', 'del', 'multimedia', 'omitido', '<multimedia', 'omitido>',
-            'ha', 'he', 'has', 'han', 'hemos', 'habéis', 'había', 'hubo', 'ser', 'es',
-            'soy', 'eres', 'somos', 'sois', 'estar', 'estoy', 'está', 'estamos', 'estáis',
-            'te', 'mi', 'tu', 'su', 'nos', 'os', 'les', 'me', 'se', 'pero', 'más', 'ya',
-            'esto', 'eso', 'aquello', 'quien', 'donde', 'cuando', 'cuanto', 'como',
-            'imagen', 'video', 'audio', 'sticker', 'gif', 'documento', 'eliminado'
-        }
-        
-        # Obtener solo mensajes de texto
-        member_messages = df[(df['sender'] == member) & (df['type'] == 'text')]['message']
-        
-        # Procesar y filtrar palabras
-        words = []
-        for message in member_messages:
-            # Convertir a minúsculas y dividir en palabras
-            message_words = message.lower().split()
-            # Filtrar palabras no deseadas y palabras cortas
-            filtered_words = [word for word in message_words 
-                            if word not in stopwords 
-                            and len(word) > 3 
-                            and not word.startswith('http')
-                            and not word.startswith('<')
-                            and not word.endswith('>')]
-            words.extend(filtered_words)
-        
-        # Unir palabras filtradas
-        text = ' '.join(words)
-        
-        # Configurar y generar la nube de palabras
-        wordcloud = WordCloud(
-            width=800, 
-            height=400, 
-            background_color='white',
-            max_words=100,
-            collocations=False,
-            stopwords=stopwords
-        ).generate(text)
-        
-        # Crear y mostrar la figura
-        fig, ax = plt.subplots(figsize=(10, 5))
-        ax.imshow(wordcloud, interpolation='bilinear')
-        ax.axis('off')
-        st.pyplot(fig)
-        plt.close()
-        
+        png = render_member_wordcloud(content_hash, member, token_index)
     except Exception as e:
         st.error(f"Error generando nube de palabras: {str(e)}")
+        return
+    if png is None:
+        st.info("Este miembro no tiene mensajes de texto suficientes")
+    else:
+        st.image(png, use_column_width=True)
+
+def show_timings(content_hash):
+    """Muestra el tiempo de la primera carga del chat y el de la última interacción"""
+    elapsed = time.perf_counter() - _run_started
+    timings = st.session_state.setdefault('timings', {})
+    if content_hash not in timings:
+        timings[content_hash] = {'first_load': elapsed, 'last_run': None}
+    else:
+        timings[content_hash]['last_run'] = elapsed
+    
+    st.sidebar.subheader("⏱️ Tiempos")
+    st.sidebar.write(f"Primera carga: {timings[content_hash]['first_load']:.2f} s")
+    if timings[content_hash]['last_run'] is not None:
+        st.sidebar.write(f"Última interacción: {timings[content_hash]['last_run']:.2f} s")
 
 # Sidebar
 st.sidebar.header("📤 Subir Chat")
-uploaded_file = st.sidebar.file_uploader("Selecciona un archivo de chat", type=['txt'])
+uploaded_file = st.sidebar.file_uploader("Selecciona un archivo de chat", type=['txt', 'arrow'])
 
 if uploaded_file:
-    # Leer y procesar el archivo
-    content = uploaded_file.getvalue().decode('utf-8')
-    df, members_info, error = process_chat_file(content)
+    # El análisis solo se repite si cambia el contenido del archivo
+    content_hash = upload_hash(uploaded_file)
+    df, members_info, token_index, error = analyze_chat(content_hash, uploaded_file)
     
     if error:
         st.error(error)
     else:
+        show_parse_stats(df)
+        
         # Mostrar estadísticas generales
         st.header("📊 Estadísticas Generales")
         col1, col2, col3 = st.columns(3)
@@ -230,8 +170,16 @@ if uploaded_file:
         with col3:
             st.metric("Período", f"{df['datetime'].min().strftime('%d/%m/%y')} - {df['datetime'].max().strftime('%d/%m/%y')}")
         
+        # Descargar el chat parseado para recargarlo sin parsear
+        st.sidebar.download_button(
+            "⬇️ Descargar chat procesado (.arrow)",
+            data=binary_chat(content_hash, df),
+            file_name=binary_path(uploaded_file.name),
+            mime='application/vnd.apache.arrow.file'
+        )
+        
         # Generar visualizaciones
-        generate_plots(df)
+        show_plots(render_plots(content_hash, df))
         
         # Selector de miembro
         st.header("👤 Análisis por Miembro")
@@ -255,7 +203,9 @@ if uploaded_file:
             
             with col2:
                 st.subheader("🔤 Nube de Palabras")
-                generate_member_wordcloud(df, selected_member)
+                show_member_wordcloud(content_hash, token_index, selected_member)
+        
+        show_timings(content_hash)
 else:
     # Instrucciones cuando no hay archivo
     st.info("👋 ¡Bienvenido al Analizador de Chat de WhatsApp!")
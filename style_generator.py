@@ -0,0 +1,527 @@
+"""
+Generación de mensajes imitando el estilo de escritura de cada miembro.
+
+Uso:
+    python style_generator.py chat.txt [--prompt "¿Qué os parece lo de mañana?"] [--backend stub]
+                              [--concurrency 8] [--members Ana --members Luis]
+    python style_generator.py --serve-stub 8000 [--latency 0.5] [--error-rate 0.1]
+
+Las muestras de mensajes de todos los miembros se toman en una sola pasada
+agrupada por remitente (``sample_members``), con una semilla fija: el mismo
+chat da siempre las mismas muestras.
+
+``StyleGenerator`` envía las peticiones (miembro, prompt) a la vez con asyncio,
+con un máximo de peticiones en curso, y repite con espera exponencial (y la
+``Retry-After`` del servidor, si la indica) las que fallan por un error
+transitorio. Las respuestas se guardan en una caché en disco cuya clave es el
+modelo, los parámetros, el prompt del sistema (que contiene la muestra del
+miembro) y el prompt: repetir una petición no vuelve a llamar a la API, y las
+peticiones idénticas de un mismo lote se envían una sola vez.
+
+El proveedor es intercambiable: ``OpenAIBackend`` llama a la API de chat
+completions de OpenAI (o a cualquier servidor compatible con ``base_url``) con
+la librería estándar, sin depender del paquete ``openai``; ``StubBackend``
+responde en el propio proceso sin red, y ``serve_stub`` levanta un servidor
+local compatible con la API para probar y medir ``OpenAIBackend`` sin conexión.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import debug
+from message_classifier import classify_messages
+from result_cache import ResultCache
+
+# API compatible con la de OpenAI y modelo (la clave se lee de OPENAI_API_KEY)
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-3.5-turbo')
+# Peticiones en curso a la vez, reintentos de los errores transitorios y espera inicial y máxima entre ellos
+GENERATION_CONCURRENCY = int(os.environ.get('GENERATION_CONCURRENCY', 8))
+GENERATION_MAX_RETRIES = int(os.environ.get('GENERATION_MAX_RETRIES', 4))
+GENERATION_BACKOFF = float(os.environ.get('GENERATION_BACKOFF', 1.0))
+GENERATION_MAX_BACKOFF = float(os.environ.get('GENERATION_MAX_BACKOFF', 30.0))
+# Segundos máximos de cada petición
+GENERATION_TIMEOUT = float(os.environ.get('GENERATION_TIMEOUT', 60.0))
+# Caché en disco de las respuestas
+GENERATION_CACHE_DIR = os.environ.get('GENERATION_CACHE_DIR', os.path.join('.cache', 'generations'))
+GENERATION_CACHE_MAX_BYTES = int(os.environ.get('GENERATION_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Mensajes de ejemplo de cada miembro en el prompt
+SAMPLE_SIZE = 500
+SAMPLE_SEED = 0
+TEMPERATURE = 0.7
+MAX_TOKENS = 400
+
+# Errores HTTP que se reintentan
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+STYLE_PROMPT = """Estás imitando el estilo de habla de una persona de WhatsApp.
+Aquí hay algunos mensajes de ejemplo de esta persona:
+
+{examples}
+
+Genera una respuesta que coincida con el estilo de habla de esta persona, capturando tanto su forma de expresarse como los temas que suele abordar. La respuesta debe reflejar fielmente su tono, vocabulario, uso de emojis y patrones de escritura. Presta especial atención a los siguientes aspectos:
+
+- **Tono y vocabulario**: Imita su nivel de formalidad, jerga o palabras clave que usa frecuentemente.
+- **Uso de emojis**: Incluye emojis de la misma manera que la persona los usa, ya sea de forma frecuente, moderada o esporádica.
+- **Patrones de escritura**: Refleja su estilo, como el uso de abreviaturas, signos de puntuación, mayúsculas o estructuras de frases particulares.
+- **Temas recurrentes**: Incorpora temas o asuntos que la persona menciona habitualmente, asegurando que la respuesta parezca algo que podría decir en una conversación real.
+- **Personalidad**: La respuesta debe capturar su actitud general, ya sea optimista, pesimista, sarcástica, directa, etc. Evita hacerla excesivamente positiva si la persona no lo es.
+
+El objetivo es que la respuesta no solo suene como algo que la persona podría decir, sino que también represente su personalidad y los temas que le interesan. Usa el contexto proporcionado para guiar la respuesta, pero asegúrate de que se sienta auténtica y coherente con su estilo de comunicación.
+"""
+
+# Prompt de la generación de un mensaje típico de cada miembro
+TYPICAL_MESSAGE_PROMPT = "Genera una frase típica de esta persona basada en sus mensajes anteriores."
+
+
+class GenerationError(Exception):
+    """La petición falló y no tiene sentido repetirla (clave no válida, petición mal formada...)"""
+
+
+class RetryableError(GenerationError):
+    """
+    Error transitorio (límite de peticiones, error del servidor, conexión...).
+
+    Args:
+        retry_after: Segundos que el servidor pide esperar (None si no lo indica)
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def sample_members(df, size=SAMPLE_SIZE, members=None, recent=False, seed=SAMPLE_SEED):
+    """
+    Toma una muestra de mensajes de texto de cada miembro en una sola pasada.
+
+    Los mensajes se ordenan una vez por remitente y una clave aleatoria (o la
+    fila, con ``recent``) y de cada grupo se quedan los ``size`` primeros, en
+    lugar de filtrar la tabla una vez por miembro.
+
+    Args:
+        df: Tabla del chat (columnas sender y message; si tiene kind, solo se
+            usan los mensajes de texto y si no, se clasifican)
+        size: Mensajes por miembro como máximo
+        members: Miembros a muestrear (None = todos)
+        recent: Tomar los últimos mensajes de cada miembro en lugar de al azar
+        seed: Semilla de la muestra al azar
+
+    Returns:
+        Diccionario miembro -> lista de mensajes en orden cronológico, con los
+        miembros en orden de aparición
+    """
+    kinds = df['kind'] if 'kind' in df.columns else classify_messages(df['message'])['kind']
+    text = (kinds == 'text').to_numpy()
+    codes, names = pd.factorize(df['sender'])
+    rows = np.flatnonzero(text & (codes >= 0))
+    codes = codes[rows]
+
+    key = -rows if recent else np.random.default_rng(seed).random(len(rows))
+    order = np.lexsort((key, codes))
+    sorted_codes = codes[order]
+    group_starts = np.searchsorted(sorted_codes, np.arange(len(names)))
+    keep = np.arange(len(order)) - group_starts[sorted_codes] < size
+    # De vuelta al orden del chat, agrupadas por miembro
+    chosen = np.sort(order[keep])
+    chosen = chosen[np.argsort(codes[chosen], kind='stable')]
+    chosen_codes = codes[chosen]
+    messages = df['message'].to_numpy()[rows[chosen]]
+
+    bounds = np.searchsorted(chosen_codes, np.arange(len(names) + 1))
+    samples = {name: messages[bounds[i]:bounds[i + 1]].tolist() for i, name in enumerate(names)}
+    if members is not None:
+        samples = {member: samples.get(member, []) for member in members}
+    return samples
+
+
+def style_prompt(messages):
+    """Prompt del sistema con los mensajes de ejemplo de un miembro"""
+    return STYLE_PROMPT.format(examples='\n'.join(f'- {message}' for message in messages))
+
+
+def _run_coroutine(coroutine):
+    """Ejecuta una corrutina y devuelve su resultado, también si ya hay un bucle en marcha (Jupyter)"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    result = {}
+
+    def target():
+        try:
+            result['value'] = asyncio.run(coroutine)
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+
+class OpenAIBackend:
+    """
+    API de chat completions de OpenAI, o de un servidor compatible en ``base_url``.
+
+    Las peticiones HTTP se hacen con ``urllib`` en un pool de hilos propio:
+    ``max_workers`` debe ser al menos la concurrencia del generador.
+    """
+
+    def __init__(self, model=OPENAI_MODEL, api_key=None, base_url=OPENAI_BASE_URL,
+                 timeout=GENERATION_TIMEOUT, max_workers=GENERATION_CONCURRENCY):
+        self.model = model
+        self.api_key = api_key or os.environ.get('OPENAI_API_KEY')
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cache_id = f'openai:{self.base_url}:{model}'
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='generation')
+
+    def _post(self, payload):
+        request = urllib.request.Request(
+            f'{self.base_url}/chat/completions',
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {self.api_key or ""}'}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                raw = response.read()
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode('utf-8', errors='replace')[:500]
+            if e.code in RETRYABLE_STATUS:
+                retry_after = e.headers.get('Retry-After')
+                try:
+                    retry_after = float(retry_after) if retry_after else None
+                except ValueError:
+                    retry_after = None
+                raise RetryableError(f'HTTP {e.code}: {detail}', retry_after)
+            raise GenerationError(f'HTTP {e.code}: {detail}')
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            raise RetryableError(f'Error de conexión: {e}')
+        try:
+            return json.loads(raw)['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise GenerationError(f"Respuesta inesperada de la API: {raw[:500].decode('utf-8', errors='replace')}")
+
+    async def complete(self, system, prompt, temperature=TEMPERATURE, max_tokens=MAX_TOKENS):
+        """Texto generado para un prompt del sistema y un mensaje del usuario"""
+        payload = {
+            'model': self.model,
+            'messages': [{'role': 'system', 'content': system}, {'role': 'user', 'content': prompt}],
+            'temperature': temperature,
+            'max_tokens': max_tokens
+        }
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._post, payload)
+
+
+def stub_reply(system, prompt):
+    """
+    Respuesta determinista del proveedor de pruebas.
+
+    Devuelve uno de los mensajes de ejemplo del prompt del sistema, elegido
+    según el prompt del usuario.
+    """
+    examples = [line[2:] for line in system.splitlines() if line.startswith('- ') and not line.startswith('- **')]
+    if not examples:
+        return prompt
+    digest = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest(), 16)
+    return examples[digest % len(examples)]
+
+
+class StubBackend:
+    """
+    Proveedor de pruebas en el propio proceso, sin red.
+
+    Tarda ``latency`` segundos en cada respuesta y falla con un error
+    transitorio en una proporción ``error_rate`` de las llamadas.
+    """
+
+    def __init__(self, latency=0.5, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.cache_id = 'stub'
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    async def complete(self, system, prompt, temperature=TEMPERATURE, max_tokens=MAX_TOKENS):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self._random.random() < self.error_rate:
+            raise RetryableError('Error simulado', retry_after=None)
+        return stub_reply(system, prompt)
+
+
+class StyleGenerator:
+    """
+    Genera mensajes con el estilo de cada miembro a partir de sus muestras.
+
+    Args:
+        backend: Proveedor con ``complete(system, prompt, temperature,
+            max_tokens)`` asíncrono y un ``cache_id``; lanza ``RetryableError``
+            en los errores que se pueden repetir
+        samples: Diccionario miembro -> mensajes de ejemplo (``sample_members``)
+        cache: ``ResultCache`` de las respuestas (None = sin caché)
+        concurrency: Peticiones en curso a la vez como máximo
+        max_retries: Reintentos de cada petición tras un error transitorio
+        backoff: Espera máxima antes del primer reintento; se duplica en cada
+            uno (con un valor al azar por debajo, para no reintentar todas a la vez)
+        max_backoff: Límite de la espera entre reintentos
+    """
+
+    def __init__(self, backend, samples, cache=None, concurrency=GENERATION_CONCURRENCY,
+                 max_retries=GENERATION_MAX_RETRIES, backoff=GENERATION_BACKOFF,
+                 max_backoff=GENERATION_MAX_BACKOFF, temperature=TEMPERATURE, max_tokens=MAX_TOKENS):
+        self.backend = backend
+        self.samples = samples
+        self.cache = cache
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self._system_prompts = {}
+        self.counts = {'requests': 0, 'cache_hits': 0, 'api_calls': 0, 'retries': 0, 'errors': 0}
+
+    def system_prompt(self, member):
+        """Prompt del sistema de un miembro (se construye una vez)"""
+        prompt = self._system_prompts.get(member)
+        if prompt is None:
+            if member not in self.samples:
+                raise KeyError(member)
+            prompt = self._system_prompts[member] = style_prompt(self.samples[member])
+        return prompt
+
+    def cache_key(self, member, prompt, max_tokens):
+        """Clave de la respuesta: proveedor y modelo, parámetros, muestra del miembro y prompt"""
+        source = [self.backend.cache_id, self.temperature, max_tokens, self.system_prompt(member), prompt]
+        return hashlib.sha256(json.dumps(source, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    async def _call(self, semaphore, system, prompt, max_tokens, result):
+        """Llama al proveedor repitiendo los errores transitorios; cuenta los intentos en ``result``"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    self.counts['api_calls'] += 1
+                    result['attempts'] += 1
+                    return await self.backend.complete(system, prompt, self.temperature, max_tokens)
+            except RetryableError as e:
+                if attempt == self.max_retries:
+                    raise
+                self.counts['retries'] += 1
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                if e.retry_after is not None:
+                    delay = max(delay, min(e.retry_after, self.max_backoff))
+                await asyncio.sleep(delay)
+
+    async def _generate_one(self, semaphore, member, prompt, key, max_tokens):
+        start = time.perf_counter()
+        result = {'member': member, 'prompt': prompt, 'text': None, 'error': None, 'cached': False, 'attempts': 0}
+        try:
+            result['text'] = await self._call(semaphore, self.system_prompt(member), prompt, max_tokens, result)
+            if self.cache is not None:
+                self.cache.put(key, result['text'])
+        except GenerationError as e:
+            self.counts['errors'] += 1
+            result['error'] = str(e)
+        result['seconds'] = round(time.perf_counter() - start, 3)
+        return result
+
+    async def generate(self, requests, max_tokens=None):
+        """
+        Genera las respuestas de una lista de peticiones (miembro, prompt).
+
+        Los miembros sin mensajes de texto de ejemplo no se envían: su
+        resultado lleva un error.
+
+        Returns:
+            Lista de diccionarios, en el orden de las peticiones, con member,
+            prompt, text (None si falló), error, cached, attempts y seconds
+
+        Raises:
+            KeyError: Si algún miembro no tiene muestra
+        """
+        max_tokens = max_tokens or self.max_tokens
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = {}
+        pending = []
+        results = []
+        for member, prompt in requests:
+            self.counts['requests'] += 1
+            if member not in self.samples:
+                raise KeyError(member)
+            if not self.samples[member]:
+                self.counts['errors'] += 1
+                results.append({'member': member, 'prompt': prompt, 'text': None,
+                                'error': 'El miembro no tiene mensajes de texto de ejemplo',
+                                'cached': False, 'attempts': 0, 'seconds': 0.0})
+                continue
+            key = self.cache_key(member, prompt, max_tokens)
+            text = self.cache.get(key) if self.cache is not None and key not in tasks else None
+            if text is not None:
+                self.counts['cache_hits'] += 1
+                results.append({'member': member, 'prompt': prompt, 'text': text, 'error': None,
+                                'cached': True, 'attempts': 0, 'seconds': 0.0})
+                continue
+            # Las peticiones idénticas de un mismo lote (misma muestra y prompt) comparten la llamada
+            if key not in tasks:
+                tasks[key] = asyncio.ensure_future(self._generate_one(semaphore, member, prompt, key, max_tokens))
+            results.append(None)
+            pending.append((len(results) - 1, key, member, prompt))
+        await asyncio.gather(*tasks.values())
+        # Cada resultado lleva el miembro y el prompt de su propia petición
+        for i, key, member, prompt in pending:
+            results[i] = {**tasks[key].result(), 'member': member, 'prompt': prompt}
+        return results
+
+    def run(self, requests, max_tokens=None):
+        """Versión síncrona de ``generate`` (también desde un notebook)"""
+        return _run_coroutine(self.generate(requests, max_tokens))
+
+    def stats(self):
+        return dict(self.counts)
+
+
+def default_cache():
+    """Caché en disco de las respuestas con la configuración del entorno"""
+    return ResultCache(GENERATION_CACHE_DIR, max_bytes=GENERATION_CACHE_MAX_BYTES)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Endpoint ``/chat/completions`` compatible con la API de OpenAI, con respuestas de ``stub_reply``"""
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self.send_error(404)
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            messages = {message['role']: message['content'] for message in payload['messages']}
+        except (ValueError, KeyError, TypeError):
+            self.send_error(400)
+            return
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            failed = self.server.random.random() < self.server.error_rate
+        if failed:
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        content = stub_reply(messages.get('system', ''), messages.get('user', ''))
+        body = json.dumps({
+            'object': 'chat.completion',
+            'model': payload.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}]
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        debug(f'[stub] {format % args}')
+
+
+def serve_stub(port=8000, host='127.0.0.1', latency=0.5, error_rate=0.0, seed=0):
+    """
+    Servidor local compatible con la API de chat completions, para pruebas sin conexión.
+
+    Devuelve el servidor sin arrancarlo: ``serve_forever()`` lo atiende y
+    ``shutdown()`` lo para. Con ``port=0`` se elige un puerto libre
+    (``server.server_address``). Se usa con ``OpenAIBackend(base_url=f'http://{host}:{port}/v1')``.
+    """
+    server = ThreadingHTTPServer((host, port), _StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.random = random.Random(seed)
+    server.lock = threading.Lock()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Genera mensajes imitando el estilo de cada miembro de un chat')
+    parser.add_argument('chat', nargs='?', help='Exportación del chat (.txt o .arrow)')
+    parser.add_argument('-p', '--prompt', action='append',
+                        help='Mensaje al que responde cada miembro (se puede repetir; por defecto, un mensaje típico)')
+    parser.add_argument('-m', '--members', action='append', help='Miembro a imitar (se puede repetir; por defecto, todos)')
+    parser.add_argument('--backend', choices=('openai', 'stub'), default='openai',
+                        help='Proveedor: la API (o un servidor compatible con --base-url) o respuestas locales')
+    parser.add_argument('--base-url', default=OPENAI_BASE_URL, help='URL de la API compatible con OpenAI')
+    parser.add_argument('--model', default=OPENAI_MODEL, help=f'Modelo (por defecto: {OPENAI_MODEL})')
+    parser.add_argument('-c', '--concurrency', type=int, default=GENERATION_CONCURRENCY,
+                        help=f'Peticiones a la vez (por defecto: {GENERATION_CONCURRENCY})')
+    parser.add_argument('--sample-size', type=int, default=SAMPLE_SIZE,
+                        help=f'Mensajes de ejemplo por miembro (por defecto: {SAMPLE_SIZE})')
+    parser.add_argument('--recent', action='store_true', help='Usar los últimos mensajes de cada miembro en lugar de una muestra al azar')
+    parser.add_argument('--max-tokens', type=int, default=MAX_TOKENS, help=f'Longitud máxima de cada respuesta (por defecto: {MAX_TOKENS})')
+    parser.add_argument('--no-cache', action='store_true', help='No leer ni guardar respuestas en la caché')
+    parser.add_argument('--serve-stub', type=int, metavar='PORT', help='Levantar el servidor de pruebas en este puerto')
+    parser.add_argument('--latency', type=float, default=0.5, help='Segundos de cada respuesta del proveedor de pruebas')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Proporción de errores transitorios del proveedor de pruebas')
+    args = parser.parse_args(argv)
+
+    if args.serve_stub is not None:
+        server = serve_stub(args.serve_stub, latency=args.latency, error_rate=args.error_rate)
+        host, port = server.server_address
+        print(f"Servidor de pruebas en http://{host}:{port}/v1 (Ctrl+C para parar)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+        return 0
+    if args.chat is None:
+        parser.error('falta el chat (o --serve-stub)')
+
+    # Importación local: el servidor de pruebas no necesita el parser
+    from chat_storage import load_or_parse
+    df = load_or_parse(args.chat, columns=['datetime', 'sender', 'message'])
+    if df is None:
+        print(f"No se pudo leer el chat {args.chat}")
+        return 1
+
+    samples = sample_members(df, args.sample_size, members=args.members, recent=args.recent)
+    if args.backend == 'stub':
+        backend = StubBackend(latency=args.latency, error_rate=args.error_rate)
+    else:
+        backend = OpenAIBackend(args.model, base_url=args.base_url, max_workers=args.concurrency)
+    generator = StyleGenerator(backend, samples, cache=None if args.no_cache else default_cache(),
+                               concurrency=args.concurrency, max_tokens=args.max_tokens)
+
+    prompts = args.prompt or [TYPICAL_MESSAGE_PROMPT]
+    start = time.perf_counter()
+    results = generator.run([(member, prompt) for prompt in prompts for member in samples])
+    seconds = time.perf_counter() - start
+
+    for result in results:
+        print(f"\n👤 {result['member']} · {result['prompt']}")
+        if result['error']:
+            print(f"❌ Error: {result['error']}")
+        else:
+            print(f"💭 {result['text']}{' (caché)' if result['cached'] else ''}")
+    stats = generator.stats()
+    print(f"\n✅ {stats['requests']} peticiones en {seconds:.2f}s: {stats['cache_hits']} de la caché, "
+          f"{stats['api_calls']} llamadas, {stats['retries']} reintentos, {stats['errors']} errores")
+    return 0 if not stats['errors'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
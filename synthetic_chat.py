@@ -0,0 +1,284 @@
+"""
+Generador de exportaciones sintéticas de WhatsApp.
+
+Uso:
+    python synthetic_chat.py chat.txt --messages 100000 [--format iphone] [--language en]
+
+Produce archivos con la misma gramática que las exportaciones reales de
+iPhone y Android (los formatos de ``chat_parser.FORMATS``), para medir el
+analizador sin usar chats privados. Se puede ajustar el número de mensajes y
+de miembros, la proporción de mensajes de varias líneas y de multimedia, la
+densidad de emojis y el idioma. Con la misma semilla se genera siempre el
+mismo archivo.
+
+Los mensajes se reparten entre los días del periodo con más actividad por la
+tarde y la noche; los miembros y las palabras siguen una distribución de
+Zipf, como en los chats reales (pocos miembros y palabras concentran la
+mayoría de los mensajes).
+"""
+import argparse
+import datetime as dt
+import sys
+
+import numpy as np
+
+from chat_parser import FORMATS, get_format
+
+# Mensajes que se generan y escriben de una vez
+CHUNK_MESSAGES = 100_000
+
+# Peso relativo de cada hora del día (0-23)
+HOUR_WEIGHTS = np.array([2, 1, 0.5, 0.3, 0.2, 0.3, 1, 3, 5, 6, 7, 7,
+                         8, 8, 7, 7, 7, 8, 9, 10, 11, 10, 7, 4])
+
+EMOJIS = ['😂', '❤️', '👍', '😍', '🙏', '😊', '🎉', '😅', '🔥', '😭', '🤣', '👏']
+
+LANGUAGES = {
+    'es': {
+        'words': ('que de no a la el y en lo es me si por un una con se te los qué pero ya para '
+                  'bueno vale jaja jajaja hoy mañana casa tío tía gracias hola sí bien mal todo '
+                  'nada quedamos luego ahora vamos mira oye foto fiesta cena comida trabajo '
+                  'cumpleaños finde semana noche tarde día hora verdad claro genial perfecto '
+                  'venga besos abrazo tranquilo madre padre fútbol partido película playa coche '
+                  'tren llego tarde ahí dónde cuándo cómo porque siempre nunca también mucho poco').split(),
+        'names': ['Ana', 'Carlos', 'Lucía', 'Javier', 'María', 'Pablo', 'Sofía', 'Diego', 'Carmen',
+                  'Miguel', 'Laura', 'Alejandro', 'Elena', 'David', 'Marta', 'Sergio'],
+        'surnames': ['García', 'López', 'Martínez', 'Sánchez', 'Pérez', 'Gómez', 'Ruiz', 'Díaz'],
+        'media': {'android': '<Multimedia omitido>', 'iphone': 'Media omitted'},
+        'ampm': ('a. m.', 'p. m.'),
+        'system': 'Los mensajes y las llamadas están cifrados de extremo a extremo.',
+        'day_first': True
+    },
+    'en': {
+        'words': ('the to and a of i you it is in that for on my me we be have not but so just '
+                  'lol haha ok okay yes no good great thanks hi hey home tomorrow today tonight '
+                  'dinner lunch work party birthday weekend week night morning time really sure '
+                  'awesome perfect love miss see soon later now where when how why always never '
+                  'also much little mom dad game movie beach car train late there photo coffee '
+                  'call text meet going come back what who this with from about').split(),
+        'names': ['James', 'Emma', 'Oliver', 'Olivia', 'Jack', 'Sophie', 'Harry', 'Amelia', 'Noah',
+                  'Isla', 'George', 'Mia', 'Leo', 'Grace', 'Charlie', 'Lily'],
+        'surnames': ['Smith', 'Jones', 'Taylor', 'Brown', 'Wilson', 'Evans', 'Davies', 'Walker'],
+        'media': {'android': '<Multimedia omitido>', 'iphone': 'Media omitted'},
+        'ampm': ('AM', 'PM'),
+        'system': 'Messages and calls are end-to-end encrypted.',
+        'day_first': False
+    }
+}
+
+# Primer día por defecto: con el día mayor que 12 el orden día/mes se detecta desde la primera línea
+DEFAULT_START = '2019-01-15'
+
+# Marca invisible con la que iPhone empieza las líneas de multimedia
+IPHONE_MEDIA_PREFIX = '\u200e'
+
+
+def _zipf_weights(count, exponent=1.0):
+    """Probabilidades de una distribución de Zipf sobre ``count`` elementos"""
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def member_names(count, language='es'):
+    """Nombres únicos de miembros (nombre y apellido)"""
+    table = LANGUAGES[language]
+    names = [f'{name} {surname}' for surname in table['surnames'] for name in table['names']]
+    if count > len(names):
+        names += [f'{names[i % len(names)]} {i // len(names) + 1}' for i in range(len(names), count)]
+    return names[:count]
+
+
+def _timestamps(rng, messages, days):
+    """Segundos desde el primer día de cada mensaje, en orden"""
+    day = rng.integers(0, days, size=messages)
+    hour = rng.choice(24, size=messages, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    seconds = day * 86_400 + hour * 3_600 + rng.integers(0, 3_600, size=messages)
+    seconds.sort()
+    return seconds
+
+
+class _LineFormatter:
+    """Escribe la fecha y la hora de cada línea con la gramática de un formato"""
+
+    def __init__(self, chat_format, language, start, long_year):
+        table = LANGUAGES[language]
+        self.chat_format = chat_format
+        self.ampm_suffixes = table['ampm']
+        self.day_first = table['day_first']
+        self.long_year = long_year
+        self.start = start
+        self._dates = {}
+
+    def date(self, day):
+        text = self._dates.get(day)
+        if text is None:
+            date = self.start + dt.timedelta(days=day)
+            year = date.year if self.long_year else f'{date.year % 100:02d}'
+            if self.day_first:
+                text = f'{date.day:02d}/{date.month:02d}/{year}'
+            else:
+                text = f'{date.month}/{date.day}/{year}'
+            self._dates[day] = text
+        return text
+
+    def time(self, seconds):
+        hour, rest = divmod(seconds, 3_600)
+        minute, second = divmod(rest, 60)
+        if self.chat_format.ampm:
+            text = f'{hour % 12 or 12}:{minute:02d}'
+        else:
+            text = f'{hour:02d}:{minute:02d}'
+        if self.chat_format.seconds:
+            text += f':{second:02d}'
+        if self.chat_format.ampm:
+            text += ' ' + self.ampm_suffixes[hour >= 12]
+        return text
+
+    def header(self, seconds):
+        """Principio de la línea, hasta el remitente"""
+        day, rest = divmod(int(seconds), 86_400)
+        if self.chat_format.device_type == 'iphone':
+            return f'[{self.date(day)}, {self.time(rest)}] '
+        return f'{self.date(day)}, {self.time(rest)} - '
+
+
+def generate_chat(out, messages=10_000, members=8, chat_format='android', language='es',
+                  multiline_ratio=0.05, media_ratio=0.08, emoji_density=0.05, days=None,
+                  start=DEFAULT_START, long_year=False, seed=0):
+    """
+    Escribe una exportación sintética en un archivo de texto abierto.
+
+    Args:
+        out: Objeto tipo archivo en modo texto
+        messages: Número de mensajes
+        members: Número de miembros del grupo
+        chat_format: Nombre de un formato de ``chat_parser.FORMATS``
+        language: 'es' o 'en' (palabras, nombres, sufijos AM/PM y orden de la fecha)
+        multiline_ratio: Proporción de mensajes de texto con más de una línea
+        media_ratio: Proporción de mensajes de multimedia omitida
+        emoji_density: Probabilidad de que cada palabra vaya seguida de un emoji
+        days: Días que abarca el chat (por defecto, unos 150 mensajes al día)
+        start: Fecha del primer día (AAAA-MM-DD)
+        long_year: Escribir el año con 4 dígitos
+        seed: Semilla del generador aleatorio
+
+    Returns:
+        Diccionario con los parámetros usados y el número de líneas escritas
+    """
+    chat_format = get_format(chat_format)
+    if chat_format is None:
+        raise ValueError(f"Formato no válido; use uno de: {', '.join(f.name for f in FORMATS)}")
+    if language not in LANGUAGES:
+        raise ValueError(f"Idioma no válido; use uno de: {', '.join(LANGUAGES)}")
+    table = LANGUAGES[language]
+    if days is None:
+        days = min(max(messages // 150, 30), 3650)
+
+    rng = np.random.default_rng(seed)
+    formatter = _LineFormatter(chat_format, language, dt.date.fromisoformat(start), long_year)
+    names = member_names(members, language)
+    words = table['words']
+    word_weights = _zipf_weights(len(words))
+    media = table['media'][chat_format.device_type]
+    if chat_format.device_type == 'iphone':
+        media_prefix, media = IPHONE_MEDIA_PREFIX, IPHONE_MEDIA_PREFIX + media
+    else:
+        media_prefix = ''
+
+    seconds = _timestamps(rng, messages, days)
+    lines = 0
+    if chat_format.device_type == 'android' and messages:
+        # Mensaje del sistema al principio, como en las exportaciones reales
+        out.write(f"{formatter.header(seconds[0])}{table['system']}\n")
+        lines += 1
+
+    for chunk_start in range(0, messages, CHUNK_MESSAGES):
+        chunk_seconds = seconds[chunk_start:chunk_start + CHUNK_MESSAGES]
+        size = len(chunk_seconds)
+        senders = rng.choice(members, size=size, p=_zipf_weights(members, 0.8))
+        is_media = rng.random(size) < media_ratio
+        is_multiline = rng.random(size) < multiline_ratio
+        lengths = np.clip(rng.geometric(1 / 7, size=size), 1, 60)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        tokens = [words[i] for i in rng.choice(len(words), size=int(offsets[-1]), p=word_weights)]
+        for i in np.flatnonzero(rng.random(len(tokens)) < emoji_density).tolist():
+            tokens[i] += ' ' + EMOJIS[i % len(EMOJIS)]
+        breaks = rng.integers(0, lengths)
+
+        buffer = []
+        for i in range(size):
+            header = formatter.header(chunk_seconds[i])
+            if is_media[i]:
+                buffer.append(f'{media_prefix}{header}{names[senders[i]]}: {media}\n')
+                lines += 1
+                continue
+            begin, end = offsets[i], offsets[i + 1]
+            if is_multiline[i] and breaks[i] > 0:
+                split = begin + breaks[i]
+                text = ' '.join(tokens[begin:split]) + '\n' + ' '.join(tokens[split:end])
+                lines += 2
+            else:
+                text = ' '.join(tokens[begin:end])
+                lines += 1
+            buffer.append(f'{header}{names[senders[i]]}: {text}\n')
+        out.write(''.join(buffer))
+
+    return {
+        'messages': messages,
+        'members': members,
+        'format': chat_format.name,
+        'language': language,
+        'multiline_ratio': multiline_ratio,
+        'media_ratio': media_ratio,
+        'emoji_density': emoji_density,
+        'days': days,
+        'seed': seed,
+        'lines': lines
+    }
+
+
+def parse_count(text):
+    """Convierte '10k', '1M' o '2500' en un número entero"""
+    text = text.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    if multiplier > 1:
+        text = text[:-1]
+    try:
+        return int(float(text) * multiplier)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Número no válido: {text}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Genera una exportación sintética de WhatsApp')
+    parser.add_argument('output', help="Archivo de salida ('-' para la salida estándar)")
+    parser.add_argument('-n', '--messages', type=parse_count, default=10_000, help='Mensajes (admite 10k, 1M...)')
+    parser.add_argument('-m', '--members', type=int, default=8, help='Miembros del grupo (por defecto: 8)')
+    parser.add_argument('-f', '--format', default='android', choices=[f.name for f in FORMATS],
+                        help='Formato de exportación (por defecto: android)')
+    parser.add_argument('-l', '--language', default='es', choices=list(LANGUAGES), help='Idioma (por defecto: es)')
+    parser.add_argument('--multiline', type=float, default=0.05, help='Proporción de mensajes de varias líneas')
+    parser.add_argument('--media', type=float, default=0.08, help='Proporción de mensajes multimedia')
+    parser.add_argument('--emoji', type=float, default=0.05, help='Probabilidad de emoji tras cada palabra')
+    parser.add_argument('--days', type=int, help='Días que abarca el chat')
+    parser.add_argument('--start', default=DEFAULT_START, help=f'Primer día (por defecto: {DEFAULT_START})')
+    parser.add_argument('--long-year', action='store_true', help='Año con 4 dígitos')
+    parser.add_argument('--seed', type=int, default=0, help='Semilla aleatoria (por defecto: 0)')
+    args = parser.parse_args(argv)
+
+    options = dict(messages=args.messages, members=args.members, chat_format=args.format,
+                   language=args.language, multiline_ratio=args.multiline, media_ratio=args.media,
+                   emoji_density=args.emoji, days=args.days, start=args.start,
+                   long_year=args.long_year, seed=args.seed)
+    if args.output == '-':
+        info = generate_chat(sys.stdout, **options)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            info = generate_chat(f, **options)
+    print(f"Generados {info['messages']} mensajes ({info['lines']} líneas, formato {info['format']})",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Decodificación vectorizada de las fechas y horas de WhatsApp.
+
+Las fechas (``d/m/aa``, ``dd/mm/aaaa``...) y horas (``H:MM``, ``HH:MM:SS``,
+con o sin ``AM``/``PM`` o ``a. m.``/``p. m.``) que captura el patrón de línea
+tienen un formato fijo, así que no hace falta ``strptime``: los textos se
+copian a una matriz de caracteres de numpy y los campos numéricos se leen
+columna a columna, en unas pocas operaciones sobre todo el lote. El resultado
+son nanosegundos desde 1970 en int64.
+
+Las filas con valores imposibles (mes 13, 31 de abril, hora 25...) no hacen
+fallar el lote: se marcan como no válidas para que el parser las informe.
+"""
+import numpy as np
+
+# Anchura máxima de los textos de fecha y hora
+DATE_WIDTH = 10
+TIME_WIDTH = 16
+
+NS_PER_SECOND = 1_000_000_000
+NS_PER_DAY = 86_400 * NS_PER_SECOND
+
+# Valor int64 de NaT
+NAT = np.iinfo(np.int64).min
+
+# Días de cada mes en un año no bisiesto (índice 1-12)
+_DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int64)
+
+_ZERO = ord('0')
+
+
+def _char_matrix(values, width):
+    """Copia los textos a una matriz (filas, anchura) con el código de cada carácter"""
+    array = np.array(values, dtype=f'U{width}')
+    return array.view(np.uint32).reshape(len(array), width)
+
+
+def _read_fields(chars, separator, count):
+    """
+    Lee los números separados por ``separator`` del principio de cada fila.
+
+    La lectura de cada fila termina en el primer carácter que no es dígito ni
+    separador. Se recorre la matriz por columnas (una operación por columna
+    para todas las filas) y se para en cuanto ninguna fila sigue leyendo.
+
+    Returns:
+        Tupla (números, dígitos): matrices (filas, count) con el valor de cada
+        campo y los dígitos leídos en él (0 si el campo falta)
+    """
+    rows = len(chars)
+    values = np.zeros((count, rows), dtype=np.int32)
+    digits = np.zeros((count, rows), dtype=np.int8)
+    field = np.zeros(rows, dtype=np.int8)
+    reading = np.ones(rows, dtype=bool)
+
+    for char in np.ascontiguousarray(chars.T).astype(np.int32):
+        digit = char - _ZERO
+        is_digit = reading & (digit >= 0) & (digit <= 9)
+        is_separator = reading & (char == ord(separator))
+        reading = is_digit | is_separator
+        if not reading.any():
+            break
+        for index in range(count):
+            in_field = is_digit & (field == index)
+            np.copyto(values[index], values[index] * 10 + digit, where=in_field)
+            digits[index] += in_field
+        field += is_separator
+    return values.T.astype(np.int64), digits.T
+
+
+def _days_from_civil(year, month, day):
+    """Días desde el 1970-01-01 de una fecha del calendario gregoriano (vectorizado)"""
+    year = year - (month <= 2)
+    era = np.floor_divide(year, 400)
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def decode_dates(dates, day_first=True):
+    """
+    Decodifica fechas ``d/m/a`` a días desde 1970.
+
+    Los años de 2 dígitos siguen el criterio de ``strptime('%y')``: 69-99 son
+    del siglo XX y 00-68 del XXI. Los dígitos de cada campo se cuentan en cada
+    fila, así que sirve igual para ``d/m/aa`` que para ``dd/mm/aaaa``.
+
+    Returns:
+        Tupla (días int64, máscara de filas válidas)
+    """
+    fields, digits = _read_fields(_char_matrix(dates, DATE_WIDTH), '/', 3)
+    first, second, year = fields.T
+    day, month = (first, second) if day_first else (second, first)
+    year = np.where(digits[:, 2] <= 2, np.where(year < 69, year + 2000, year + 1900), year)
+
+    # Fuera del rango de datetime64[ns] (1677-2262) no se puede representar
+    valid = ((digits > 0).all(axis=1) & (digits[:, :2] <= 2).all(axis=1) & (digits[:, 2] <= 4)
+             & (month >= 1) & (month <= 12) & (day >= 1) & (year >= 1678) & (year <= 2261))
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = _DAYS_IN_MONTH[np.clip(month, 0, 12)] + (leap & (month == 2))
+    valid &= day <= month_days
+    return _days_from_civil(year, month, day), valid
+
+
+def decode_times(times, ampm=False):
+    """
+    Decodifica horas ``H:MM[:SS]`` (con AM/PM si ``ampm``) a nanosegundos desde medianoche.
+
+    Returns:
+        Tupla (nanosegundos int64, máscara de filas válidas)
+    """
+    chars = _char_matrix(times, TIME_WIDTH)
+    fields, digits = _read_fields(chars, ':', 3)
+    hour, minute, second = fields.T
+
+    valid = ((digits[:, 0] > 0) & (digits[:, 0] <= 2) & (digits[:, 1] == 2) & (digits[:, 2] != 1)
+             & (digits[:, 2] <= 2) & (minute <= 59) & (second <= 59))
+    if ampm:
+        # La primera letra del sufijo indica la mitad del día ("p. m.", "PM"...)
+        pm = ((chars == ord('p')) | (chars == ord('P'))).any(axis=1)
+        am = ((chars == ord('a')) | (chars == ord('A'))).any(axis=1)
+        valid &= (pm | am) & (hour >= 1) & (hour <= 12)
+        hour = hour % 12 + np.where(pm, 12, 0)
+    else:
+        valid &= hour <= 23
+    return (hour * 3600 + minute * 60 + second) * NS_PER_SECOND, valid
+
+
+def decode_timestamps(dates, times, day_first=True, ampm=False):
+    """
+    Convierte los textos de fecha y hora de cada mensaje a nanosegundos desde 1970.
+
+    Args:
+        dates: Secuencia de fechas en texto
+        times: Secuencia de horas en texto
+        day_first: Si la fecha va como día/mes (si no, mes/día)
+        ampm: Si la hora es de 12 horas con sufijo AM/PM
+
+    Returns:
+        Tupla (array int64 con NaT en las filas no válidas, máscara de filas válidas)
+    """
+    if len(dates) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+    days, valid_dates = decode_dates(dates, day_first)
+    nanoseconds, valid_times = decode_times(times, ampm)
+    valid = valid_dates & valid_times
+    return np.where(valid, days * NS_PER_DAY + nanoseconds, NAT), valid
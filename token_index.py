@@ -0,0 +1,171 @@
+"""
+Tokenización de mensajes e índice de palabras por miembro.
+
+Los mensajes de un chat se tokenizan una sola vez al subirlo; las palabras
+más frecuentes, la nube de palabras del grupo y las de cada miembro se
+sirven después desde el índice, sin volver a recorrer los mensajes.
+
+Las stopwords en español se leen de un archivo local (por defecto la lista de
+NLTK/Snowball incluida en ``data/``), nunca de la red.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+
+import pandas as pd
+
+# Lista de stopwords en español incluida en el repositorio (la de NLTK, una palabra por línea)
+BUNDLED_STOPWORDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'stopwords_spanish.txt')
+# Archivo de stopwords a usar; se puede apuntar a otra lista local con el mismo formato
+STOPWORDS_PATH = os.environ.get('STOPWORDS_PATH', BUNDLED_STOPWORDS)
+
+# Definir conjunto global de palabras a excluir
+EXCLUDED_WORDS = {
+    'todo', 'porque', 'tiene', 'multimedia', 'omitido', 
+    '<multimedia', 'omitido>', 'imagen', 'video', 'audio', 
+    'sticker', 'gif', 'documento', 'eliminado', 'omitted',
+    'image', 'para', 'pero', 'este', 'esta', 'esto', 'como',
+    'cuando', 'donde', 'media', '<image', 'media', 'omitted',
+    'ahora', 'algo', 'aquí', 'así', 'aunque', 'bien', 'cada',
+    'casi', 'como', 'cual', 'debe', 'desde', 'después',
+    'dice', 'dijo', 'donde', 'entonces', 'entre', 'está',
+    'están', 'había', 'hace', 'hasta', 'hola', 'luego',
+    'mejor', 'menos', 'mismo', 'mucho', 'nada', 'otro',
+    'pues', 'quién', 'sabe', 'sido', 'sine', 'sino',
+    'sobre', 'solo', 'también', 'tanto', 'tengo', 'todas',
+    'todos', 'vamos', 'vaya', 'verdad', 'puede', 'pudo',
+    'quiere', 'sería', 'hacer', 'hecho', 'siendo', 'tenía',
+    'través', 'primera', 'según', 'ningún', 'manera', 'misma',
+    'image>', 'omitted>', 'attached:', 'image', 'attached','porq','bueno','gente','creo','cosa','siempre','claro','año','cierto','cómo','gran','toda','años','decir','dicho','tiempo','parece'
+}
+
+# Conjunto de stopwords + palabras excluidas, construido una sola vez
+_stop_words = None
+_stop_words_lock = threading.Lock()
+
+def load_stopwords(path=STOPWORDS_PATH):
+    """Lee una lista de stopwords (una por línea) de un archivo local"""
+    with open(path, encoding='utf-8') as f:
+        return frozenset(line.strip() for line in f if line.strip())
+
+def get_stop_words():
+    """Devuelve el conjunto congelado de stopwords en español y palabras excluidas"""
+    global _stop_words
+    if _stop_words is None:
+        with _stop_words_lock:
+            if _stop_words is None:
+                _stop_words = load_stopwords() | frozenset(EXCLUDED_WORDS)
+    return _stop_words
+
+def split_words(messages):
+    """
+    Pasa los mensajes a minúsculas y los separa en palabras por los espacios.
+
+    Es la normalización común del índice de palabras y del de búsqueda.
+
+    Args:
+        messages: Serie o lista de mensajes de texto
+
+    Returns:
+        Serie con una fila por palabra, indexada por la fila del mensaje de origen
+    """
+    return pd.Series(messages, dtype=object).str.lower().str.split().explode().dropna()
+
+def tokenize_messages(messages):
+    """
+    Tokeniza y filtra las palabras de una serie de mensajes de forma vectorizada.
+    
+    Args:
+        messages: Serie o lista de mensajes de texto
+        
+    Returns:
+        Serie de palabras filtradas, indexada por la fila del mensaje de origen
+    """
+    stop_words = get_stop_words()
+    
+    # Una fila por palabra, conservando el índice del mensaje
+    words = split_words(messages)
+    
+    # Los criterios se evalúan sobre el vocabulario (palabras distintas), no sobre cada aparición
+    vocabulary = pd.Series(words.unique(), dtype=object)
+    keep = (~vocabulary.isin(stop_words)
+            & (vocabulary.str.len() > 3)
+            & ~vocabulary.str.startswith('http')
+            & ~vocabulary.str.startswith('<')
+            & ~vocabulary.str.endswith('>')
+            & ~vocabulary.str.contains(r'\d'))
+    return words[words.isin(vocabulary[keep])]
+
+
+class TokenIndex:
+    """
+    Frecuencias de palabras de un chat, por miembro y para el grupo completo.
+
+    Se construye una vez por chat con ``from_dataframe``; solo se tienen en
+    cuenta los mensajes de texto (no la multimedia, los eliminados ni los
+    avisos del sistema).
+    """
+
+    def __init__(self, member_frequencies, group_frequencies=None):
+        self.member_frequencies = member_frequencies
+        if group_frequencies is None:
+            group_frequencies = Counter()
+            for frequencies in member_frequencies.values():
+                group_frequencies.update(frequencies)
+        self.group_frequencies = group_frequencies
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Tokeniza los mensajes de texto del chat y cuenta las palabras por miembro"""
+        words = tokenize_messages(df.loc[df['kind'] == 'text', 'message'])
+        counts = (
+            pd.DataFrame({'sender': df.loc[words.index, 'sender'].to_numpy(), 'word': words.to_numpy()})
+            .groupby(['sender', 'word'], sort=False)
+            .size()
+        )
+        # El orden de inserción (primera aparición) desempata como Counter.most_common
+        member_frequencies = {}
+        for (sender, word), count in zip(counts.index.tolist(), counts.tolist()):
+            member_frequencies.setdefault(sender, Counter())[word] = count
+        return cls(member_frequencies)
+
+    def merged(self, other):
+        """
+        Devuelve un índice nuevo con las frecuencias de ``self`` y ``other`` sumadas.
+
+        Solo se copian los contadores de los miembros que aparecen en ``other``;
+        el resto se comparten con ``self``, que no se modifica.
+        """
+        member_frequencies = dict(self.member_frequencies)
+        for member, frequencies in other.member_frequencies.items():
+            merged = Counter(member_frequencies.get(member, Counter()))
+            merged.update(frequencies)
+            member_frequencies[member] = merged
+        group_frequencies = Counter(self.group_frequencies)
+        group_frequencies.update(other.group_frequencies)
+        return TokenIndex(member_frequencies, group_frequencies)
+
+    @property
+    def nbytes(self):
+        """
+        Memoria aproximada del índice: las tablas de los contadores y las palabras.
+
+        Cada palabra se cuenta una vez (los contadores de los miembros comparten
+        las cadenas con el del grupo); los enteros hasta 256 los comparte Python.
+        """
+        counters = [self.group_frequencies, *self.member_frequencies.values()]
+        size = sum(sys.getsizeof(counter) for counter in counters)
+        size += sum(sys.getsizeof(word) for word in self.group_frequencies)
+        size += sum(sys.getsizeof(count) for counter in counters for count in counter.values() if count > 256)
+        return size
+
+    def frequencies(self, member=None):
+        """Frecuencias de palabras de un miembro, o del grupo si no se indica"""
+        if member is None:
+            return self.group_frequencies
+        return self.member_frequencies.get(member, Counter())
+
+    def top_words(self, member, n=3):
+        """Palabras más frecuentes de un miembro como lista de tuplas (palabra, veces)"""
+        return self.frequencies(member).most_common(n)
@@ -0,0 +1,128 @@
+"""
+Recepción de archivos subidos: límites de tamaño y exportaciones en ZIP.
+
+Cada subida reserva sus bytes en un presupuesto global (``ByteBudget``) desde
+que se recibe hasta que termina su análisis; si no caben, se rechaza enseguida
+en lugar de dejar que varias subidas enormes a la vez agoten la memoria del
+worker.
+
+La opción "Exportar chat con archivos" de WhatsApp genera un ZIP con el chat
+en texto (``_chat.txt`` en iPhone, ``WhatsApp Chat with ....txt`` en Android)
+y los archivos multimedia. Del ZIP solo se descomprime el chat, por bloques y
+con el mismo límite de tamaño que una subida; los archivos multimedia no se
+extraen.
+"""
+import os
+import threading
+import zipfile
+
+# Primeros bytes de un archivo ZIP
+ZIP_MAGIC = b'PK\x03\x04'
+
+# Nombres del chat dentro del ZIP, en orden de preferencia
+CHAT_MEMBER_NAMES = ('_chat.txt',)
+CHAT_MEMBER_PREFIXES = ('whatsapp chat', 'chat de whatsapp', 'conversa do whatsapp')
+
+COPY_CHUNK_SIZE = 1 << 20
+
+
+class UploadTooLarge(Exception):
+    """La subida (o el chat que contiene) supera el tamaño máximo"""
+
+
+class ByteBudget:
+    """
+    Bytes de las subidas en curso, con un máximo global.
+
+    ``reserve`` no espera: devuelve False si los bytes no caben, para que la
+    petición se rechace y el cliente la repita más tarde.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, size):
+        with self._lock:
+            if self.in_use + size > self.max_bytes:
+                self.rejected += 1
+                return False
+            self.in_use += size
+            return True
+
+    def release(self, size):
+        with self._lock:
+            self.in_use = max(self.in_use - size, 0)
+
+    def stats(self):
+        with self._lock:
+            return {'in_use': self.in_use, 'max_bytes': self.max_bytes, 'rejected': self.rejected}
+
+
+def is_zip(stream):
+    """Indica si un objeto tipo archivo binario es un ZIP (y lo rebobina)"""
+    head = stream.read(len(ZIP_MAGIC))
+    stream.seek(0)
+    return head == ZIP_MAGIC
+
+
+def find_chat_member(archive):
+    """
+    Busca el chat en texto dentro de un ZIP exportado por WhatsApp.
+
+    Returns:
+        ZipInfo del chat, o None si el ZIP no tiene ningún archivo .txt
+    """
+    texts = [info for info in archive.infolist()
+             if not info.is_dir() and info.filename.lower().endswith('.txt')]
+    for info in texts:
+        if os.path.basename(info.filename) in CHAT_MEMBER_NAMES:
+            return info
+    for info in texts:
+        if os.path.basename(info.filename).lower().startswith(CHAT_MEMBER_PREFIXES):
+            return info
+    # Otro nombre (exportación renombrada): el texto más grande
+    return max(texts, key=lambda info: info.file_size, default=None)
+
+
+def extract_chat(stream, dest, max_bytes):
+    """
+    Copia a ``dest`` el chat de un ZIP, descomprimiéndolo por bloques.
+
+    Args:
+        stream: ZIP subido (objeto tipo archivo binario con ``seek``)
+        dest: Archivo binario abierto donde se escribe el chat
+        max_bytes: Tamaño máximo del chat descomprimido
+
+    Returns:
+        Nombre del chat dentro del ZIP
+
+    Raises:
+        ValueError: Si el ZIP no es válido o no contiene ningún chat
+        UploadTooLarge: Si el chat descomprimido supera ``max_bytes``
+    """
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        raise ValueError("El archivo ZIP no es válido")
+    with archive:
+        info = find_chat_member(archive)
+        if info is None:
+            raise ValueError("El ZIP no contiene ningún chat (.txt)")
+        if info.file_size > max_bytes:
+            raise UploadTooLarge(info.file_size)
+        # El tamaño declarado puede ser falso: se vuelve a comprobar al descomprimir
+        written = 0
+        with archive.open(info) as source:
+            while True:
+                chunk = source.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(written)
+                dest.write(chunk)
+        return info.filename
+